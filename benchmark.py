@@ -0,0 +1,444 @@
+"""Frame-time benchmark suite for the labs.
+
+    python benchmark.py --frames 100 --out results.json
+    python benchmark.py lab4 lab7 --compare results.json
+    python benchmark.py --stress cube --counts 100 1000 10000 100000
+    python benchmark.py --experiment original shader instanced --cubes 100 --out lab7.csv
+
+Every case drives one render function for a fixed number of frames with
+deterministic input and records the wall-clock time of each frame; on the
+CPU-only machines this is meant for, that is the CPU cost of the frame.
+GL cases run in a headless context (see headless.py) and are reported as
+skipped when no context can be created. --stress scales the instance count
+of instancing.py and sets it against the one-object-at-a-time loop.
+--experiment runs lab7's render variants as an interleaved lab7.Experiment
+and writes its report instead.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import headless
+
+
+def case_lab_scene(scene, **options):
+    def setup(width, height):
+        return headless.SCENE_SETUP[scene](width, height, capture=False, **options)
+    return setup
+
+
+def case_lab4_fill(vertices=256, seed=0, batch=1, threads=None):
+    def setup(width, height):
+        import lab4
+        import tiled_raster
+        rng = np.random.default_rng(seed)
+        polygons = [lab4.random_polygon(vertices, width, height, rng, star=False) for _ in range(8 * batch)]
+        buffer = lab4.FrameBuffer(width, height)
+        color = buffer.color(lab4.fill_color)
+        # Left running: benchmark runs are short-lived processes.
+        rasterizer = tiled_raster.TiledRasterizer(threads) if threads is not None else None
+
+        def render(frame):
+            buffer.clear()
+            start = frame % 8 * batch
+            if rasterizer is not None:
+                rasterizer.fill_polygons(buffer.pixels, polygons[start:start + batch], color)
+            else:
+                for points in polygons[start:start + batch]:
+                    lab4.rasterize_polygon(points, buffer.pixels, color)
+        return render
+    return setup
+
+
+def case_lab4_lines(segments=2000, seed=0):
+    def setup(width, height):
+        import lab4
+        rng = np.random.default_rng(seed)
+        lines = rng.integers(0, (width, height, width, height), (segments, 4))
+        buffer = lab4.FrameBuffer(width, height)
+        color = buffer.color(lab4.outline_color)
+
+        def render(frame):
+            lab4.draw_lines(buffer.pixels, lines, color)
+        return render
+    return setup
+
+
+def case_lab4_filter(seed=0):
+    def setup(width, height):
+        import lab4
+        buffer = lab4.FrameBuffer(width, height)
+        buffer.pixels[...] = np.random.default_rng(seed).integers(0, 256, buffer.pixels.shape)
+
+        def render(frame):
+            buffer.filter(lab4.WEIGHTED_AVERAGE_KERNEL)
+        return render
+    return setup
+
+
+def case_lab5_clip(segments=10000, seed=0, batch=False, engine="cohen-sutherland"):
+    def setup(width, height):
+        import lab5
+        array = lab5.random_segments(segments, seed)
+        items = array.tolist()
+
+        def render(frame):
+            if batch:
+                lab5.clip_segments_batch(array, engine)
+            else:
+                lab5.clip_segments(items, engine)
+        return render
+    return setup
+
+
+def case_software(scene, **options):
+    def setup(width, height):
+        import software_renderer
+        renderer = software_renderer.SoftwareRenderer(width, height)
+        return (software_renderer.SCENES.get(scene) or software_renderer.setup_triangles)(renderer, **options)
+    return setup
+
+
+def case_texture_load(size, upload=True):
+    def setup(width, height):
+        import tempfile
+        import textures
+        directory = tempfile.TemporaryDirectory()
+        path = f"{directory.name}/tex_{size}.bmp"
+        textures.write_test_texture(path, size)
+
+        def render(frame):
+            if not upload:
+                textures.decode_image(path)
+                return
+            from OpenGL.GL import glDeleteTextures, glFinish
+            tex_id = textures.load_texture(path)
+            glFinish()
+            glDeleteTextures(1, [tex_id])
+        # Removed once the case is done with it.
+        render.directory = directory
+        return render
+    return setup
+
+
+def case_mip_cache(size, warm=True, compress=False):
+    def setup(width, height):
+        import shutil
+        import tempfile
+        import textures
+        directory = tempfile.TemporaryDirectory()
+        path = f"{directory.name}/tex_{size}.bmp"
+        cache_dir = f"{directory.name}/cache"
+        textures.write_test_texture(path, size)
+        if warm:
+            textures.cached_mip_chain(path, cache_dir, compress)
+
+        def render(frame):
+            from OpenGL.GL import glFinish
+            if not warm:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            manager = textures.TextureManager(mip_cache=cache_dir, compress=compress)
+            manager.load(path)
+            glFinish()
+            manager.release()
+        render.directory = directory
+        return render
+    return setup
+
+
+def case_texture_manager(count, size, budget, per_frame=16):
+    def setup(width, height):
+        import tempfile
+        import numpy as np
+        from PIL import Image
+        import textures
+        directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        paths = []
+        for i in range(count):
+            paths.append(f"{directory.name}/tex_{i}.png")
+            Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8)).save(paths[-1])
+        manager = textures.TextureManager(budget)
+
+        def render(frame):
+            from OpenGL.GL import glFinish
+            # A window sliding over the textures, so some come back after
+            # they were evicted.
+            for i in range(frame * per_frame // 2, frame * per_frame // 2 + per_frame):
+                manager.bind(manager.load(paths[i % count]))
+            glFinish()
+        render.directory = directory
+        render.manager = manager
+        return render
+    return setup
+
+
+def case_instancing(mesh, count, immediate=False):
+    def setup(width, height):
+        import instancing
+        draw, _ = instancing.setup_scene(mesh, count, width, height, immediate)
+        distance = instancing.view_distance(count)
+
+        def render(frame):
+            instancing.render(draw, distance, frame)
+            headless.present(width, height, False)
+        return render
+    return setup
+
+
+# name -> (setup factory, needs a GL context)
+CASES = {
+    "lab1.render": (case_lab_scene("lab1"), True),
+    "lab2.render": (case_lab_scene("lab2"), True),
+    "lab3.render": (case_lab_scene("lab3"), True),
+    "lab3.ellipsoid_300": (case_lab_scene("lab3", tessellation=300), True),
+    "lab3.ellipsoid_300_immediate": (case_lab_scene("lab3", tessellation=300, immediate=True), True),
+    "lab3.ellipsoid_lod": (case_lab_scene("lab3", lod=True), True),
+    "lab4.scene": (case_lab_scene("lab4"), False),
+    "lab4.fill": (case_lab4_fill(), False),
+    "lab4.fill_batch": (case_lab4_fill(batch=32), False),
+    "lab4.fill_batch_tiled_1": (case_lab4_fill(batch=32, threads=1), False),
+    "lab4.fill_batch_tiled_4": (case_lab4_fill(batch=32, threads=4), False),
+    "lab4.lines": (case_lab4_lines(), False),
+    "lab4.filter": (case_lab4_filter(), False),
+    "lab5.render": (case_lab_scene("lab5"), True),
+    "lab5.render_100k": (case_lab_scene("lab5", segments=100000), True),
+    "lab5.render_100k_immediate": (case_lab_scene("lab5", segments=100000, immediate=True), True),
+    "lab5.clip": (case_lab5_clip(), False),
+    "lab5.clip_batch": (case_lab5_clip(batch=True), False),
+    "lab5.clip_liang_barsky": (case_lab5_clip(engine="liang-barsky"), False),
+    "lab5.clip_liang_barsky_batch": (case_lab5_clip(batch=True, engine="liang-barsky"), False),
+    "lab6.render": (case_lab_scene("lab6"), True),
+    "lab6.async_textures": (case_lab_scene("lab6", async_textures=True), True),
+    "lab7.original": (case_lab_scene("lab7", mode="original"), True),
+    "lab7.optimized": (case_lab_scene("lab7", mode="optimized"), True),
+    "lab7.display_list": (case_lab_scene("lab7", mode="display_list"), True),
+    "lab7.shader": (case_lab_scene("lab7", mode="shader"), True),
+    "lab7.instanced": (case_lab_scene("lab7", mode="instanced"), True),
+    "lab7.display_list_1000": (case_lab_scene("lab7", mode="display_list", cubes=1000), True),
+    "lab7.shader_1000": (case_lab_scene("lab7", mode="shader", cubes=1000), True),
+    "lab7.instanced_1000": (case_lab_scene("lab7", mode="instanced", cubes=1000), True),
+    "software.lab2": (case_software("lab2"), False),
+    "software.lab3": (case_software("lab3"), False),
+    "software.lab6": (case_software("lab6"), False),
+    "software.triangles_10k": (case_software("triangles", count=10000), False),
+    "textures.decode_1024": (case_texture_load(1024, upload=False), False),
+    "textures.decode_4096": (case_texture_load(4096, upload=False), False),
+    "textures.load_256": (case_texture_load(256), True),
+    "textures.load_1024": (case_texture_load(1024), True),
+    "textures.load_4096": (case_texture_load(4096), True),
+    "textures.mip_cache_cold_1024": (case_mip_cache(1024, warm=False), True),
+    "textures.mip_cache_warm_1024": (case_mip_cache(1024), True),
+    "textures.mip_cache_cold_4096": (case_mip_cache(4096, warm=False), True),
+    "textures.mip_cache_warm_4096": (case_mip_cache(4096), True),
+    "textures.mip_cache_dxt1_4096": (case_mip_cache(4096, compress=True), True),
+    "textures.manager_atlas": (case_texture_manager(256, 128, 8 << 20), True),
+    "textures.manager_pages": (case_texture_manager(32, 512, 8 << 20), True),
+    "instancing.cube_1000": (case_instancing("cube", 1000), True),
+    "instancing.cube_1000_immediate": (case_instancing("cube", 1000, immediate=True), True),
+    "instancing.cube_10000": (case_instancing("cube", 10000), True),
+    "instancing.ellipsoid_100": (case_instancing("ellipsoid", 100), True),
+    "instancing.ellipsoid_100_immediate": (case_instancing("ellipsoid", 100, immediate=True), True),
+    "instancing.ellipsoid_1000": (case_instancing("ellipsoid", 1000), True),
+}
+
+
+def summarize(frame_times):
+    ms = np.asarray(frame_times) * 1000
+    return {
+        "frames": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "min_ms": float(ms.min()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def run_case(case, frames, warmup, width, height, backend):
+    setup, needs_gl = case
+    context = None
+    if needs_gl:
+        if backend == "numpy":
+            return {"skipped": "needs an OpenGL backend"}
+        try:
+            context = headless.create_context(backend, width, height)
+        except Exception as e:
+            return {"skipped": f"no GL context: {e}"}
+    try:
+        render = setup(width, height)
+        for frame in range(warmup):
+            render(frame)
+        frame_times = []
+        for frame in range(warmup, warmup + frames):
+            start = time.perf_counter()
+            render(frame)
+            frame_times.append(time.perf_counter() - start)
+        return summarize(frame_times)
+    finally:
+        if context is not None:
+            context.close()
+
+
+def select_cases(patterns):
+    if not patterns:
+        return list(CASES)
+    selected = [name for name in CASES if any(name == p or name.startswith(p + ".") for p in patterns)]
+    unknown = [p for p in patterns if not any(name == p or name.startswith(p + ".") for name in CASES)]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark cases: {', '.join(unknown)}")
+    return selected
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print("+------------------------------+----------+----------+----------+----------+----------+")
+    print("| Case                         | Mean ms  | p50 ms   | p95 ms   | p99 ms   | vs base  |")
+    print("+------------------------------+----------+----------+----------+----------+----------+")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"| {name:28} | {'skipped: ' + result['skipped']:52.52} |")
+            continue
+        change = "-"
+        base = (baseline or {}).get(name)
+        if base and "mean_ms" in base:
+            change = f"{(result['mean_ms'] / base['mean_ms'] - 1) * 100:+.1f}%"
+        print(f"| {name:28} | {result['mean_ms']:8.2f} | {result['p50_ms']:8.2f} | "
+              f"{result['p95_ms']:8.2f} | {result['p99_ms']:8.2f} | {change:>8} |")
+    print("+------------------------------+----------+----------+----------+----------+----------+")
+
+
+def run_stress(mesh, counts, frames, warmup, width, height, backend, immediate_limit):
+    results = {}
+    for count in counts:
+        results[f"{mesh}_{count}"] = run_case((case_instancing(mesh, count), True),
+                                              frames, warmup, width, height, backend)
+        if count <= immediate_limit:
+            results[f"{mesh}_{count}_immediate"] = run_case((case_instancing(mesh, count, immediate=True), True),
+                                                            frames, warmup, width, height, backend)
+    return results
+
+
+def print_stress(mesh, counts, results):
+    print("+------------+--------------+--------------+----------+")
+    print("| Instances  | Instanced ms | Immediate ms | Speedup  |")
+    print("+------------+--------------+--------------+----------+")
+    for count in counts:
+        instanced = results[f"{mesh}_{count}"]
+        immediate = results.get(f"{mesh}_{count}_immediate", {"skipped": "over limit"})
+        if "skipped" in instanced:
+            print(f"| {count:10} | {'skipped: ' + instanced['skipped']:40.40} |")
+            continue
+        if "skipped" in immediate:
+            print(f"| {count:10} | {instanced['mean_ms']:12.2f} | {'-':>12} | {'-':>8} |")
+            continue
+        print(f"| {count:10} | {instanced['mean_ms']:12.2f} | {immediate['mean_ms']:12.2f} | "
+              f"{immediate['mean_ms'] / instanced['mean_ms']:7.1f}x |")
+    print("+------------+--------------+--------------+----------+")
+
+
+def run_experiment(variants, cubes, warmup, duration, trials, width, height, backend):
+    context = headless.create_context(backend, width, height)
+    try:
+        render = headless.setup_lab7(width, height, capture=False, cubes=cubes)
+        import lab7
+        return lab7.run_experiment(lab7.Experiment(variants, warmup, duration, trials, cubes), render)
+    finally:
+        if context is not None:
+            context.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the lab frame-time benchmarks.")
+    parser.add_argument("cases", nargs="*", help="case names or lab prefixes, e.g. lab4 or lab7.optimized")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--size", type=headless.parse_size, default=(800, 600), help="WIDTHxHEIGHT")
+    parser.add_argument("--backend", choices=headless.BACKENDS, default="egl")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    parser.add_argument("--stress", choices=("cube", "ellipsoid"),
+                        help="scale the instanced mesh over --counts instead of running the cases")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--immediate-limit", type=int, default=10000,
+                        help="largest count also drawn with the one-object-at-a-time loop")
+    parser.add_argument("--experiment", nargs="+", metavar="VARIANT",
+                        help="time these lab7 variants in interleaved trials instead of running the cases; "
+                             "--out takes a .csv or JSON report, --warmup counts frames per run")
+    parser.add_argument("--cubes", type=int, default=1, help="cubes per frame in --experiment")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per variant and trial in --experiment")
+    parser.add_argument("--trials", type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.experiment and args.trials < 1:
+        parser.error("--trials must be at least 1")
+    if args.experiment and args.duration <= 0:
+        parser.error("--duration must be positive")
+    if args.experiment and args.backend == "numpy":
+        parser.error("--experiment needs an OpenGL backend")
+
+    if args.list:
+        for name, (_, needs_gl) in CASES.items():
+            print(f"{name:28} {'GL' if needs_gl else 'CPU'}")
+        return
+
+    headless.select_backend(args.backend)
+    width, height = args.size
+    if args.experiment:
+        import lab7
+        report = run_experiment(args.experiment, args.cubes, args.warmup, args.duration, args.trials,
+                                width, height, args.backend)
+        report["config"]["backend"] = args.backend
+        report["config"]["revision"] = git_revision()
+        lab7.write_report(report, args.out)
+        return
+
+    results = {}
+    if args.stress:
+        results = run_stress(args.stress, args.counts, args.frames, args.warmup, width, height,
+                             args.backend, args.immediate_limit)
+        print_stress(args.stress, args.counts, results)
+    else:
+        for name in select_cases(args.cases):
+            results[name] = run_case(CASES[name], args.frames, args.warmup, width, height, args.backend)
+
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)["cases"]
+        print_results(results, baseline)
+
+    if args.out:
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "backend": args.backend,
+                "size": [width, height],
+                "frames": args.frames,
+                "warmup": args.warmup,
+            },
+            "cases": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Clip volumes for lab5: boxes, convex polyhedra and indexed sets of them.
+
+    python clip_volumes.py          # BVH against brute force, 1 to 10000 boxes
+
+A volume reports, for segments p1 + t * (p2 - p1), the parameter interval
+[t_enter, t_exit] within [0, 1] that lies inside it. clip_external and
+clip_internal turn those intervals into pieces, in the (K, 2, 3) pieces plus
+source index form of lab5's batch clippers. A VolumeSet keeps its volumes in
+a bounding volume hierarchy, so a segment is only tested against the volumes
+whose bounds it crosses.
+"""
+import sys
+import time
+
+import numpy as np
+
+
+def slab_intervals(p1, delta, low, high):
+    # Liang-Barsky against axis-aligned bounds; low and high broadcast against p1.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_low = (low - p1) / delta
+        t_high = (high - p1) / delta
+    parallel = delta == 0
+    inside = (p1 >= low) & (p1 <= high)
+    t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t_low, t_high))
+    t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t_low, t_high))
+    return np.maximum(t_near.max(axis=-1), 0.0), np.minimum(t_far.min(axis=-1), 1.0)
+
+
+class AABB:
+    def __init__(self, low, high):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+
+    @property
+    def bounds(self):
+        return self.low, self.high
+
+    @property
+    def planes(self):
+        # Outward normals, inside where a x + b y + c z + d <= 0.
+        normals = np.vstack([-np.eye(3), np.eye(3)])
+        return np.column_stack([normals, np.concatenate([self.low, -self.high])])
+
+    def intervals(self, p1, delta):
+        return slab_intervals(p1, delta, self.low, self.high)
+
+
+class ConvexVolume:
+    """Intersection of the half-spaces a x + b y + c z + d <= 0, one per row
+    of an (M, 4) plane array. The planes have to enclose a bounded region."""
+
+    def __init__(self, planes, bounds=None):
+        self.planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+        if bounds is None:
+            vertices = self.vertices()
+            if not len(vertices):
+                raise ValueError("the planes do not enclose a region")
+            bounds = vertices.min(axis=0), vertices.max(axis=0)
+        self.low, self.high = (np.asarray(b, dtype=np.float64) for b in bounds)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        # Frustum of a projection (times view) matrix acting on column vectors:
+        # -w <= x, y, z <= w in clip space.
+        m = np.asarray(matrix, dtype=np.float64)
+        planes = [-(m[3] + m[0]), -(m[3] - m[0]), -(m[3] + m[1]), -(m[3] - m[1]), -(m[3] + m[2]), -(m[3] - m[2])]
+        return cls(planes)
+
+    @property
+    def bounds(self):
+        return self.low, self.high
+
+    def vertices(self, tolerance=1e-9):
+        # Every feasible intersection point of three planes is a corner.
+        normals, offsets = self.planes[:, :3], self.planes[:, 3]
+        m = len(self.planes)
+        triples = np.array([(i, j, k) for i in range(m) for j in range(i + 1, m) for k in range(j + 1, m)])
+        if not len(triples):
+            return np.empty((0, 3))
+        systems = normals[triples]
+        solvable = np.abs(np.linalg.det(systems)) > tolerance
+        points = np.linalg.solve(systems[solvable], -offsets[triples[solvable]][..., None])[..., 0]
+        scale = np.linalg.norm(normals, axis=1)
+        inside = np.all(points @ normals.T + offsets <= tolerance * np.maximum(scale, 1), axis=1)
+        return points[inside]
+
+    def intervals(self, p1, delta):
+        # Cyrus-Beck: a plane is entered where the segment runs against its
+        # normal and left where it runs along it.
+        normals, offsets = self.planes[:, :3], self.planes[:, 3]
+        distance = p1 @ normals.T + offsets
+        speed = delta @ normals.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = -distance / speed
+        t_near = np.where(speed < 0, t, np.where((speed == 0) & (distance > 0), np.inf, -np.inf))
+        t_far = np.where(speed > 0, t, np.where((speed == 0) & (distance > 0), -np.inf, np.inf))
+        return np.maximum(t_near.max(axis=-1), 0.0), np.minimum(t_far.min(axis=-1), 1.0)
+
+
+class VolumeSet:
+    """Volumes in a bounding volume hierarchy over their bounds.
+
+    A point is inside the set when it is inside any of its volumes. With
+    leaf_size=None the hierarchy is a single leaf, i.e. brute force.
+    """
+
+    def __init__(self, volumes, leaf_size=4):
+        self.volumes = list(volumes)
+        bounds = np.array([np.stack(volume.bounds) for volume in self.volumes]).reshape(-1, 2, 3)
+        self.volume_low, self.volume_high = bounds[:, 0], bounds[:, 1]
+        self.is_box = np.array([isinstance(volume, AABB) for volume in self.volumes], dtype=bool)
+        leaf_size = leaf_size or max(len(self.volumes), 1)
+
+        low, high, children, first, count = [], [], [], [], []
+        order = np.arange(len(self.volumes))
+
+        def build(start, stop):
+            node = len(low)
+            members = order[start:stop]
+            low.append(self.volume_low[members].min(axis=0) if len(members) else np.full(3, np.inf))
+            high.append(self.volume_high[members].max(axis=0) if len(members) else np.full(3, -np.inf))
+            children.append((-1, -1))
+            first.append(start)
+            count.append(stop - start)
+            if stop - start > leaf_size:
+                # Median split of the volume centres along the longest side.
+                centres = self.volume_low[members] + self.volume_high[members]
+                axis = np.argmax(high[node] - low[node])
+                order[start:stop] = members[np.argsort(centres[:, axis], kind="stable")]
+                middle = (start + stop) // 2
+                children[node] = (build(start, middle), build(middle, stop))
+                count[node] = 0
+            return node
+
+        build(0, len(self.volumes))
+        self.node_low, self.node_high = np.array(low), np.array(high)
+        self.children = np.array(children, dtype=np.intp)
+        self.first = np.array(first, dtype=np.intp)
+        self.count = np.array(count, dtype=np.intp)
+        self.order = order
+
+    @property
+    def bounds(self):
+        return self.node_low[0], self.node_high[0]
+
+    def candidates(self, p1, delta):
+        """(segment, volume) pairs where the segment crosses the volume's bounds."""
+        segment = np.arange(len(p1))
+        node = np.zeros(len(p1), dtype=np.intp)
+        found_segments, found_volumes = [], []
+        while len(segment):
+            t_enter, t_exit = slab_intervals(p1[segment], delta[segment], self.node_low[node], self.node_high[node])
+            hit = t_enter <= t_exit
+            segment, node = segment[hit], node[hit]
+
+            leaf = self.children[node, 0] < 0
+            counts = self.count[node[leaf]]
+            found_segments.append(np.repeat(segment[leaf], counts))
+            # Slot i of a leaf is order[first + i].
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            found_volumes.append(self.order[np.repeat(self.first[node[leaf]], counts) + offsets])
+
+            segment = np.repeat(segment[~leaf], 2)
+            node = self.children[node[~leaf]].ravel()
+        return np.concatenate(found_segments), np.concatenate(found_volumes)
+
+    def inside_intervals(self, p1, delta):
+        segment, volume = self.candidates(p1, delta)
+        t_enter = np.empty(len(segment))
+        t_exit = np.empty(len(segment))
+
+        # Boxes are exactly their bounds, all of them in one pass.
+        box = self.is_box[volume]
+        t_enter[box], t_exit[box] = slab_intervals(p1[segment[box]], delta[segment[box]],
+                                                   self.volume_low[volume[box]], self.volume_high[volume[box]])
+        rows = np.flatnonzero(~box)
+        rows = rows[np.argsort(volume[rows], kind="stable")]
+        groups = np.split(rows, np.flatnonzero(np.diff(volume[rows])) + 1) if len(rows) else []
+        for group in groups:
+            t_enter[group], t_exit[group] = self.volumes[volume[group[0]]].intervals(p1[segment[group]],
+                                                                                     delta[segment[group]])
+        inside = t_enter < t_exit
+        return segment[inside], t_enter[inside], t_exit[inside]
+
+
+def inside_intervals(segments, volume):
+    """Source, t_enter and t_exit of every non-empty inside interval."""
+    p1 = segments[:, 0]
+    delta = segments[:, 1] - p1
+    if isinstance(volume, VolumeSet):
+        return volume.inside_intervals(p1, delta)
+    t_enter, t_exit = volume.intervals(p1, delta)
+    source = np.flatnonzero(t_enter < t_exit)
+    return source, t_enter[source], t_exit[source]
+
+
+def merge_intervals(source, start, end):
+    order = np.lexsort((start, source))
+    source, start, end = source[order], start[order], end[order]
+    if not len(source):
+        return source, start, end
+    # t is within [0, 1], so 2 * source + t keeps sources apart in one running maximum.
+    reach = np.maximum.accumulate(end + 2.0 * source)
+    new = np.ones(len(source), dtype=bool)
+    new[1:] = (source[1:] != source[:-1]) | (start[1:] + 2.0 * source[1:] > reach[:-1])
+    heads = np.flatnonzero(new)
+    return source[heads], start[heads], np.maximum.reduceat(end, heads)
+
+
+def pieces_at(segments, source, start, end):
+    p1, p2 = segments[source, 0], segments[source, 1]
+    # The segment's own endpoints where a piece reaches them, as lab5 does.
+    a = np.where((start == 0)[:, None], p1, p1 + start[:, None] * (p2 - p1))
+    b = np.where((end == 1)[:, None], p2, p1 + end[:, None] * (p2 - p1))
+    return np.stack([a, b], axis=1)
+
+
+def clip_internal(segments, volume):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    source, start, end = merge_intervals(*inside_intervals(segments, volume))
+    return pieces_at(segments, source, start, end), source
+
+
+def clip_external(segments, volume):
+    """Parts of the segments outside the volume, as (pieces, source index)."""
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    source, start, end = merge_intervals(*inside_intervals(segments, volume))
+    first = np.ones(len(source), dtype=bool)
+    first[1:] = source[1:] != source[:-1]
+    last = np.ones(len(source), dtype=bool)
+    last[:-1] = first[1:]
+
+    # The gap before every inside interval, then the one after the last.
+    previous_end = np.where(first, 0.0, np.roll(end, 1))
+    untouched = np.setdiff1d(np.arange(len(segments)), source)
+    gap_source = np.concatenate([source, source[last], untouched])
+    gap_start = np.concatenate([previous_end, end[last], np.zeros(len(untouched))])
+    gap_end = np.concatenate([start, np.ones(last.sum()), np.ones(len(untouched))])
+    keep = gap_start < gap_end
+    gap_source, gap_start, gap_end = gap_source[keep], gap_start[keep], gap_end[keep]
+
+    order = np.lexsort((gap_start, gap_source))
+    gap_source, gap_start, gap_end = gap_source[order], gap_start[order], gap_end[order]
+    return pieces_at(segments, gap_source, gap_start, gap_end), gap_source
+
+
+def random_boxes(count, seed=0, size=(0.1, 0.3)):
+    # Scattered so that the number of boxes per unit volume stays the same.
+    rng = np.random.default_rng(seed)
+    extent = count ** (1 / 3)
+    centres = rng.uniform(0, extent, (count, 3))
+    half = rng.uniform(*size, (count, 3)) / 2
+    return [AABB(c - h, c + h) for c, h in zip(centres, half)], extent
+
+
+def random_short_segments(count, extent, length=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    p1 = rng.uniform(0, extent, (count, 3))
+    direction = rng.normal(size=(count, 3))
+    direction *= length / np.linalg.norm(direction, axis=1, keepdims=True)
+    return np.stack([p1, p1 + direction], axis=1)
+
+
+def benchmark_volumes(volume_counts=(1, 10, 100, 1000, 10000), segment_count=100000, brute_limit=10 ** 7,
+                      repeats=3, seed=0):
+    print(f"External clipping of {segment_count} short segments against scattered boxes, best of {repeats}")
+    print("+------------+-----------+-----------+-----------+-------------+-----------+")
+    print("| Volumes    | Tests/seg | BVH       | Brute     | Speedup     | Identical |")
+    print("+------------+-----------+-----------+-----------+-------------+-----------+")
+    for count in volume_counts:
+        boxes, extent = random_boxes(count, seed)
+        segments = random_short_segments(segment_count, extent, seed=seed)
+        tree = VolumeSet(boxes)
+        tests = len(tree.candidates(segments[:, 0], segments[:, 1] - segments[:, 0])[0]) / segment_count
+        times, results = {}, {}
+        for name, volume in (("bvh", tree), ("brute", VolumeSet(boxes, leaf_size=None))):
+            if name == "brute" and count * segment_count > brute_limit:
+                continue
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                results[name] = clip_external(segments, volume)
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+        if "brute" in times:
+            same = all(np.array_equal(a, b) for a, b in zip(results["bvh"], results["brute"]))
+            brute = f"{times['brute'] * 1000:7.1f}ms"
+            speedup = f"{times['brute'] / times['bvh']:10.1f}x"
+        else:
+            same, brute, speedup = "-", f"{'-':>9}", f"{'-':>11}"
+        print(f"| {count:10} | {tests:9.2f} | {times['bvh'] * 1000:7.1f}ms | {brute} | {speedup} | {str(same):>9} |")
+    print("+------------+-----------+-----------+-----------+-------------+-----------+")
+
+
+if __name__ == "__main__":
+    benchmark_volumes(tuple(int(n) for n in sys.argv[1:]) or (1, 10, 100, 1000, 10000))
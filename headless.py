@@ -0,0 +1,311 @@
+"""Offscreen rendering of the lab scenes, without a window or a display.
+
+    python headless.py lab3 lab7 --frames 60 --out frames --format png
+    python headless.py all --backend osmesa --format npy
+
+GL scenes run in an OSMesa or EGL (Mesa llvmpipe/swrast) context, lab4 is
+rendered by its own NumPy frame buffer. With --backend numpy, lab2, lab3 and
+lab6 are drawn by software_renderer instead, without any GL driver. The
+backend has to be chosen before OpenGL is imported, so the labs are imported
+lazily from here.
+"""
+import argparse
+import ctypes
+import os
+import sys
+
+import numpy as np
+
+SCENES = ("lab1", "lab2", "lab3", "lab4", "lab5", "lab6", "lab7")
+BACKENDS = ("osmesa", "egl", "numpy")
+NUMPY_SCENES = ("lab4",)
+SOFTWARE_SCENES = ("lab2", "lab3", "lab6")
+
+
+def select_backend(backend):
+    if "OpenGL.GL" in sys.modules:
+        raise RuntimeError("the headless backend must be selected before OpenGL is imported")
+    if backend in ("osmesa", "egl"):
+        os.environ["PYOPENGL_PLATFORM"] = backend
+        if backend == "egl":
+            os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+
+class OSMesaContext:
+    def __init__(self, width, height):
+        from OpenGL import arrays, osmesa
+        from OpenGL.GL import GL_UNSIGNED_BYTE
+
+        self.osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("could not create an OSMesa context")
+        self.buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("could not make the OSMesa context current")
+
+    def close(self):
+        self.osmesa.OSMesaDestroyContext(self.context)
+
+
+def attribute_list(*values):
+    from OpenGL import EGL
+    return (EGL.EGLint * len(values))(*values)
+
+
+class EGLContext:
+    def __init__(self, width, height):
+        from OpenGL import EGL
+
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not self.display or not EGL.eglInitialize(self.display, None, None):
+            raise RuntimeError("could not initialize an EGL display")
+
+        config_attributes = attribute_list(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, config_attributes, ctypes.pointer(config), 1,
+                                   ctypes.pointer(count)) or count.value == 0:
+            raise RuntimeError("no EGL config supports desktop OpenGL pbuffers")
+
+        surface_attributes = attribute_list(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, surface_attributes)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not self.surface or not self.context:
+            raise RuntimeError("could not create an EGL pbuffer context")
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError("could not make the EGL context current")
+
+    def close(self):
+        EGL = self.egl
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglTerminate(self.display)
+
+
+def create_context(backend, width, height):
+    if backend == "osmesa":
+        return OSMesaContext(width, height)
+    if backend == "egl":
+        return EGLContext(width, height)
+    return None
+
+
+def read_frame(width, height):
+    from OpenGL.GL import GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE, glFinish, glPixelStorei, glReadPixels
+
+    glFinish()
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+    if isinstance(data, bytes):
+        data = np.frombuffer(data, dtype=np.uint8)
+    # GL rows start at the bottom; frames are stored top row first.
+    return np.flipud(np.asarray(data, dtype=np.uint8).reshape(height, width, 3))
+
+
+def present(width, height, capture):
+    if capture:
+        return read_frame(width, height)
+    from OpenGL.GL import glFinish
+    glFinish()
+    return None
+
+
+def frame_buffer_image(buffer):
+    pixels = buffer[..., :3]
+    if pixels.dtype != np.uint8:
+        pixels = np.rint(np.clip(pixels, 0.0, 1.0) * 255).astype(np.uint8)
+    # A copy: the buffer is drawn over by the next frame.
+    return np.ascontiguousarray(np.flipud(pixels))
+
+
+def setup_lab1(width, height, capture=True, **options):
+    import lab1
+
+    def render(frame):
+        lab1.render()
+        return present(width, height, capture)
+    return render
+
+
+def setup_lab2(width, height, capture=True, **options):
+    import lab2
+    lab2.init_gl()
+
+    def render(frame):
+        lab2.angle_y = 5.0 * frame
+        lab2.render()
+        return present(width, height, capture)
+    return render
+
+
+def setup_lab3(width, height, capture=True, tessellation=None, immediate=False, lod=False, **options):
+    import lab3
+    if tessellation is not None:
+        lab3.lat_count = lab3.long_count = tessellation
+    # Cached meshes belong to the previous context.
+    lab3.mesh_cache.clear()
+    lab3.lod_meshes = []
+    lab3.use_mesh_cache = not immediate
+    lab3.use_lod = lod
+    lab3.init_gl(width, height)
+
+    def render(frame):
+        lab3.render()
+        return present(width, height, capture)
+    return render
+
+
+def setup_lab4(width, height, capture=True, vertices=12, seed=0, **options):
+    import lab4
+    lab4.window_width, lab4.window_height = width, height
+    lab4.frame_buffer.resize(width, height)
+    lab4.clear_frame_buffer()
+    lab4.is_drawing = False
+    points = lab4.random_polygon(vertices, width, height, np.random.default_rng(seed))
+
+    # One click per frame, then Enter to fill and F to filter.
+    def render(frame):
+        if frame < len(points):
+            lab4.add_point(*points[frame])
+        elif frame == len(points):
+            lab4.fill_polygon()
+        elif frame == len(points) + 1:
+            lab4.filter_frame()
+        return frame_buffer_image(lab4.frame_buffer.pixels) if capture else None
+    return render
+
+
+def setup_lab5(width, height, capture=True, segments=200, seed=0, immediate=False, **options):
+    import lab5
+    # Line buffers belong to the previous context.
+    lab5.segment_lines, lab5.box_lines, lab5.box_key = lab5.LineBuffer(), lab5.LineBuffer(), None
+    lab5.use_vbo = not immediate
+    lab5.init_gl(width, height)
+    external_segments, _ = lab5.cohen_sutherland_clip_external_batch(lab5.random_segments(segments, seed))
+
+    def render(frame):
+        lab5.angle_y = 5 * frame
+        lab5.render(external_segments)
+        return present(width, height, capture)
+    return render
+
+
+def setup_lab6(width, height, capture=True, async_textures=False, **options):
+    import lab6
+    lab6.width, lab6.height = width, height
+    lab6.async_textures = async_textures
+    lab6.init_gl()
+
+    def render(frame):
+        lab6.render_frame(dt=1 / 60)
+        return present(width, height, capture)
+    return render
+
+
+def setup_lab7(width, height, capture=True, mode="original", async_textures=False, cubes=1, **options):
+    import lab7
+    lab7.width, lab7.height = width, height
+    lab7.async_textures = async_textures
+    lab7.current_mode = mode
+    lab7.cube_count = cubes
+    lab7.init_gl()
+
+    def render(frame):
+        lab7.render_frame(dt=1 / 60)
+        return present(width, height, capture)
+    return render
+
+
+SCENE_SETUP = {
+    "lab1": setup_lab1,
+    "lab2": setup_lab2,
+    "lab3": setup_lab3,
+    "lab4": setup_lab4,
+    "lab5": setup_lab5,
+    "lab6": setup_lab6,
+    "lab7": setup_lab7,
+}
+
+
+def setup_software(scene, width, height, capture=True, **options):
+    import software_renderer
+    renderer = software_renderer.SoftwareRenderer(width, height)
+    draw = software_renderer.SCENES[scene](renderer, **options)
+
+    def render(frame):
+        draw(frame)
+        return frame_buffer_image(renderer.pixels) if capture else None
+    return render
+
+
+def render_frames(scene, frames, width, height, backend, **options):
+    if backend == "numpy" and scene in SOFTWARE_SCENES:
+        render = setup_software(scene, width, height, **options)
+        return [render(frame) for frame in range(frames)]
+    if scene not in NUMPY_SCENES and backend == "numpy":
+        raise ValueError(f"{scene} needs an OpenGL backend (osmesa or egl)")
+    context = None if scene in NUMPY_SCENES else create_context(backend, width, height)
+    try:
+        render = SCENE_SETUP[scene](width, height, **options)
+        return [render(frame) for frame in range(frames)]
+    finally:
+        if context is not None:
+            context.close()
+
+
+def save_frames(frames, out_dir, name, fmt):
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "npy":
+        path = os.path.join(out_dir, f"{name}.npy")
+        np.save(path, np.stack(frames))
+        return [path]
+
+    from PIL import Image
+    paths = []
+    for i, frame in enumerate(frames):
+        path = os.path.join(out_dir, f"{name}_{i:04d}.png")
+        Image.fromarray(frame).save(path)
+        paths.append(path)
+    return paths
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render lab scenes offscreen and dump the frames.")
+    parser.add_argument("scenes", nargs="+", choices=SCENES + ("all",))
+    parser.add_argument("--backend", choices=BACKENDS, default="egl",
+                        help="GL context for the OpenGL labs; lab4 always uses its NumPy frame buffer, "
+                             "numpy draws lab2, lab3 and lab6 in software")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--size", type=parse_size, default=(800, 600), help="WIDTHxHEIGHT")
+    parser.add_argument("--out", default="frames")
+    parser.add_argument("--format", choices=("png", "npy"), default="png")
+    parser.add_argument("--mode", choices=("original", "display_list", "optimized", "shader", "instanced"),
+                        default="original", help="lab7 render variant")
+    args = parser.parse_args(argv)
+
+    scenes = SCENES if "all" in args.scenes else args.scenes
+    select_backend(args.backend)
+    width, height = args.size
+    for scene in scenes:
+        frames = render_frames(scene, args.frames, width, height, args.backend, mode=args.mode)
+        paths = save_frames(frames, args.out, scene, args.format)
+        print(f"{scene}: {len(frames)} frames -> {paths[0] if len(paths) == 1 else args.out}")
+
+
+if __name__ == "__main__":
+    main()
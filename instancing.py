@@ -0,0 +1,274 @@
+"""Instanced drawing of one base mesh with per-instance transforms and colours.
+
+    python instancing.py --mesh cube --count 10000
+    python benchmark.py --stress cube --counts 100 1000 10000
+
+The base mesh (the lab2 cube or the lab3 ellipsoid) lives in one VBO, the
+model matrices and colours of all instances in a second one that is read
+with glVertexAttribDivisor, and the whole set is drawn by a single
+glDrawArraysInstanced call. Projection and view still come from the
+fixed-function matrix stacks, so the labs' camera code keeps working.
+"""
+import argparse
+import ctypes
+import math
+import time
+
+import glfw
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+from OpenGL.GLU import *
+
+import lab2
+import lab3
+
+VERTEX_SHADER = """
+#version 330 compatibility
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 color;
+layout(location = 2) in mat4 model;
+layout(location = 6) in vec3 instance_color;
+out vec3 frag_color;
+
+void main() {
+    frag_color = color * instance_color;
+    gl_Position = gl_ModelViewProjectionMatrix * model * vec4(position, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330 compatibility
+in vec3 frag_color;
+out vec4 out_color;
+
+void main() {
+    out_color = vec4(frag_color, 1.0);
+}
+"""
+
+# lab2's draw_cube faces: colour and the corner signs, scaled by the half size.
+CUBE_FACES = [
+    ((1, 0, 1), [(1, 1, 1), (-1, 1, 1), (-1, -1, 1), (1, -1, 1)]),
+    ((1, 0, 0), [(1, 1, -1), (-1, 1, -1), (-1, -1, -1), (1, -1, -1)]),
+    ((0, 1, 0), [(1, 1, 1), (1, 1, -1), (1, -1, -1), (1, -1, 1)]),
+    ((0, 0, 1), [(-1, 1, 1), (-1, 1, -1), (-1, -1, -1), (-1, -1, 1)]),
+    ((1, 1, 0), [(1, 1, -1), (-1, 1, -1), (-1, 1, 1), (1, 1, 1)]),
+    ((0, 1, 1), [(1, -1, -1), (-1, -1, -1), (-1, -1, 1), (1, -1, 1)]),
+]
+
+MESHES = ("cube", "ellipsoid")
+ELLIPSOID_TESSELLATION = (8, 16)
+# Floats per instance: a column-major 4x4 model matrix and an RGB colour.
+INSTANCE_FLOATS = 16 + 3
+
+
+def cube_vertices(s=0.0):
+    half = 0.1 + s
+    corners = np.array([corners for _, corners in CUBE_FACES], dtype=np.float32) * half
+    colors = np.repeat(np.array([color for color, _ in CUBE_FACES], dtype=np.float32)[:, None], 4, axis=1)
+    # Split every quad into two triangles.
+    quad = [0, 1, 2, 0, 2, 3]
+    return corners[:, quad].reshape(-1, 3), colors[:, quad].reshape(-1, 3)
+
+
+def ellipsoid_vertices(lat_steps, long_steps):
+    mesh = lab3.EllipsoidMesh(lab3.a, lab3.b, lab3.c, lat_steps, long_steps)
+    positions = mesh.positions[mesh.line_indices]
+    return positions, np.ones_like(positions)
+
+
+class InstancedMesh:
+    def __init__(self, positions, colors, mode):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float32)
+        self.vertices = np.hstack([self.positions, np.asarray(colors, dtype=np.float32)])
+        self.mode = mode
+        self.instance_count = 0
+        self.program = None
+        self.vao = None
+        self.vbo = None
+        self.instance_vbo = None
+
+    def upload(self):
+        self.program = compileProgram(compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+                                      compileShader(FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+        self.vao = glGenVertexArrays(1)
+        self.vbo, self.instance_vbo = glGenBuffers(2)
+        glBindVertexArray(self.vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        stride = 6 * 4
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(3 * 4))
+
+        # A mat4 attribute takes four locations, one per column.
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        stride = INSTANCE_FLOATS * 4
+        for column in range(4):
+            glEnableVertexAttribArray(2 + column)
+            glVertexAttribPointer(2 + column, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(column * 4 * 4))
+            glVertexAttribDivisor(2 + column, 1)
+        glEnableVertexAttribArray(6)
+        glVertexAttribPointer(6, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(16 * 4))
+        glVertexAttribDivisor(6, 1)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def set_instances(self, matrices, colors):
+        # matrices are (N, 4, 4) and act on column vectors, like glMultMatrix
+        # after a transpose; GL wants each matrix column by column.
+        if self.vao is None:
+            self.upload()
+        count = len(matrices)
+        data = np.empty((count, INSTANCE_FLOATS), dtype=np.float32)
+        data[:, :16] = np.asarray(matrices, dtype=np.float32).transpose(0, 2, 1).reshape(count, 16)
+        data[:, 16:] = colors
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.instance_count = count
+
+    def draw(self):
+        if self.vao is None:
+            self.upload()
+        glUseProgram(self.program)
+        glBindVertexArray(self.vao)
+        glDrawArraysInstanced(self.mode, 0, len(self.positions), self.instance_count)
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteBuffers(2, [self.vbo, self.instance_vbo])
+            glDeleteVertexArrays(1, [self.vao])
+            glDeleteProgram(self.program)
+            self.vao = self.vbo = self.instance_vbo = self.program = None
+
+
+def create_mesh(name):
+    if name == "cube":
+        return InstancedMesh(*cube_vertices(), GL_TRIANGLES)
+    return InstancedMesh(*ellipsoid_vertices(*ELLIPSOID_TESSELLATION), GL_LINES)
+
+
+def immediate_draw_function(name):
+    if name == "cube":
+        return lambda: lab2.draw_cube(0)
+    return lambda: lab3.draw_ellipsoid_immediate(*ELLIPSOID_TESSELLATION)
+
+
+def instance_scale(name):
+    # Both meshes end up about 0.2 across.
+    return 1.0 if name == "cube" else 0.1
+
+
+def grid_instances(count, spacing=0.4, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    side = max(1, math.ceil(count ** (1 / 3)))
+    cells = np.stack(np.unravel_index(np.arange(count), (side, side, side)), axis=1)
+    offsets = (cells - (side - 1) / 2) * spacing
+
+    angles = rng.uniform(0, 2 * np.pi, count)
+    cos, sin = np.cos(angles) * scale, np.sin(angles) * scale
+    matrices = np.zeros((count, 4, 4), dtype=np.float32)
+    # Rotation about y, uniform scale, then the grid offset.
+    matrices[:, 0, 0] = cos
+    matrices[:, 0, 2] = sin
+    matrices[:, 1, 1] = scale
+    matrices[:, 2, 0] = -sin
+    matrices[:, 2, 2] = cos
+    matrices[:, :3, 3] = offsets
+    matrices[:, 3, 3] = 1
+    colors = rng.uniform(0.3, 1.0, (count, 3)).astype(np.float32)
+    return matrices, colors
+
+
+def draw_instances_immediate(matrices, colors, draw):
+    for matrix, color in zip(matrices, colors):
+        glPushMatrix()
+        glMultMatrixf(matrix.T)
+        glColor3f(*color)
+        draw()
+        glPopMatrix()
+
+
+def view_distance(count, spacing=0.4):
+    side = max(1, math.ceil(count ** (1 / 3)))
+    return 1.0 + 1.8 * side * spacing
+
+
+def init_gl(width, height, count, spacing=0.4):
+    glEnable(GL_DEPTH_TEST)
+    glClearColor(1.0, 1.0, 1.0, 1.0)
+    glViewport(0, 0, width, height)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45, width / height, 0.1, 4 * view_distance(count, spacing))
+    glMatrixMode(GL_MODELVIEW)
+
+
+def render(draw, distance, angle):
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glLoadIdentity()
+    glTranslatef(0, 0, -distance)
+    glRotatef(30, 1, 0, 0)
+    glRotatef(angle, 0, 1, 0)
+    draw()
+
+
+def setup_scene(name, count, width, height, immediate=False, seed=0):
+    matrices, colors = grid_instances(count, scale=instance_scale(name), seed=seed)
+    init_gl(width, height, count)
+    if immediate:
+        draw_one = immediate_draw_function(name)
+        return lambda: draw_instances_immediate(matrices, colors, draw_one), None
+    mesh = create_mesh(name)
+    mesh.set_instances(matrices, colors)
+    return mesh.draw, mesh
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw a grid of instanced cubes or ellipsoids.")
+    parser.add_argument("--mesh", choices=MESHES, default="cube")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--immediate", action="store_true", help="draw one object at a time instead")
+    args = parser.parse_args(argv)
+
+    if not glfw.init():
+        return
+    width, height = 800, 800
+    window = glfw.create_window(width, height, "Instancing", None, None)
+    if not window:
+        glfw.terminate()
+        return
+    glfw.make_context_current(window)
+    glfw.swap_interval(0)
+
+    draw, mesh = setup_scene(args.mesh, args.count, width, height, args.immediate)
+    distance = view_distance(args.count)
+    angle = 0.0
+    frames, last_report = 0, time.perf_counter()
+    while not glfw.window_should_close(window):
+        render(draw, distance, angle)
+        angle += 0.5
+        glfw.swap_buffers(window)
+        glfw.poll_events()
+
+        frames += 1
+        now = time.perf_counter()
+        if now - last_report >= 1.0:
+            glfw.set_window_title(window, f"Instancing: {args.count} x {args.mesh}, "
+                                          f"{(now - last_report) / frames * 1000:.2f} ms/frame")
+            frames, last_report = 0, now
+
+    if mesh is not None:
+        mesh.release()
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
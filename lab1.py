@@ -24,7 +24,7 @@ mods):
         if key == 263: # glfw.KEY_LEFT
             delta = 3
 
-def display(window):
+def render():
     global angle
     glClear(GL_COLOR_BUFFER_BIT)
     glLoadIdentity()
@@ -47,6 +47,10 @@ def display(window):
     glEnd()
     glPopMatrix()
     angle += delta
+
+
+def display(window):
+    render()
     glfw.swap_buffers(window)
     glfw.poll_events()
 def main():
@@ -83,6 +83,11 @@ def render():
     glPopMatrix()
 
 
+def init_gl():
+    glEnable(GL_DEPTH_TEST)
+    glClearColor(1.0, 1.0, 1.0, 1.0)
+
+
 def main():
     if not glfw.init():
         return
@@ -91,8 +96,7 @@ def main():
     glfw.make_context_current(window)
     glfw.set_key_callback(window, key_callback)
 
-    glEnable(GL_DEPTH_TEST)
-    glClearColor(1.0, 1.0, 1.0, 1.0)
+    init_gl()
 
     while not glfw.window_should_close(window):
         glfw.poll_events()
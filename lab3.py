@@ -1,13 +1,29 @@
 import glfw
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from collections import OrderedDict
+import ctypes
 import math
+import numpy as np
 
 lat_count = 30
 long_count = 40
 
 a, b, c = 1, 0.6, 0.6
 
+use_mesh_cache = True
+mesh_cache = OrderedDict()
+mesh_cache_size = 8
+
+# Automatic level of detail: pick the coarsest pyramid level whose chord error
+# on screen stays below lod_error_px.
+use_lod = False
+lod_error_px = 0.5
+lod_levels = [(n // 2, n) for n in (8, 16, 32, 64, 128, 256)]
+lod_meshes = []
+fov_y = 45
+viewport_height = 600
+
 
 def init_window(width=800, height=600, title="lab3"):
     if not glfw.init():
@@ -20,13 +36,18 @@ def init_window(width=800, height=600, title="lab3"):
 
     glfw.make_context_current(window)
     glfw.set_key_callback(window, key_callback)
-    glEnable(GL_DEPTH_TEST)
-    resize_viewport(width, height)
+    init_gl(width, height)
 
     return window
 
+
+def init_gl(width, height):
+    glEnable(GL_DEPTH_TEST)
+    resize_viewport(width, height)
+    build_lod_pyramid()
+
 def key_callback(window, key, scancode, action, mods):
-    global lat_count, long_count
+    global lat_count, long_count, use_lod, lod_error_px
     if action in (glfw.PRESS, glfw.REPEAT):
         if key == glfw.KEY_UP:
             lat_count += 5
@@ -34,18 +55,27 @@ def key_callback(window, key, scancode, action, mods):
         elif key == glfw.KEY_DOWN and lat_count > 5 and long_count > 5:
             lat_count -= 5
             long_count -= 5
+        elif key == glfw.KEY_L and action == glfw.PRESS:
+            use_lod = not use_lod
+            print(f"LOD: {'on' if use_lod else 'off'} (target error {lod_error_px} px)")
+        elif key == glfw.KEY_RIGHT_BRACKET:
+            lod_error_px *= 2
+        elif key == glfw.KEY_LEFT_BRACKET:
+            lod_error_px /= 2
 
 
 
 def resize_viewport(width, height):
+    global viewport_height
+    viewport_height = height
     glViewport(0, 0, width, height)
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
-    gluPerspective(45, width / height, 0.1, 10)
+    gluPerspective(fov_y, width / height, 0.1, 10)
     glMatrixMode(GL_MODELVIEW)
 
 
-def draw_ellipsoid(lat_steps, long_steps):
+def draw_ellipsoid_immediate(lat_steps, long_steps):
     for i in range(lat_steps):
         theta1 = math.pi * i / lat_steps
         theta2 = math.pi * (i + 1) / lat_steps
@@ -67,23 +97,166 @@ def draw_ellipsoid(lat_steps, long_steps):
 
 
 
+class EllipsoidMesh:
+    def __init__(self, a, b, c, lat_steps, long_steps):
+        self.key = (a, b, c, lat_steps, long_steps)
+        theta = np.pi * np.arange(lat_steps + 1) / lat_steps
+        phi = 2 * np.pi * np.arange(long_steps + 1) / long_steps
+        sin_theta = np.sin(theta)[:, None]
+
+        # Vertex (i, j) of the (lat + 1) x (long + 1) grid sits at theta_i, phi_j.
+        x = a * sin_theta * np.cos(phi)
+        y = b * sin_theta * np.sin(phi)
+        z = np.broadcast_to(c * np.cos(theta)[:, None], x.shape)
+        self.positions = np.stack([x, y, z], axis=-1).reshape(-1, 3).astype(np.float32)
+        normals = self.positions / np.array([a * a, b * b, c * c], dtype=np.float32)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        self.normals = normals / np.where(lengths > 0, lengths, 1)
+
+        # Band i is one strip alternating between rings i and i + 1, like the
+        # GL_LINE_STRIPs of draw_ellipsoid_immediate.
+        grid = np.arange((lat_steps + 1) * (long_steps + 1), dtype=np.uint32).reshape(lat_steps + 1, -1)
+        self.strip_indices = np.stack([grid[:-1], grid[1:]], axis=-1).reshape(lat_steps, -1)
+        self.line_indices = np.stack([self.strip_indices[:, :-1], self.strip_indices[:, 1:]], axis=-1).ravel()
+
+        self.vertices = np.hstack([self.positions, self.normals]).astype(np.float32)
+        self.vbo = None
+        self.ibo = None
+
+    def upload(self):
+        self.vbo, self.ibo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.line_indices.nbytes, self.line_indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        if self.vbo is None:
+            self.upload()
+        stride = 6 * 4
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(3 * 4))
+        glDrawElements(GL_LINES, len(self.line_indices), GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = self.ibo = None
+
+
+def get_ellipsoid_mesh(a, b, c, lat_steps, long_steps):
+    key = (a, b, c, lat_steps, long_steps)
+    mesh = mesh_cache.get(key)
+    if mesh is not None:
+        mesh_cache.move_to_end(key)
+        return mesh
+    mesh = EllipsoidMesh(a, b, c, lat_steps, long_steps)
+    mesh_cache[key] = mesh
+    while len(mesh_cache) > mesh_cache_size:
+        _, evicted = mesh_cache.popitem(last=False)
+        evicted.release()
+    return mesh
+
+
+def clear_mesh_cache():
+    while mesh_cache:
+        _, mesh = mesh_cache.popitem()
+        mesh.release()
+
+
+def draw_ellipsoid(lat_steps, long_steps):
+    if use_mesh_cache:
+        get_ellipsoid_mesh(a, b, c, lat_steps, long_steps).draw()
+    else:
+        draw_ellipsoid_immediate(lat_steps, long_steps)
+
+
+def build_lod_pyramid():
+    global lod_meshes
+    # Every level is uploaded up front so switching levels never builds a mesh mid-frame.
+    lod_meshes = [EllipsoidMesh(a, b, c, lat_steps, long_steps) for lat_steps, long_steps in lod_levels]
+    for mesh in lod_meshes:
+        mesh.upload()
+
+
+def release_lod_pyramid():
+    global lod_meshes
+    for mesh in lod_meshes:
+        mesh.release()
+    lod_meshes = []
+
+
+def projected_radius(distance, radius):
+    # Screen radius in pixels of the bounding sphere seen from distance.
+    if distance <= radius:
+        return math.inf
+    focal = viewport_height / 2 / math.tan(math.radians(fov_y) / 2)
+    return focal * radius / math.sqrt(distance * distance - radius * radius)
+
+
+def select_lod_level(distance, error_px=None):
+    if error_px is None:
+        error_px = lod_error_px
+    radius_px = projected_radius(distance, max(a, b, c))
+    if radius_px <= error_px:
+        return 0
+    # A ring of n segments strays r * (1 - cos(pi / n)) from the curve; the
+    # latitude bands use half as many steps over half the angle, so the
+    # error is the same for both directions.
+    needed = math.pi / math.acos(1 - error_px / radius_px)
+    for level, (_, long_steps) in enumerate(lod_levels):
+        if long_steps >= needed:
+            return level
+    return len(lod_levels) - 1
+
+
+def draw_ellipsoid_lod():
+    # The translation column of the modelview matrix is the centre in eye space.
+    modelview = np.asarray(glGetFloatv(GL_MODELVIEW_MATRIX)).reshape(4, 4)
+    distance = float(np.linalg.norm(modelview[3, :3]))
+    level = select_lod_level(distance)
+    if not lod_meshes:
+        build_lod_pyramid()
+    lod_meshes[level].draw()
+    return level
+
+
+def render():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glLoadIdentity()
+
+    glTranslatef(0, 0, -2.5)
+    glRotatef(30, 1, 0, 0)
+
+    if use_lod:
+        draw_ellipsoid_lod()
+    else:
+        draw_ellipsoid(lat_count, long_count)
+
+
 def main():
     window = init_window()
     if not window:
         return
 
     while not glfw.window_should_close(window):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glLoadIdentity()
-
-        glTranslatef(0, 0, -2.5)
-        glRotatef(30, 1, 0, 0)
-
-        draw_ellipsoid(lat_count, long_count)
+        render()
 
         glfw.swap_buffers(window)
         glfw.poll_events()
 
+    clear_mesh_cache()
+    release_lod_pyramid()
     glfw.terminate()
 
 
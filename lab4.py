@@ -2,12 +2,18 @@ import glfw
 from OpenGL.GL import *
 import numpy as np
 import sys
+import time
 
 window_width, window_height = 800, 600
-frame_buffer = np.ones((window_height, window_width, 3), dtype=np.float32)
 polygon_points = []
 is_drawing = False
 
+fill_color = (0.0, 1.0, 0.0)
+outline_color = (1.0, 0.0, 0.0)
+marker_radius = 2
+# A tiled_raster.TiledRasterizer to fill polygons with, or None.
+tiled_rasterizer = None
+
 
 def bresenham_line(x0, y0, x1, y1):
 
@@ -41,7 +47,86 @@ def bresenham_line(x0, y0, x1, y1):
     return points
 
 
-def rasterize_polygon(points):
+def bresenham_lines(segments, width=None, height=None):
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 4)
+    x0, y0, x1, y1 = segments.T
+    dx, dy = np.abs(x1 - x0), np.abs(y1 - y0)
+    sx = np.where(x0 > x1, -1, 1)
+    sy = np.where(y0 > y1, -1, 1)
+
+    # Split every segment into a major axis, stepped once per pixel, and a
+    # minor axis whose offset after k steps is ceil((2*k*minor - major) / (2*major)),
+    # the closed form of the error accumulator in bresenham_line.
+    x_major = dx > dy
+    major, minor = np.where(x_major, dx, dy), np.where(x_major, dy, dx)
+    m0, n0 = np.where(x_major, x0, y0), np.where(x_major, y0, x0)
+    sm, sn = np.where(x_major, sx, sy), np.where(x_major, sy, sx)
+
+    k_lo = np.zeros_like(major)
+    k_hi = major.copy()
+    if width is not None and height is not None:
+        # Clip the step range to the viewport before generating pixels: the
+        # major axis exactly, the minor one with a pixel of slack since the
+        # real pixels stay within half a pixel of the ideal line.
+        m_max = np.where(x_major, width, height) - 1
+        n_max = np.where(x_major, height, width) - 1
+        k_lo = np.maximum(k_lo, np.where(sm > 0, -m0, m0 - m_max))
+        k_hi = np.minimum(k_hi, np.where(sm > 0, m_max - m0, m0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = minor / np.maximum(major, 1)
+            a = (-1 - n0) * sn / slope
+            b = (n_max + 1 - n0) * sn / slope
+        flat = minor == 0
+        k_lo = np.where(flat, np.where((n0 >= 0) & (n0 <= n_max), k_lo, k_hi + 1),
+                        np.maximum(k_lo, np.floor(np.minimum(a, b))))
+        k_hi = np.where(flat, k_hi, np.minimum(k_hi, np.ceil(np.maximum(a, b))))
+        k_lo, k_hi = k_lo.astype(np.int64), k_hi.astype(np.int64)
+
+    counts = np.maximum(k_hi - k_lo + 1, 0)
+    seg = np.repeat(np.arange(len(segments)), counts)
+    k = np.arange(counts.sum())
+    k -= np.repeat(np.cumsum(counts) - counts - k_lo, counts)
+
+    # The quotient is exact enough in float64 for ceil to match integer
+    # division at any realistic line length.
+    major_s = major[seg]
+    steps = np.ceil((k * (2 * minor)[seg] - major_s) / (2 * np.maximum(major_s, 1)))
+    steps = steps.astype(np.int64)
+    m = m0[seg] + sm[seg] * k
+    n = n0[seg] + sn[seg] * steps
+    swap = ~x_major[seg]
+    xs, ys = m, n
+    xs[swap], ys[swap] = n[swap], m[swap]
+
+    if width is not None and height is not None:
+        inside = np.where(swap, (xs >= 0) & (xs < width), (ys >= 0) & (ys < height))
+        xs, ys = xs[inside], ys[inside]
+    return xs, ys
+
+
+def pixel_view(buffer):
+    # reshape would quietly copy a strided buffer and drop the writes.
+    if not buffer.flags.c_contiguous:
+        raise ValueError("pixel_view needs a C-contiguous buffer")
+    pixel = np.dtype((np.void, buffer.dtype.itemsize * buffer.shape[2]))
+    return buffer.reshape(-1, buffer.shape[2]).view(pixel).reshape(-1)
+
+
+def pixel_value(buffer, color):
+    pixel = np.dtype((np.void, buffer.dtype.itemsize * buffer.shape[2]))
+    return np.asarray(color, dtype=buffer.dtype).view(pixel)[0]
+
+
+def draw_lines(buffer, segments, color=(1.0, 0.0, 0.0)):
+    height, width = buffer.shape[:2]
+    xs, ys = bresenham_lines(segments, width, height)
+    # Whole pixels are scattered as opaque records, one element per pixel.
+    pixel_view(buffer)[ys * width + xs] = pixel_value(buffer, color)
+
+
+def rasterize_polygon_original(points, buffer=None):
+    if buffer is None:
+        buffer = frame_buffer.pixels
 
     if len(points) < 3:
         return
@@ -79,10 +164,10 @@ def rasterize_polygon(points):
                 break
             x_start = int(round(aet[i][1]))
             x_end = int(round(aet[i + 1][1]))
-            x_start = max(0, min(x_start, window_width - 1))
-            x_end = max(0, min(x_end, window_width - 1))
+            x_start = max(0, min(x_start, buffer.shape[1] - 1))
+            x_end = max(0, min(x_end, buffer.shape[1] - 1))
             if x_start <= x_end:
-                frame_buffer[y, x_start:x_end + 1] = [0.0, 1.0, 0.0]
+                buffer[y, x_start:x_end + 1] = [0.0, 1.0, 0.0]
 
         aet = [e for e in aet if e[0] > y]
         for i in range(len(aet)):
@@ -90,7 +175,82 @@ def rasterize_polygon(points):
             aet[i] = (y_max, x + inv_m, inv_m)
 
 
-def apply_weighted_average_filter(buffer):
+def polygon_spans(points, width, height):
+    # The spans rasterize_polygon fills: rows and inclusive x ranges, sorted
+    # by row and x, neither overlapping nor touching.
+    no_spans = (np.empty(0, dtype=np.int64),) * 3
+    if len(points) < 3:
+        return no_spans
+    pts = np.trunc(np.asarray(points, dtype=np.float64)).astype(np.int64)
+    x0, y0 = pts[:, 0], pts[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+    keep = y0 != y1
+    if not keep.any():
+        return no_spans
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    swap = y0 > y1
+    x0, x1 = np.where(swap, x1, x0), np.where(swap, x0, x1)
+    y0, y1 = np.where(swap, y1, y0), np.where(swap, y0, y1)
+
+    # Every edge is active on rows y0..y1 inclusive. Its x is accumulated
+    # step by step exactly like the scanline loop, so rounding matches.
+    lengths = y1 - y0 + 1
+    steps = np.empty((len(x0), lengths.max()), dtype=np.float64)
+    steps[:, 0] = x0
+    steps[:, 1:] = ((x1 - x0) / (y1 - y0))[:, None]
+    xs = np.add.accumulate(steps, axis=1)
+    cols = np.arange(steps.shape[1])
+    rows = y0[:, None] + cols
+    valid = (cols < lengths[:, None]) & (rows >= 0) & (rows < height)
+    rows, xs = rows[valid], xs[valid]
+    if rows.size == 0:
+        return no_spans
+
+    # Rounding and clamping are monotonic, so sorting the rounded crossings
+    # gives the same pairs as sorting the exact x values; that lets every row
+    # be sorted at once on a single integer key.
+    xs = np.clip(np.rint(xs), 0, width - 1).astype(np.int64)
+    keys = np.sort(rows * width + xs)
+    rows, xs = keys // width, keys % width
+
+    # Pair crossings 0-1, 2-3, ... within each row; an odd one is dropped.
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    pos = np.arange(rows.size) - np.repeat(starts, np.diff(np.r_[starts, rows.size]))
+    has_next = np.r_[rows[1:] == rows[:-1], False]
+    left = np.flatnonzero((pos % 2 == 0) & has_next)
+    if left.size == 0:
+        return no_spans
+    span_rows, x_start, x_end = rows[left], xs[left], xs[left + 1]
+
+    # Touching spans are merged so that every start and end+1 is unique, then
+    # an xor scan along each row turns those toggles into the coverage mask.
+    first = np.r_[True, (span_rows[1:] != span_rows[:-1]) | (x_start[1:] > x_end[:-1] + 1)]
+    last = np.r_[first[1:], True]
+    return span_rows[first], x_start[first], x_end[last]
+
+
+def rasterize_polygon(points, buffer=None, color=(0.0, 1.0, 0.0)):
+    if buffer is None:
+        buffer = frame_buffer.pixels
+    height, width = buffer.shape[:2]
+    span_rows, x_start, x_end = polygon_spans(points, width, height)
+    if span_rows.size == 0:
+        return
+
+    row_lo, row_hi = span_rows.min(), span_rows.max()
+    col_lo, col_hi = x_start.min(), x_end.max()
+    toggles = np.zeros((row_hi - row_lo + 1, col_hi - col_lo + 2), dtype=bool)
+    toggles[span_rows - row_lo, x_start - col_lo] = True
+    toggles[span_rows - row_lo, x_end + 1 - col_lo] = True
+    mask = np.logical_xor.accumulate(toggles, axis=1)[:, :-1]
+
+    region = buffer[row_lo:row_hi + 1, col_lo:col_hi + 1]
+    for channel, value in enumerate(color):
+        np.copyto(region[..., channel], value, where=mask)
+
+
+def apply_weighted_average_filter_original(buffer):
 
     height, width, _ = buffer.shape
     filtered_buffer = np.copy(buffer)
@@ -111,56 +271,461 @@ def apply_weighted_average_filter(buffer):
     return filtered_buffer
 
 
+def normalized_kernel(weights):
+    kernel = np.array(weights, dtype=np.float32)
+    kernel /= np.sum(kernel)
+    return kernel
+
+
+WEIGHTED_AVERAGE_KERNEL = normalized_kernel([[1, 2],
+                                             [2, 4]])
+BOX_KERNEL = normalized_kernel(np.ones((3, 3)))
+GAUSSIAN_KERNEL = normalized_kernel([[1, 2, 1],
+                                     [2, 4, 2],
+                                     [1, 2, 1]])
+SHARPEN_KERNEL = np.array([[0, -1, 0],
+                           [-1, 5, -1],
+                           [0, -1, 0]], dtype=np.float32)
+
+
+def separate_kernel(kernel):
+    u, s, vt = np.linalg.svd(kernel.astype(np.float64))
+    if s[0] == 0 or np.any(s[1:] > s[0] * 1e-6):
+        return None
+    scale = np.sqrt(s[0])
+    return (u[:, 0] * scale).astype(np.float32), (vt[0] * scale).astype(np.float32)
+
+
+def apply_filter(buffer, kernel, out=None, anchor=(0, 0)):
+    kernel = np.asarray(kernel, dtype=np.float32)
+    kernel_h, kernel_w = kernel.shape
+    height, width = buffer.shape[:2]
+    if out is None:
+        out = np.empty_like(buffer)
+    elif np.shares_memory(out, buffer):
+        raise ValueError("out must not overlap the filtered buffer")
+
+    # Output pixel (y + ay, x + ax) takes the kernel placed at (y, x); pixels
+    # the kernel cannot cover keep their input value.
+    ay, ax = anchor
+    out_h, out_w = height - kernel_h + 1, width - kernel_w + 1
+    if out_h <= 0 or out_w <= 0:
+        out[...] = buffer
+        return out
+    out[:ay] = buffer[:ay]
+    out[ay + out_h:] = buffer[ay + out_h:]
+    out[ay:ay + out_h, :ax] = buffer[ay:ay + out_h, :ax]
+    out[ay:ay + out_h, ax + out_w:] = buffer[ay:ay + out_h, ax + out_w:]
+    result = out[ay:ay + out_h, ax:ax + out_w]
+
+    # Integer buffers are accumulated in float32 and rounded back at the end.
+    integer = not np.issubdtype(out.dtype, np.floating)
+    target = np.empty(result.shape, dtype=np.float32) if integer else result
+
+    factors = separate_kernel(kernel) if kernel_h > 2 or kernel_w > 2 else None
+    if factors is not None:
+        column, row = factors
+        rows_pass = row[0] * buffer[:, :out_w]
+        for j in range(1, kernel_w):
+            rows_pass += row[j] * buffer[:, j:j + out_w]
+        np.multiply(rows_pass[:out_h], column[0], out=target)
+        for i in range(1, kernel_h):
+            target += column[i] * rows_pass[i:i + out_h]
+    else:
+        # Taps are summed in row-major order, the same order np.sum uses on a
+        # kernel-sized window, so small kernels match the per-pixel loop exactly.
+        term = np.empty_like(target)
+        np.multiply(buffer[:out_h, :out_w], kernel[0, 0], out=target)
+        for i in range(kernel_h):
+            for j in range(kernel_w):
+                if i == 0 and j == 0:
+                    continue
+                np.multiply(buffer[i:i + out_h, j:j + out_w], kernel[i, j], out=term)
+                target += term
+
+    if integer:
+        np.clip(np.rint(target, out=target), 0, np.iinfo(out.dtype).max, out=target)
+        result[...] = target
+    elif np.any(kernel < 0):
+        np.clip(target, 0.0, 1.0, out=target)
+    return out
+
+
+def apply_weighted_average_filter(buffer, out=None):
+    return apply_filter(buffer, WEIGHTED_AVERAGE_KERNEL, out)
+
+
+def stamp_markers(buffer, points, color=(1.0, 0.0, 0.0), radius=2):
+    height, width = buffer.shape[:2]
+    points = np.trunc(np.asarray(points, dtype=np.float64)).astype(np.int64).reshape(-1, 2)
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    xs = (points[:, 0, None] + dx.ravel()).ravel()
+    ys = (points[:, 1, None] + dy.ravel()).ravel()
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    pixel_view(buffer)[ys[inside] * width + xs[inside]] = pixel_value(buffer, color)
+
+
+class FrameBuffer:
+    def __init__(self, width, height, mode="rgba8"):
+        if mode == "rgba8":
+            self.dtype, self.channels = np.uint8, 4
+            self.gl_internal_format, self.gl_format, self.gl_type = GL_RGBA8, GL_RGBA, GL_UNSIGNED_BYTE
+        elif mode == "float32":
+            self.dtype, self.channels = np.float32, 3
+            self.gl_internal_format, self.gl_format, self.gl_type = GL_RGB, GL_RGB, GL_FLOAT
+        else:
+            raise ValueError(f"Unknown frame buffer mode: {mode}")
+        self.mode = mode
+        self.storage = np.empty(0, dtype=self.dtype)
+        self.scratch = None
+        self.width = self.height = 0
+        self.pixels = None
+        self.dirty_rect = None
+        self.texture_id = None
+        self.texture_size = (0, 0)
+        self.resize(width, height)
+
+    def color(self, rgb):
+        if self.mode == "rgba8":
+            return np.append(np.rint(np.clip(rgb, 0.0, 1.0) * 255), 255).astype(np.uint8)
+        return np.asarray(rgb, dtype=np.float32)
+
+    def view(self, storage):
+        # The pixels are a prefix of the allocation, so the view is contiguous
+        # whatever the capacity and can go straight to GL.
+        size = self.height * self.width * self.channels
+        return storage[:size].reshape(self.height, self.width, self.channels)
+
+    def resize(self, width, height):
+        needed = width * height * self.channels
+        if needed > self.storage.size:
+            self.storage = np.empty(max(needed, 2 * self.storage.size), dtype=self.dtype)
+            self.scratch = None
+        self.width, self.height = width, height
+        self.pixels = self.view(self.storage)
+        self.clear()
+
+    def clear(self):
+        # White has the same value in every channel, alpha included.
+        self.pixels.fill(self.color((1.0, 1.0, 1.0))[0])
+        self.mark_all_dirty()
+
+    def filter(self, kernel):
+        if self.scratch is None:
+            self.scratch = np.empty_like(self.storage)
+        apply_filter(self.pixels, kernel, out=self.view(self.scratch))
+        self.storage, self.scratch = self.scratch, self.storage
+        self.pixels = self.view(self.storage)
+        self.mark_all_dirty()
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), self.width), min(int(y1), self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        if self.dirty_rect is not None:
+            x0, y0 = min(x0, self.dirty_rect[0]), min(y0, self.dirty_rect[1])
+            x1, y1 = max(x1, self.dirty_rect[2]), max(y1, self.dirty_rect[3])
+        self.dirty_rect = (x0, y0, x1, y1)
+
+    def mark_all_dirty(self):
+        self.mark_dirty(0, 0, self.width, self.height)
+
+    def upload(self):
+        if self.texture_id is None:
+            self.texture_id = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, self.texture_id)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(GL_TEXTURE_2D, self.texture_id)
+
+        # The texture persists between frames; only the region touched since
+        # the last upload is sent again, read in place through the unpack
+        # row length and skips, and idle frames upload nothing.
+        if self.texture_size != (self.width, self.height):
+            glTexImage2D(GL_TEXTURE_2D, 0, self.gl_internal_format, self.width, self.height, 0,
+                         self.gl_format, self.gl_type, self.pixels)
+            self.texture_size = (self.width, self.height)
+        elif self.dirty_rect is not None:
+            x0, y0, x1, y1 = self.dirty_rect
+            glPixelStorei(GL_UNPACK_ROW_LENGTH, self.width)
+            glPixelStorei(GL_UNPACK_SKIP_PIXELS, x0)
+            glPixelStorei(GL_UNPACK_SKIP_ROWS, y0)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, x0, y0, x1 - x0, y1 - y0, self.gl_format, self.gl_type, self.pixels)
+            glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+            glPixelStorei(GL_UNPACK_SKIP_PIXELS, 0)
+            glPixelStorei(GL_UNPACK_SKIP_ROWS, 0)
+        self.dirty_rect = None
+
+    def draw(self):
+        self.upload()
+        glEnable(GL_TEXTURE_2D)
+        glColor3f(1.0, 1.0, 1.0)
+        glBegin(GL_QUADS)
+        glTexCoord2f(0, 0)
+        glVertex2f(0, 0)
+        glTexCoord2f(1, 0)
+        glVertex2f(self.width, 0)
+        glTexCoord2f(1, 1)
+        glVertex2f(self.width, self.height)
+        glTexCoord2f(0, 1)
+        glVertex2f(0, self.height)
+        glEnd()
+        glDisable(GL_TEXTURE_2D)
+
+
+frame_buffer = FrameBuffer(window_width, window_height)
+
+
+def draw_polygon_outline(first=0):
+    # Rasterizes the markers of polygon_points[first:] and the edges leading
+    # to them, so adding a point only costs its marker and its new edge.
+    if not polygon_points:
+        return
+    start = max(first - 1, 0)
+    points = np.trunc(np.asarray(polygon_points[start:], dtype=np.float64)).astype(np.int64)
+    color = frame_buffer.color(outline_color)
+    stamp_markers(frame_buffer.pixels, points[first - start:], color, marker_radius)
+    if len(points) > 1:
+        draw_lines(frame_buffer.pixels, np.hstack([points[:-1], points[1:]]), color)
+    lo = points.min(axis=0) - marker_radius
+    hi = points.max(axis=0) + marker_radius + 1
+    frame_buffer.mark_dirty(lo[0], lo[1], hi[0], hi[1])
+
+
 def update_frame_buffer():
-    glDrawPixels(window_width, window_height, GL_RGB, GL_FLOAT, frame_buffer)
+    frame_buffer.draw()
 
 
 def clear_frame_buffer():
-    global frame_buffer, polygon_points
-    frame_buffer = np.ones((window_height, window_width, 3), dtype=np.float32)
+    global polygon_points
+    frame_buffer.clear()
     polygon_points = []
 
 
 def window_resize_callback(window, width, height):
-    global window_width, window_height, frame_buffer
+    global window_width, window_height
     window_width, window_height = width, height
     glViewport(0, 0, width, height)
-    frame_buffer = np.ones((height, width, 3), dtype=np.float32)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    glOrtho(0, width, 0, height, -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    frame_buffer.resize(width, height)
+    draw_polygon_outline()
 
 
-def mouse_button_callback(window, button, action, mods):
+def add_point(x, y):
     global polygon_points, is_drawing
+    if not is_drawing:
+        clear_frame_buffer()
+        polygon_points = [(x, y)]
+        is_drawing = True
+    else:
+        polygon_points.append((x, y))
+    draw_polygon_outline(len(polygon_points) - 1)
+
+
+def fill_polygon():
+    global is_drawing
+    if len(polygon_points) >= 3:
+        polygon_points.append(polygon_points[0])
+        if tiled_rasterizer is not None:
+            tiled_rasterizer.fill_polygons(frame_buffer.pixels, [polygon_points], frame_buffer.color(fill_color))
+        else:
+            rasterize_polygon(polygon_points, frame_buffer.pixels, frame_buffer.color(fill_color))
+        draw_polygon_outline()
+        is_drawing = False
 
+
+def filter_frame():
+    frame_buffer.filter(WEIGHTED_AVERAGE_KERNEL)
+    draw_polygon_outline()
+
+
+def mouse_button_callback(window, button, action, mods):
     if button == glfw.MOUSE_BUTTON_LEFT and action == glfw.PRESS:
         x, y = glfw.get_cursor_pos(window)
         y = window_height - y
-
-        if not is_drawing:
-            clear_frame_buffer()
-            polygon_points = [(x, y)]
-            is_drawing = True
-        else:
-            polygon_points.append((x, y))
+        add_point(x, y)
 
 
 def key_callback(window, key, scancode, action, mods):
-    global frame_buffer, polygon_points, is_drawing
+    global is_drawing
 
     if action == glfw.PRESS:
         if key == glfw.KEY_C:
             clear_frame_buffer()
             is_drawing = False
         elif key == glfw.KEY_F:
-            frame_buffer = apply_weighted_average_filter(frame_buffer)
+            filter_frame()
         elif key == glfw.KEY_ENTER:
-            if len(polygon_points) >= 3:
-                polygon_points.append(polygon_points[0])
-                rasterize_polygon(polygon_points)
-                is_drawing = False
+            fill_polygon()
         elif key == glfw.KEY_ESCAPE:
             glfw.set_window_should_close(window, True)
 
 
+def random_polygon(vertex_count, width, height, rng, star=True):
+    if star:
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertex_count))
+        radii = rng.uniform(0.2, 0.5, vertex_count) * min(width, height)
+        xs = np.clip(width / 2 + radii * np.cos(angles), 0, width - 1)
+        ys = np.clip(height / 2 + radii * np.sin(angles), 0, height - 1)
+    else:
+        xs = rng.uniform(0, width - 1, vertex_count)
+        ys = rng.uniform(0, height - 1, vertex_count)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def benchmark_rasterize(vertex_counts=(16, 128, 512), size=(3840, 2160), repeats=3, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    print(f"Polygon fill, {width}x{height}, best of {repeats}")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    print("| Polygon        | Original  | Vectorized| Speedup | Identical |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    for n, star in [(n, star) for star in (True, False) for n in vertex_counts]:
+        points = random_polygon(n, width, height, rng, star)
+        times = {}
+        buffers = {}
+        for name, func in (("original", rasterize_polygon_original), ("vectorized", rasterize_polygon)):
+            best = float("inf")
+            for _ in range(repeats):
+                buffer = np.ones((height, width, 3), dtype=np.float32)
+                start = time.perf_counter()
+                func(points, buffer)
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+            buffers[name] = buffer
+        same = np.array_equal(buffers["original"], buffers["vectorized"])
+        speedup = times["original"] / times["vectorized"]
+        label = f"{'star' if star else 'random'} {n}"
+        print(f"| {label:14} | {times['original'] * 1000:7.1f}ms | {times['vectorized'] * 1000:7.1f}ms "
+              f"| {speedup:6.1f}x | {str(same):>9} |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+
+
+def draw_lines_original(buffer, segments, color=(1.0, 0.0, 0.0)):
+    height, width = buffer.shape[:2]
+    for x0, y0, x1, y1 in segments:
+        for x, y in bresenham_line(int(x0), int(y0), int(x1), int(y1)):
+            if 0 <= x < width and 0 <= y < height:
+                buffer[y, x] = color
+
+
+def benchmark_lines(segment_counts=(100, 1000, 5000), size=(1920, 1080), repeats=3, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    print(f"Bresenham lines, {width}x{height}, best of {repeats}")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    print("| Segments       | Original  | Batched   | Speedup | Identical |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    for n in segment_counts:
+        # A quarter of the endpoints fall outside the viewport to exercise clipping.
+        segments = np.column_stack([
+            rng.integers(-width // 4, width + width // 4, n),
+            rng.integers(-height // 4, height + height // 4, n),
+            rng.integers(-width // 4, width + width // 4, n),
+            rng.integers(-height // 4, height + height // 4, n),
+        ])
+        times = {}
+        buffers = {}
+        for name, func in (("original", draw_lines_original), ("batched", draw_lines)):
+            best = float("inf")
+            for _ in range(1 if name == "original" else repeats):
+                buffer = np.ones((height, width, 3), dtype=np.float32)
+                start = time.perf_counter()
+                func(buffer, segments)
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+            buffers[name] = buffer
+        same = np.array_equal(buffers["original"], buffers["batched"])
+        print(f"| {n:14} | {times['original'] * 1000:7.1f}ms | {times['batched'] * 1000:7.1f}ms "
+              f"| {times['original'] / times['batched']:6.1f}x | {str(same):>9} |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+
+
+def benchmark_filter(sizes=((320, 240), (800, 600)), repeats=3, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"2x2 weighted average filter, best of {repeats}")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    print("| Size           | Original  | Sliced    | Speedup | Identical |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    for width, height in sizes:
+        buffer = rng.random((height, width, 3)).astype(np.float32)
+        out = np.empty_like(buffer)
+        start = time.perf_counter()
+        expected = apply_weighted_average_filter_original(buffer)
+        original = time.perf_counter() - start
+        sliced = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            apply_weighted_average_filter(buffer, out=out)
+            sliced = min(sliced, time.perf_counter() - start)
+        same = np.array_equal(expected, out)
+        label = f"{width}x{height}"
+        print(f"| {label:14} | {original * 1000:7.0f}ms | {sliced * 1000:7.1f}ms "
+              f"| {original / sliced:6.0f}x | {str(same):>9} |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+
+
+def create_hidden_context(width, height):
+    if not glfw.init():
+        return None
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+    window = glfw.create_window(width, height, "lab4 benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        return None
+    glfw.make_context_current(window)
+    return window
+
+
+def benchmark_framebuffer(size=(3840, 2160), repeats=10):
+    width, height = size
+    window = create_hidden_context(width, height)
+
+    def best_of(func):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            if window:
+                glFinish()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    results = []
+    buffer = np.ones((height, width, 3), dtype=np.float32)
+    clear = best_of(lambda: np.ones((height, width, 3), dtype=np.float32))
+    upload = best_of(lambda: glDrawPixels(width, height, GL_RGB, GL_FLOAT, buffer)) if window else None
+    results.append(("float32 array", buffer.nbytes, clear, upload))
+
+    for mode in ("float32", "rgba8"):
+        fb = FrameBuffer(width, height, mode)
+        clear = best_of(fb.clear)
+        upload = None
+        if window:
+            fb.upload()
+            upload = best_of(lambda: (fb.mark_all_dirty(), fb.upload()))
+            glDeleteTextures(1, [fb.texture_id])
+        results.append((f"{mode} FrameBuffer", fb.pixels.nbytes, clear, upload))
+
+    print(f"Frame buffer storage, {width}x{height}, best of {repeats}")
+    print("+---------------------+-----------+-----------+-----------+")
+    print("| Storage             | Memory    | Clear     | Upload    |")
+    print("+---------------------+-----------+-----------+-----------+")
+    for name, nbytes, clear, upload in results:
+        upload_str = f"{upload:7.2f}ms" if upload is not None else f"{'n/a':>9}"
+        print(f"| {name:19} | {nbytes / 2 ** 20:7.1f}MB | {clear:7.2f}ms | {upload_str} |")
+    print("+---------------------+-----------+-----------+-----------+")
+    if window:
+        glfw.destroy_window(window)
+        glfw.terminate()
+    else:
+        print("Upload times need a GL context and were skipped.")
+
+
 def main():
     if not glfw.init():
         sys.exit(1)
@@ -182,22 +747,6 @@ def main():
 
     while not glfw.window_should_close(window):
         glClear(GL_COLOR_BUFFER_BIT)
-
-        if polygon_points:
-            for x, y in polygon_points:
-                for dx in range(-2, 3):
-                    for dy in range(-2, 3):
-                        px, py = int(x) + dx, int(y) + dy
-                        if 0 <= px < window_width and 0 <= py < window_height:
-                            frame_buffer[py, px] = [1.0, 0.0, 0.0]
-
-            for i in range(len(polygon_points) - 1):
-                x0, y0 = polygon_points[i]
-                x1, y1 = polygon_points[i + 1]
-                for x, y in bresenham_line(int(x0), int(y0), int(x1), int(y1)):
-                    if 0 <= x < window_width and 0 <= y < window_height:
-                        frame_buffer[y, x] = [1.0, 0.0, 0.0]
-
         update_frame_buffer()
         glfw.swap_buffers(window)
         glfw.poll_events()
@@ -206,4 +755,15 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--bench" in sys.argv[1:]:
+        benchmark_rasterize()
+        benchmark_lines()
+        benchmark_filter()
+        benchmark_framebuffer()
+    else:
+        if "--float32" in sys.argv[1:]:
+            frame_buffer = FrameBuffer(window_width, window_height, "float32")
+        if "--tiled" in sys.argv[1:]:
+            import tiled_raster
+            tiled_rasterizer = tiled_raster.TiledRasterizer()
+        main()
\ No newline at end of file
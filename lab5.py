@@ -1,4 +1,12 @@
+import argparse
+import ctypes
 import glfw
+import numpy as np
+import sys
+import time
+
+import clip_volumes
+import segment_io
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
@@ -14,6 +22,9 @@ zmin, zmax = -1, 1
 
 angle_x, angle_y = 0, 0
 
+clip_engine = "cohen-sutherland"
+use_vbo = True
+
 
 def compute_outcode(x, y, z):
     code = INSIDE
@@ -160,6 +171,183 @@ def find_boundary_intersection(p_in, p_out):
         return (x, y, z)
     return None
 
+
+# Lowest set bit of every outcode as a plane number: 0 LEFT, 1 RIGHT, 2 BOTTOM,
+# 3 TOP, 4 NEAR, 5 FAR. Plane k lies on axis k // 2, on its max side if k is odd.
+LOWEST_PLANE = np.array([0] + [(code & -code).bit_length() - 1 for code in range(1, 64)], dtype=np.intp)
+
+
+def box_planes():
+    return np.array([xmin, xmax, ymin, ymax, zmin, zmax], dtype=np.float64)
+
+
+def compute_outcodes(points):
+    points = np.asarray(points)
+    x, y, z = points[..., 0], points[..., 1], points[..., 2]
+    # The two tests per axis are exclusive, so or-ing both bits matches the if/elif.
+    codes = (x < xmin).view(np.uint8) * np.uint8(LEFT)
+    codes |= (x > xmax).view(np.uint8) * np.uint8(RIGHT)
+    codes |= (y < ymin).view(np.uint8) * np.uint8(BOTTOM)
+    codes |= (y > ymax).view(np.uint8) * np.uint8(TOP)
+    codes |= (z < zmin).view(np.uint8) * np.uint8(NEAR)
+    codes |= (z > zmax).view(np.uint8) * np.uint8(FAR)
+    return codes
+
+
+def find_boundary_intersections(p_in, p_out, out):
+    # find_boundary_intersection for whole arrays: p_in lies inside the box,
+    # so the t of the first plane flagged in out is always within [0, 1].
+    plane = LOWEST_PLANE[out]
+    axis = plane // 2
+    rows = np.arange(len(plane))
+    x0 = p_in[rows, axis]
+    t = (box_planes()[plane] - x0) / (p_out[rows, axis] - x0)
+    return p_in + t[:, None] * (p_out - p_in)
+
+
+def cohen_sutherland_clip_external_batch(segments):
+    """Clip an (N, 2, 3) array of segments like cohen_sutherland_clip_external.
+
+    Returns the external pieces as a (K, 2, 3) array and, for every piece,
+    the index of the segment it came from. Pieces are ordered by source and
+    then in the order the scalar function returns them.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    p1, p2 = segments[:, 0], segments[:, 1]
+    code0, code1 = compute_outcodes(p1), compute_outcodes(p2)
+    pieces, sources, ranks = [], [], []
+    emitted = np.zeros(len(segments), dtype=np.intp)
+
+    def emit(source, start, end):
+        # A source emits at most once per call, so its running count is the
+        # position of this piece among the source's pieces.
+        pieces.append(np.stack([start, end], axis=1) if end is not None else start)
+        sources.append(source)
+        ranks.append(emitted[source])
+        emitted[source] += 1
+
+    # Trivially rejected segments are external as a whole.
+    rejected = np.flatnonzero(code0 & code1)
+    emit(rejected, segments[rejected], None)
+
+    leaving = np.flatnonzero((code0 == 0) & (code1 != 0))
+    emit(leaving, find_boundary_intersections(p1[leaving], p2[leaving], code1[leaving]), p2[leaving])
+
+    entering = np.flatnonzero((code0 != 0) & (code1 == 0))
+    emit(entering, p1[entering], find_boundary_intersections(p2[entering], p1[entering], code0[entering]))
+
+    # Both ends outside: clip one plane per pass on the segments still undecided.
+    active = np.flatnonzero((code0 != 0) & (code1 != 0) & ((code0 & code1) == 0))
+    start, end = p1[active], p2[active]
+    while len(active):
+        code0, code1 = compute_outcodes(start), compute_outcodes(end)
+        undecided = ((code0 & code1) == 0) & ((code0 != 0) | (code1 != 0))
+        active, start, end = active[undecided], start[undecided], end[undecided]
+        code0, code1 = code0[undecided], code1[undecided]
+        if not len(active):
+            break
+
+        out = np.where(code1 > code0, code1, code0)
+        plane = LOWEST_PLANE[out]
+        axis = plane // 2
+        rows = np.arange(len(active))
+        bound = box_planes()[plane]
+        origin = start[rows, axis]
+        # Same operation order as the scalar loop, so the results are bit-identical.
+        point = start + (end - start) * (bound - origin)[:, None] / (end[rows, axis] - origin)[:, None]
+        point[rows, axis] = bound
+
+        from_start = out == code0
+        emit(active[from_start], start[from_start], point[from_start])
+        emit(active[~from_start], point[~from_start], end[~from_start])
+        start[from_start] = point[from_start]
+        end[~from_start] = point[~from_start]
+
+    # Scatter the pieces so that each source's pieces are contiguous and in order.
+    sources = np.concatenate(sources)
+    positions = (np.cumsum(emitted) - emitted)[sources] + np.concatenate(ranks)
+    result = np.empty((len(sources), 2, 3))
+    # Moving each piece as one 48-byte record is much faster than six doubles.
+    record = np.dtype((np.void, result.itemsize * 6))
+    result.reshape(-1, 6).view(record)[positions, 0] = np.concatenate(pieces).reshape(-1, 6).view(record)[:, 0]
+    index = np.empty(len(sources), dtype=np.intp)
+    index[positions] = sources
+    return result, index
+
+
+def liang_barsky_clip_external(p1, p2):
+    # Entry and exit parameters of the box along p1 + t * (p2 - p1), in one pass.
+    t_enter, t_exit = 0.0, 1.0
+    for start, end, low, high in zip(p1, p2, (xmin, ymin, zmin), (xmax, ymax, zmax)):
+        delta = end - start
+        if delta == 0:
+            if start < low or start > high:
+                return [(p1, p2)]
+            continue
+        t_low = (low - start) / delta
+        t_high = (high - start) / delta
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        t_enter = max(t_enter, t_low)
+        t_exit = min(t_exit, t_high)
+
+    if t_enter >= t_exit:
+        # Misses the box or only touches it: the whole segment is external.
+        return [(p1, p2)]
+
+    result_segments = []
+    if t_enter > 0:
+        result_segments.append((p1, tuple(a + t_enter * (b - a) for a, b in zip(p1, p2))))
+    if t_exit < 1:
+        result_segments.append((tuple(a + t_exit * (b - a) for a, b in zip(p1, p2)), p2))
+    return result_segments
+
+
+def liang_barsky_clip_external_batch(segments):
+    """liang_barsky_clip_external over an (N, 2, 3) array, returned like
+    cohen_sutherland_clip_external_batch."""
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+    p1, p2 = segments[:, 0], segments[:, 1]
+    delta = p2 - p1
+    low = np.array([xmin, ymin, zmin], dtype=np.float64)
+    high = np.array([xmax, ymax, zmax], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_low = (low - p1) / delta
+        t_high = (high - p1) / delta
+    # An axis the segment runs parallel to either contains all of it or none.
+    parallel = delta == 0
+    inside = (p1 >= low) & (p1 <= high)
+    t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t_low, t_high))
+    t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t_low, t_high))
+    t_enter = np.maximum(t_near.max(axis=1), 0.0)
+    t_exit = np.minimum(t_far.min(axis=1), 1.0)
+
+    whole = t_enter >= t_exit
+    head = ~whole & (t_enter > 0)
+    tail = ~whole & (t_exit < 1)
+    counts = whole.astype(np.intp) + head + tail
+    offsets = np.cumsum(counts) - counts
+    result = np.empty((counts.sum(), 2, 3))
+    index = np.repeat(np.arange(len(segments)), counts)
+
+    rows = np.flatnonzero(whole)
+    result[offsets[rows]] = segments[rows]
+    rows = np.flatnonzero(head)
+    result[offsets[rows], 0] = p1[rows]
+    result[offsets[rows], 1] = p1[rows] + t_enter[rows, None] * delta[rows]
+    rows = np.flatnonzero(tail)
+    result[offsets[rows] + head[rows], 0] = p1[rows] + t_exit[rows, None] * delta[rows]
+    result[offsets[rows] + head[rows], 1] = p2[rows]
+    return result, index
+
+
+# name -> (one segment at a time, whole arrays)
+CLIP_ENGINES = {
+    "cohen-sutherland": (cohen_sutherland_clip_external, cohen_sutherland_clip_external_batch),
+    "liang-barsky": (liang_barsky_clip_external, liang_barsky_clip_external_batch),
+}
+
+
 def draw_segment(p1, p2, color=(1, 1, 1)):
     glColor3f(*color)
     glBegin(GL_LINES)
@@ -188,6 +376,83 @@ def draw_box():
     glEnd()
 
 
+def box_edges():
+    corners = np.array([
+        (xmin, ymin, zmin), (xmax, ymin, zmin),
+        (xmax, ymax, zmin), (xmin, ymax, zmin),
+        (xmin, ymin, zmax), (xmax, ymin, zmax),
+        (xmax, ymax, zmax), (xmin, ymax, zmax),
+    ], dtype=np.float64)
+    edges = np.array([
+        (0, 1), (1, 2), (2, 3), (3, 0),
+        (4, 5), (5, 6), (6, 7), (7, 4),
+        (0, 4), (1, 5), (2, 6), (3, 7)
+    ])
+    return corners[edges]
+
+
+class LineBuffer:
+    """Segments with a colour each in one VBO, drawn by a single glDrawArrays.
+
+    set_segments only repacks when given a different segment array, and the
+    buffer is uploaded on the next draw after that.
+    """
+
+    def __init__(self):
+        self.vbo = None
+        self.source = None
+        self.vertices = np.empty((0, 6), dtype=np.float32)
+        self.dirty = False
+
+    def set_segments(self, segments, colors=(1, 0, 0)):
+        if segments is self.source:
+            return
+        self.source = segments
+        segments = np.asarray(segments, dtype=np.float32).reshape(-1, 2, 3)
+        vertices = np.empty((len(segments), 2, 6), dtype=np.float32)
+        vertices[..., :3] = segments
+        # One colour for all, or an (N, 3) array with one per segment.
+        vertices[..., 3:] = np.asarray(colors, dtype=np.float32).reshape(-1, 1, 3)
+        self.vertices = vertices.reshape(-1, 6)
+        self.dirty = True
+
+    def upload(self):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.dirty = False
+
+    def draw(self):
+        if self.dirty:
+            self.upload()
+        if not len(self.vertices):
+            return
+        stride = 6 * 4
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glColorPointer(3, GL_FLOAT, stride, ctypes.c_void_p(3 * 4))
+        glDrawArrays(GL_LINES, 0, len(self.vertices))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+        self.source = None
+        self.dirty = bool(len(self.vertices))
+
+
+segment_lines = LineBuffer()
+box_lines = LineBuffer()
+box_key = None
+
+
 def input_segments():
     n = int(input("Введите количество отрезков: "))
     segments = []
@@ -199,6 +464,26 @@ def input_segments():
     return segments
 
 
+def read_segments(source=None, chunk_size=segment_io.CHUNK_SIZE, binary=None):
+    # The interactive prompt is the source when no file or stdin is given.
+    if source is None:
+        yield np.asarray(input_segments(), dtype=np.float64).reshape(-1, 2, 3)
+    else:
+        yield from segment_io.open_source(source, chunk_size, binary)
+
+
+def stream_clip(chunks, engine=None, volume=None, clipper=None):
+    # Clip chunk by chunk; source indices count from the start of the stream.
+    offset = 0
+    for chunk in chunks:
+        if clipper is not None:
+            pieces, index = clipper.clip(chunk)
+        else:
+            pieces, index = clip_segments_batch(chunk, engine, volume)
+        yield pieces, index + offset
+        offset += len(chunk)
+
+
 def key_callback(window, key, scancode, action, mods):
     global angle_x, angle_y
     if action == glfw.PRESS or action == glfw.REPEAT:
@@ -212,9 +497,223 @@ def key_callback(window, key, scancode, action, mods):
             angle_x += 5
 
 
-def main():
+def init_gl(width=800, height=600):
+    glEnable(GL_DEPTH_TEST)
+
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45, width / height, 0.1, 100.0)
+    glMatrixMode(GL_MODELVIEW)
+
+
+def clip_segments(segments, engine=None):
+    clip = CLIP_ENGINES[engine or clip_engine][0]
+    external_segments = []
+
+    for p1, p2 in segments:
+        clipped = clip(p1, p2)
+        external_segments.extend(clipped)
+    return external_segments
+
+
+def clip_segments_batch(segments, engine=None, volume=None):
+    # Any clip_volumes volume, or the xmin..zmax box through the chosen engine.
+    if volume is not None:
+        return clip_volumes.clip_external(segments, volume)
+    return CLIP_ENGINES[engine or clip_engine][1](segments)
+
+
+def random_segments(count, seed=0, extent=2.5):
+    # A tenth of the endpoints sit on the integer grid, so segments run along
+    # the box faces, parallel to axes and through its corners.
+    rng = np.random.default_rng(seed)
+    segments = rng.uniform(-extent, extent, (count, 2, 3))
+    segments[:count // 10] = np.round(segments[:count // 10])
+    return segments
+
+
+def external_intervals(segments, pieces, index, tolerance=1e-9):
+    """The parameter ranges along each source segment covered by its pieces.
+
+    Touching pieces are merged, so outputs that split or order the same
+    external parts differently give the same intervals. Returns the source,
+    start and end of every merged interval, grouped by source.
+    """
+    p1 = segments[index, 0]
+    delta = segments[index, 1] - p1
+    length2 = np.einsum("ij,ij->i", delta, delta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ikj,ij->ik", pieces - p1[:, None], delta) / length2[:, None]
+    t = np.where(length2[:, None] > 0, np.sort(t, axis=1), [0.0, 1.0])
+
+    order = np.lexsort((t[:, 0], index))
+    index, start, end = index[order], t[order, 0], t[order, 1]
+    new = np.ones(len(index), dtype=bool)
+    new[1:] = (index[1:] != index[:-1]) | (start[1:] > end[:-1] + tolerance)
+    groups = np.cumsum(new) - 1
+    merged_end = np.full(new.sum(), -np.inf)
+    np.maximum.at(merged_end, groups, end)
+    return index[new], start[new], merged_end
+
+
+def reference_intervals(segments):
+    """The external parameter ranges of every segment, from the slab
+    intersection with the box in extended precision. Returned like
+    external_intervals."""
+    segments = np.asarray(segments, dtype=np.longdouble)
+    p1, delta = segments[:, 0], segments[:, 1] - segments[:, 0]
+    t_enter = np.zeros(len(segments), dtype=np.longdouble)
+    t_exit = np.ones(len(segments), dtype=np.longdouble)
+    for axis, (low, high) in enumerate(((xmin, xmax), (ymin, ymax), (zmin, zmax))):
+        start, step = p1[:, axis], delta[:, axis]
+        moving = step != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_low, t_high = (low - start) / step, (high - start) / step
+        t_enter = np.where(moving, np.maximum(t_enter, np.minimum(t_low, t_high)), t_enter)
+        t_exit = np.where(moving, np.minimum(t_exit, np.maximum(t_low, t_high)), t_exit)
+        # Parallel to this slab and outside it: the segment misses the box.
+        t_exit = np.where(~moving & ((start < low) | (start > high)), -1, t_exit)
+    t_enter, t_exit = t_enter.astype(np.float64), t_exit.astype(np.float64)
+
+    # A segment that misses or only touches the box is external as a whole.
+    whole = t_enter >= t_exit
+    parts = [(np.flatnonzero(whole), 0.0, 1.0)]
+    rows = np.flatnonzero(~whole & (t_enter > 0))
+    parts.append((rows, 0.0, t_enter[rows]))
+    rows = np.flatnonzero(~whole & (t_exit < 1))
+    parts.append((rows, t_exit[rows], 1.0))
+    source = np.concatenate([rows for rows, _, _ in parts])
+    start = np.concatenate([np.broadcast_to(start, rows.shape) for rows, start, _ in parts])
+    end = np.concatenate([np.broadcast_to(end, rows.shape) for rows, _, end in parts])
+    order = np.lexsort((start, source))
+    return source[order], start[order], end[order]
+
+
+def interval_mismatches(count, intervals, expected, tolerance=1e-9):
+    # Both are grouped by source, so where the interval counts match they
+    # line up one to one.
+    source, start, end = intervals
+    expected_source, expected_start, expected_end = expected
+    equal_counts = np.bincount(source, minlength=count) == np.bincount(expected_source, minlength=count)
+    rows, expected_rows = equal_counts[source], equal_counts[expected_source]
+    close = (np.isclose(start[rows], expected_start[expected_rows], rtol=0, atol=tolerance)
+             & np.isclose(end[rows], expected_end[expected_rows], rtol=0, atol=tolerance))
+    return ~equal_counts | (np.bincount(source[rows][~close], minlength=count) > 0)
+
+
+def check_clip_engines(count=100000, extents=(1.2, 2.5, 6.0), seed=0, scalar_count=20000):
+    """Randomized comparison of both engines with reference_intervals.
+
+    An engine is right on a segment when its pieces cover the same parts of
+    it as the reference. Liang-Barsky has to be right on every segment, its
+    pieces cut from a segment must lie outside the box, and its scalar and
+    batch forms must agree. The Cohen-Sutherland count is only reported: the
+    lab's algorithm takes the first flagged plane rather than the nearest
+    for an end beyond several planes, and drops the middle part of a segment
+    with both ends outside that misses the box.
+    """
+    print(f"Clip engines against the reference, {count} random segments per extent")
+    print("+--------+-----------+-----------+----------+---------------+")
+    print("| Extent | CS wrong  | LB wrong  | LB valid | Scalar==batch |")
+    print("+--------+-----------+-----------+----------+---------------+")
+    ok = True
+    for extent in extents:
+        segments = random_segments(count, seed, extent)
+        expected = reference_intervals(segments)
+        cs_pieces, cs_index = cohen_sutherland_clip_external_batch(segments)
+        lb_pieces, lb_index = liang_barsky_clip_external_batch(segments)
+        cs_wrong = int(np.count_nonzero(
+            interval_mismatches(count, external_intervals(segments, cs_pieces, cs_index), expected)))
+        lb_wrong = int(np.count_nonzero(
+            interval_mismatches(count, external_intervals(segments, lb_pieces, lb_index), expected)))
+
+        # A segment that only touches the box comes back whole and may touch it mid-way.
+        cut = ~np.all(lb_pieces == segments[lb_index], axis=(1, 2))
+        valid = not np.any(compute_outcodes(lb_pieces[cut].mean(axis=1)) == 0)
+        scalar = clip_segments(segments[:scalar_count].tolist(), "liang-barsky")
+        batch = lb_pieces[lb_index < scalar_count]
+        scalar_same = len(scalar) == len(batch) and np.array_equal(np.array(scalar).reshape(-1, 2, 3), batch)
+
+        ok &= lb_wrong == 0 and valid and scalar_same
+        print(f"| {extent:6.1f} | {cs_wrong:9} | {lb_wrong:9} | {str(valid):>8} | {str(scalar_same):>13} |")
+    print("+--------+-----------+-----------+----------+---------------+")
+    return ok
+
+
+def benchmark_clip(segment_counts=(10000, 100000, 1000000), scalar_limit=100000, repeats=3, seed=0):
+    print(f"Clipping external segments, best of {repeats}")
+    print("+------------+-----------+-----------+-----------+-----------+")
+    print("| Segments   | CS scalar | CS batch  | LB scalar | LB batch  |")
+    print("+------------+-----------+-----------+-----------+-----------+")
+    for n in segment_counts:
+        segments = random_segments(n, seed)
+        items = segments.tolist()
+        cells = []
+        for engine in ("cohen-sutherland", "liang-barsky"):
+            for batch in (False, True):
+                if not batch and n > scalar_limit:
+                    cells.append(f"{'-':>9}")
+                    continue
+                best = float("inf")
+                for _ in range(1 if not batch else repeats):
+                    start = time.perf_counter()
+                    if batch:
+                        clip_segments_batch(segments, engine)
+                    else:
+                        clip_segments(items, engine)
+                    best = min(best, time.perf_counter() - start)
+                cells.append(f"{best * 1000:7.1f}ms")
+        print(f"| {n:10} | {' | '.join(cells)} |")
+    print("+------------+-----------+-----------+-----------+-----------+")
+
+
+def render(external_segments, colors=(1, 0, 0)):
+    global box_key
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glLoadIdentity()
+    glTranslatef(0.0, 0.0, -5.0)
+    glRotatef(angle_x, 1, 0, 0)
+    glRotatef(angle_y, 0, 1, 0)
+
+    if use_vbo:
+        # Rotating only changes the matrix; the buffers are re-uploaded only
+        # for a new segment array or a moved box.
+        box = (xmin, xmax, ymin, ymax, zmin, zmax)
+        if box != box_key:
+            box_lines.set_segments(box_edges(), (1, 1, 1))
+            box_key = box
+        box_lines.draw()
+        segment_lines.set_segments(external_segments, colors)
+        segment_lines.draw()
+        return
+
+    draw_box()
+
+    for p1, p2 in external_segments:
+        draw_segment(p1, p2, color=(1, 0, 0))
+
+
+def clip_source(source=None, chunk_size=segment_io.CHUNK_SIZE, binary=None, workers=None):
+    if not workers:
+        yield from stream_clip(read_segments(source, chunk_size, binary))
+        return
+    import parallel_clip
+    # Each chunk read is split into chunk_size shards, one per worker. The
+    # settings are passed on since this module may be running as __main__.
+    box = (xmin, xmax, ymin, ymax, zmin, zmax)
+    with parallel_clip.ParallelClipper(workers, chunk_size, clip_engine, box) as clipper:
+        yield from stream_clip(read_segments(source, chunk_size * workers, binary), clipper=clipper)
+
+
+def main(source=None, chunk_size=segment_io.CHUNK_SIZE, binary=None, export=None, workers=None):
     global angle_x, angle_y
 
+    if export is not None:
+        chunks = clip_source(source, chunk_size, binary, workers)
+        count = segment_io.export_chunks((pieces for pieces, _ in chunks), export)
+        print(f"{count} external segments -> {export}", file=sys.stderr)
+        return
+
     if not glfw.init():
         return
 
@@ -225,36 +724,43 @@ def main():
 
     glfw.make_context_current(window)
     glfw.set_key_callback(window, key_callback)
-    glEnable(GL_DEPTH_TEST)
-
-    glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-    gluPerspective(45, 800 / 600, 0.1, 100.0)
-    glMatrixMode(GL_MODELVIEW)
-
-    segments = input_segments()
-    external_segments = []
+    init_gl(800, 600)
 
-    for p1, p2 in segments:
-        clipped = cohen_sutherland_clip_external(p1, p2)
-        external_segments.extend(clipped)
+    # Only the clipped output is kept; the input is dropped chunk by chunk.
+    clipped = [pieces for pieces, _ in clip_source(source, chunk_size, binary, workers)]
+    external_segments = np.concatenate(clipped) if clipped else np.empty((0, 2, 3))
 
     while not glfw.window_should_close(window):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glLoadIdentity()
-        glTranslatef(0.0, 0.0, -5.0)
-        glRotatef(angle_x, 1, 0, 0)
-        glRotatef(angle_y, 0, 1, 0)
-
-        draw_box()
-
-        for p1, p2 in external_segments:
-            draw_segment(p1, p2, color=(1, 0, 0))
+        render(external_segments)
 
         glfw.swap_buffers(window)
         glfw.poll_events()
 
+    segment_lines.release()
+    box_lines.release()
     glfw.terminate()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Clip segments against the box and show the external parts.")
+    parser.add_argument("source", nargs="?",
+                        help="segment file (text/CSV, or float32 .bin/.f32) or - for stdin; "
+                             "prompts for the segments when omitted")
+    parser.add_argument("--binary", action="store_true", default=None,
+                        help="read the source as float32 even without a .bin/.f32 extension")
+    parser.add_argument("--chunk-size", type=int, default=segment_io.CHUNK_SIZE)
+    parser.add_argument("--export", help="write the external segments to this file (- for stdout) "
+                                         "instead of opening a window")
+    parser.add_argument("--workers", type=int, help="clip on this many processes (see parallel_clip.py)")
+    parser.add_argument("--liang-barsky", action="store_true")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark_clip()
+    elif args.check:
+        sys.exit(0 if check_clip_engines() else 1)
+    else:
+        if args.liang_barsky:
+            clip_engine = "liang-barsky"
+        main(args.source, args.chunk_size, args.binary, args.export, args.workers)
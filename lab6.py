@@ -2,11 +2,13 @@ import glfw
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *  # Add GLUT import
-import numpy as np
-from PIL import Image
+import sys
 import time
 import math
 
+import scene_graph
+import textures
+
 width, height = 800, 600
 
 y_pos = 2.0
@@ -21,6 +23,18 @@ camera_angle_y = 45.0
 use_texture = True
 light_enabled = True
 rotate_cube = True
+rotation_angle = 0.0
+texture_manager = None
+cube_texture = None
+# Decode tex.bmp in the background and draw with the checkerboard until it
+# is uploaded (--async).
+async_textures = False
+texture_loader = None
+
+scene = None
+cube_node = None
+camera_key = None
+view_matrix = None
 
 fps_update_interval = 0.5
 fps_last_update = time.time()
@@ -98,34 +112,10 @@ def update_fps():
 
 def load_texture(path):
     try:
-        img = Image.open(path)
-        img_data = np.array(list(img.convert("RGB").getdata()), np.uint8)
-
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, img.width, img.height, 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
-
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-
-        return tex_id
+        return texture_manager.load(path)
     except Exception as e:
         print(f"Ошибка загрузки текстуры: {e}")
-        texture_data = np.zeros((64, 64, 3), dtype=np.uint8)
-        for i in range(64):
-            for j in range(64):
-                c = 255 if (i // 8 + j // 8) % 2 == 0 else 0
-                texture_data[i, j] = [c, c, c]
-
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, 64, 64, 0, GL_RGB, GL_UNSIGNED_BYTE, texture_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
-
-        return tex_id
+        return texture_manager.add("checkerboard", textures.checkerboard())
 
 
 def init_lighting():
@@ -186,9 +176,10 @@ def draw_cube(rotation_angle=0.0):
         (1.0, 0.0, 1.0), (0.0, 1.0, 1.0)
     ]
 
-    texcoords = [
+    # The texture may be a region of an atlas page.
+    texcoords = cube_texture.map_uv([
         (0, 0), (1, 0), (1, 1), (0, 1)
-    ]
+    ])
     glBegin(GL_QUADS)
     for face in range(6):
         glNormal3fv(normals[face])
@@ -227,10 +218,11 @@ def draw_floor():
         glEnable(GL_LIGHTING)
 
 
-def update_position():
+def update_position(dt=None):
     global y_pos, y_vel, last_time
     current_time = time.time()
-    dt = current_time - last_time
+    if dt is None:
+        dt = current_time - last_time
     last_time = current_time
 
     dt = min(dt, 0.1)
@@ -268,12 +260,86 @@ def key_callback(window, key, scancode, action, mods):
         elif key == glfw.KEY_R:
             rotate_cube = not rotate_cube
             print(f"Вращение {'включено' if rotate_cube else 'выключено'}")
+        elif key == glfw.KEY_I:
+            print(f"Текстуры: {texture_manager.stats()}")
 
 
-def main():
-    global texture_id
-    rotation_angle = 0.0
+def init_gl():
+    global texture_manager, cube_texture, texture_loader
+    glViewport(0, 0, width, height)
+    glEnable(GL_DEPTH_TEST)
+
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45, width / height, 0.1, 100.0)
+
+    texture_manager = textures.TextureManager(mip_cache=textures.MIP_CACHE_DIR)
+    if async_textures:
+        texture_loader = textures.TextureLoader(texture_manager)
+        texture_loader.load("./tex.bmp")
+        cube_texture = texture_manager.add("checkerboard", textures.checkerboard())
+    else:
+        texture_loader = None
+        cube_texture = load_texture("./tex.bmp")
+    init_lighting()
+
+    glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+    build_scene()
+
+
+def update_textures():
+    global cube_texture
+    for request in texture_loader.update():
+        if request.error is not None:
+            print(f"Ошибка загрузки текстуры: {request.error}")
+        else:
+            cube_texture = request.texture
+
+
+def bind_cube_texture():
+    if use_texture:
+        glEnable(GL_TEXTURE_2D)
+        texture_manager.bind(cube_texture)
+    else:
+        glDisable(GL_TEXTURE_2D)
+
 
+def build_scene():
+    global scene, cube_node
+    # The floor goes first and leaves the texture state alone, as before.
+    floor = scene_graph.Node("floor", mesh=draw_floor, material=scene_graph.Material("floor", order=0))
+    cube_node = scene_graph.Node("cube", mesh=lambda: draw_cube(rotation_angle),
+                                 material=scene_graph.Material("cube", bind_cube_texture, order=1))
+    scene = scene_graph.Scene(scene_graph.Node("root", children=[floor, cube_node]))
+
+
+def camera_view():
+    global camera_key, view_matrix
+    # Only recomputed when the camera moves.
+    key = (camera_distance, camera_angle_x, camera_angle_y)
+    if key != camera_key:
+        eye = scene_graph.orbit_eye(*key)
+        view_matrix = scene_graph.look_at(eye, (0, 0, 0), (0, 1, 0))
+        camera_key = key
+    return view_matrix
+
+
+def render_frame(dt=None):
+    global rotation_angle
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    if texture_loader is not None:
+        update_textures()
+
+    update_position(dt)
+    cube_node.local = scene_graph.translation(0.0, y_pos, 0.0)
+    scene.draw(camera_view())
+
+    # Update rotation angle
+    if rotate_cube:
+        rotation_angle += 1.0
+
+
+def main():
     if not glfw.init():
         print("Не удалось инициализировать GLFW")
         return
@@ -289,55 +355,29 @@ def main():
     glfw.swap_interval(0)
     glfw.set_key_callback(window, key_callback)
 
-    glViewport(0, 0, width, height)
-    glEnable(GL_DEPTH_TEST)
-
-    glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-    gluPerspective(45, width / height, 0.1, 100.0)
-
-    texture_id = load_texture("./tex.bmp")
-    init_lighting()
-
-    glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+    start = time.perf_counter()
+    init_gl()
+    first_frame = True
 
     while not glfw.window_should_close(window):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-
-        x = camera_distance * math.sin(math.radians(camera_angle_y)) * math.cos(math.radians(camera_angle_x))
-        y = camera_distance * math.sin(math.radians(camera_angle_x))
-        z = camera_distance * math.cos(math.radians(camera_angle_y)) * math.cos(math.radians(camera_angle_x))
-
-        gluLookAt(x, y, z, 0, 0, 0, 0, 1, 0)
-
-        update_position()
+        render_frame()
         update_fps()
 
-        draw_floor()
-
-        if use_texture:
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, texture_id)
-        else:
-            glDisable(GL_TEXTURE_2D)
-
-        glPushMatrix()
-        glTranslatef(0.0, y_pos, 0.0)
-        draw_cube(rotation_angle)
-        glPopMatrix()
-
-        # Update rotation angle
-        if rotate_cube:
-            rotation_angle += 1.0
-
         draw_fps_text(current_fps)
 
         glfw.swap_buffers(window)
+        if first_frame:
+            print(f"Первый кадр через {(time.perf_counter() - start) * 1000:.1f} мс")
+            first_frame = False
+        if texture_loader is not None and texture_loader.frame_done():
+            print(f"Текстуры загружены за {texture_loader.loaded * 1000:.1f} мс, "
+                  f"худший кадр {texture_loader.worst_frame * 1000:.1f} мс")
         glfw.poll_events()
 
+    if texture_loader is not None:
+        texture_loader.close()
     glfw.terminate()
 
 if __name__ == "__main__":
+    async_textures = "--async" in sys.argv[1:]
     main()
\ No newline at end of file
@@ -1,12 +1,19 @@
 import glfw
 from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 import numpy as np
-from PIL import Image
+import argparse
+import csv
+import json
+import sys
 import time
 import math
 
+import scene_graph
+import textures
+
 width, height = 800, 600
 
 y_pos = 2.0
@@ -27,56 +34,301 @@ fps_last_update = time.time()
 fps_frame_count = 0
 current_fps = 0
 
-perf_data = {
-    "original": [],
-    "optimized": []
-}
-perf_start_time = 0
-measuring_performance = False
+# Render strategies by name, see register_variant. M cycles through them in
+# this order and an Experiment (P) times them against each other.
+VARIANTS = {}
 current_mode = "original"
+# Cubes drawn per frame, on an x/z grid CUBE_SPACING apart (--cubes).
+cube_count = 1
+CUBE_SPACING = 1.5
+# The running P measurement and where its report goes (--report; None
+# prints it).
+experiment = None
+experiment_options = {}
+report_path = None
 
 cube_dl = None
 floor_dl = None
 cube_vao = None
 cube_vbo = None
+cube_ebo = None
+# The instanced variant's VAO and its per-cube offsets, uploaded for
+# cube_offsets_count cubes.
+cube_instanced_vao = None
+cube_offset_vbo = None
+cube_offsets_count = None
+texture_manager = None
+cube_texture = None
+# Decode tex.bmp in the background and draw with the checkerboard until it
+# is uploaded (--async).
+async_textures = False
+texture_loader = None
+rotation_angle = 0.0
+cube_program = None
+cube_uniforms = {}
+# The (width, height) the program's projection uniform was set for.
+cube_projection_size = None
+
+# The light and material init_lighting sets up, shared with the shader.
+LIGHT_AMBIENT = [0.2, 0.2, 0.2, 1.0]
+LIGHT_DIFFUSE = [0.7, 0.7, 0.7, 1.0]
+LIGHT_SPECULAR = [1.0, 1.0, 1.0, 1.0]
+LIGHT_POSITION = [3.0, 5.0, 5.0, 1.0]
+SPOT_DIRECTION = [-0.6, -1.0, -1.0]
+SPOT_CUTOFF = 30.0
+SPOT_EXPONENT = 15.0
+ATTENUATION = [0.5, 0.05, 0.01]
+MATERIAL_SPECULAR = [1.0, 1.0, 1.0, 1.0]
+MATERIAL_SHININESS = 50.0
+# GL's default GL_LIGHT_MODEL_AMBIENT.
+SCENE_AMBIENT = [0.2, 0.2, 0.2]
+# The other modes light the cube with GL_COLOR_MATERIAL and whatever color
+# is current, which is the one the floor's grid lines leave behind.
+CUBE_COLOR = [0.5, 0.5, 0.5]
+
+CUBE_VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 normal;
+layout(location = 2) in vec2 texcoord;
+// Where this cube sits in the grid. Read per instance by the instanced
+// variant; the attribute array is off otherwise, so it reads as zero.
+layout(location = 3) in vec3 offset;
+uniform mat4 view;
+uniform mat4 model;
+uniform mat4 projection;
+out vec3 eye_position;
+out vec3 eye_normal;
+out vec2 frag_texcoord;
+
+void main() {
+    vec4 eye = view * (model * vec4(position, 1.0) + vec4(offset, 0.0));
+    eye_position = eye.xyz;
+    // Rotations and translations only, so normals need no inverse transpose.
+    eye_normal = mat3(view) * (mat3(model) * normal);
+    frag_texcoord = texcoord;
+    gl_Position = projection * eye;
+}
+"""
+
+# The fixed-function lighting equation for one spotlight, per fragment. The
+# light is in eye space: init_lighting sets it with an identity modelview.
+CUBE_FRAGMENT_SHADER = """
+#version 330 core
+in vec3 eye_position;
+in vec3 eye_normal;
+in vec2 frag_texcoord;
+uniform vec3 light_position;
+uniform vec3 spot_direction;
+uniform float spot_cos_cutoff;
+uniform float spot_exponent;
+uniform vec3 attenuation;
+uniform vec3 light_ambient;
+uniform vec3 light_diffuse;
+uniform vec3 light_specular;
+uniform vec3 scene_ambient;
+uniform vec3 material_color;
+uniform vec3 material_specular;
+uniform float shininess;
+uniform bool lighting;
+uniform bool use_texture;
+uniform sampler2D texture_map;
+out vec4 out_color;
+
+void main() {
+    vec3 color = material_color;
+    if (lighting) {
+        vec3 n = normalize(eye_normal);
+        vec3 to_light = light_position - eye_position;
+        float d = length(to_light);
+        vec3 l = to_light / d;
+        float spot = dot(-l, spot_direction);
+        spot = spot >= spot_cos_cutoff ? pow(spot, spot_exponent) : 0.0;
+        float falloff = spot / (attenuation.x + attenuation.y * d + attenuation.z * d * d);
+        float diffuse = max(dot(n, l), 0.0);
+        // GL_LIGHT_MODEL_LOCAL_VIEWER is off: the viewer is along +z.
+        float specular = diffuse > 0.0 ? pow(max(dot(n, normalize(l + vec3(0.0, 0.0, 1.0))), 0.0), shininess) : 0.0;
+        color = scene_ambient * material_color
+            + falloff * (light_ambient * material_color + diffuse * light_diffuse * material_color
+                         + specular * light_specular * material_specular);
+        color = clamp(color, 0.0, 1.0);
+    }
+    if (use_texture) {
+        color *= texture(texture_map, frag_texcoord).rgb;
+    }
+    out_color = vec4(color, 1.0);
+}
+"""
+
+
+# Two-sided 95% Student t quantiles for up to 10 degrees of freedom.
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228}
+
+
+def t_95(df):
+    # Past the table, the Cornish-Fisher expansion around z = 1.96 is
+    # within 0.003 of the exact quantile.
+    return T_95[df] if df in T_95 else 1.96 + 2.372 / df + 2.82 / df ** 2
+
+
+class Experiment:
+    """Times render variants against each other in interleaved trials.
+
+    Every trial runs each variant for warmup untimed frames and then for
+    duration seconds of timed frames. The order rotates by one variant per
+    trial, so drift over the run (clocks, heat, caches) does not favour the
+    variants that happen to go first. The confidence interval is over the
+    trial means, which are closer to independent than single frames.
+    """
+
+    def __init__(self, variants, warmup=30, duration=2.0, trials=3, cubes=1):
+        unknown = [variant for variant in variants if variant not in VARIANTS]
+        if unknown:
+            raise ValueError(f"Unknown render variants: {', '.join(unknown)}")
+        if trials < 1 or duration <= 0:
+            raise ValueError("An experiment needs at least one trial and a positive duration")
+        self.variants = list(variants)
+        # The first frame after a switch has no previous frame to time from.
+        self.warmup = max(warmup, 1)
+        self.duration = duration
+        self.trials = trials
+        self.cubes = cubes
+        count = len(self.variants)
+        self.schedule = [(trial, self.variants[(trial + i) % count]) for trial in range(trials) for i in range(count)]
+        self.frame_times = {variant: [[] for _ in range(trials)] for variant in self.variants}
+        self.step = 0
+        self.frames = 0
+        self.last_frame = None
+        self.timed_since = None
+
+    @property
+    def done(self):
+        return self.step >= len(self.schedule)
+
+    @property
+    def variant(self):
+        return self.schedule[self.step][1]
+
+    def frame_done(self):
+        """Call once per presented frame; times it and moves on to the next
+        variant when this one has had its duration."""
+        now = time.perf_counter()
+        trial, variant = self.schedule[self.step]
+        self.frames += 1
+        if self.frames > self.warmup:
+            self.frame_times[variant][trial].append(now - self.last_frame)
+        elif self.frames == self.warmup:
+            self.timed_since = now
+        self.last_frame = now
+        if self.timed_since is not None and now - self.timed_since >= self.duration:
+            self.step += 1
+            self.frames = 0
+            self.timed_since = None
+
+    def report(self):
+        results = {}
+        for variant in self.variants:
+            trials = [np.asarray(times) * 1000 for times in self.frame_times[variant] if times]
+            if not trials:
+                # Stopped before this variant had a timed frame.
+                results[variant] = dict.fromkeys(REPORT_STATS, None)
+                results[variant].update(frames=0, trial_mean_ms=[])
+                continue
+            ms = np.concatenate(trials)
+            trial_means = np.array([times.mean() for times in trials])
+            center = trial_means.mean()
+            half = None
+            if len(trial_means) > 1:
+                half = t_95(len(trial_means) - 1) * trial_means.std(ddof=1) / math.sqrt(len(trial_means))
+            results[variant] = {
+                "frames": len(ms),
+                "mean_ms": float(ms.mean()),
+                "ci95_ms": None if half is None else [float(center - half), float(center + half)],
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "min_ms": float(ms.min()),
+                "max_ms": float(ms.max()),
+                "fps": float(1000 / ms.mean()),
+                "trial_mean_ms": trial_means.tolist(),
+            }
+        baseline = results[self.variants[0]]["mean_ms"]
+        for result in results.values():
+            result["speedup"] = baseline / result["mean_ms"] if baseline and result["mean_ms"] else None
+        return {
+            "config": {
+                "variants": self.variants,
+                "warmup": self.warmup,
+                "duration": self.duration,
+                "trials": self.trials,
+                "cubes": self.cubes,
+                "size": [width, height],
+                "texture": use_texture,
+                "lighting": light_enabled,
+                "rotate": rotate_cube,
+            },
+            "variants": results,
+        }
+
+
+# The per-variant numbers of a report, and its CSV columns.
+REPORT_STATS = ("mean_ms", "ci95_ms", "p50_ms", "p90_ms", "p95_ms", "p99_ms", "min_ms", "max_ms", "fps", "speedup")
+REPORT_COLUMNS = ("frames", "mean_ms", "ci95_low_ms", "ci95_high_ms", "p50_ms", "p90_ms", "p95_ms", "p99_ms",
+                  "min_ms", "max_ms", "fps", "speedup")
+
+
+def write_report(report, path=None):
+    """Writes an Experiment report as JSON, or as one CSV row per variant
+    when path ends in .csv (the config is left out). No path prints JSON."""
+    if path is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    if not path.lower().endswith(".csv"):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("variant",) + REPORT_COLUMNS + ("trial_mean_ms",))
+        for variant, result in report["variants"].items():
+            low, high = result["ci95_ms"] or ("", "")
+            row = dict(result, ci95_low_ms=low, ci95_high_ms=high)
+            writer.writerow([variant] + [row[column] for column in REPORT_COLUMNS]
+                            + [" ".join(f"{mean:.4f}" for mean in result["trial_mean_ms"])])
+
+
+def start_experiment():
+    global experiment
+    options = dict(experiment_options)
+    experiment = Experiment(options.pop("variants", list(VARIANTS)), cubes=cube_count, **options)
+    print(f"Measuring {', '.join(experiment.variants)}: {experiment.trials} trials, "
+          f"{experiment.duration:g} s each, {cube_count} cubes...")
+
+
+def finish_experiment():
+    global experiment
+    write_report(experiment.report(), report_path)
+    if report_path is not None:
+        print(f"Report written to {report_path}")
+    experiment = None
+
+
+def run_experiment(experiment, render):
+    """Runs experiment to the end without a window. render(frame) draws
+    lab7's current frame and presents it; returns the report."""
+    global current_mode, cube_count
+    cube_count = experiment.cubes
+    frame = 0
+    while not experiment.done:
+        current_mode = experiment.variant
+        render(frame)
+        experiment.frame_done()
+        frame += 1
+    return experiment.report()
 
 
-def init_performance_measurement():
-    global perf_data, measuring_performance, perf_start_time, current_mode
-    perf_data = {"original": [], "optimized": []}
-    measuring_performance = True
-    perf_start_time = time.time()
-    current_mode = "original"
-    print("Starting performance measurement...")
-
-
-def save_performance_data():
-    global perf_data
-    print("\nPerformance results:")
-    print("+----------------+-----------+-----------+")
-    print("| Frame          | Original  | Optimized |")
-    print("+----------------+-----------+-----------+")
-
-    max_frames = max(len(perf_data["original"]), len(perf_data["optimized"]))
-    original_avg = sum(perf_data["original"]) / len(perf_data["original"]) if perf_data["original"] else 0
-    optimized_avg = sum(perf_data["optimized"]) / len(perf_data["optimized"]) if perf_data["optimized"] else 0
-
-    for i in range(max_frames):
-        orig = perf_data["original"][i] if i < len(perf_data["original"]) else "-"
-        opt = perf_data["optimized"][i] if i < len(perf_data["optimized"]) else "-"
-
-        orig_str = f"{orig:8.2f}" if isinstance(orig, (int, float)) else f"{orig:>8}"
-        opt_str = f"{opt:8.2f}" if isinstance(opt, (int, float)) else f"{opt:>8}"
-
-        print(f"| Frame {i + 1:8} | {orig_str} | {opt_str} |")
-
-    print("+----------------+-----------+-----------+")
-    print(f"| Average FPS    | {original_avg:8.2f} | {optimized_avg:8.2f} |")
-    print("+----------------+-----------+-----------+\n")
-
-    improvement = ((optimized_avg - original_avg) / original_avg * 100) if original_avg != 0 else 0
-    print(f"Performance improvement: {improvement:.2f}%")
-
 def draw_fps_text(fps):
     glMatrixMode(GL_PROJECTION)
     glPushMatrix()
@@ -123,8 +375,7 @@ def draw_fps_text(fps):
 
 
 def update_fps():
-    global fps_frame_count, fps_last_update, current_fps, measuring_performance, perf_data, current_mode
-    global perf_start_time
+    global fps_frame_count, fps_last_update, current_fps
     fps_frame_count += 1
     current_time = time.time()
     time_diff = current_time - fps_last_update
@@ -134,47 +385,13 @@ def update_fps():
         fps_frame_count = 0
         fps_last_update = current_time
 
-        if measuring_performance:
-            perf_data[current_mode].append(current_fps)
-
-            if current_time - perf_start_time > 5 and current_mode == "original":
-                current_mode = "optimized"
-                perf_start_time = current_time
-            elif current_time - perf_start_time > 5 and current_mode == "optimized":
-                measuring_performance = False
-                save_performance_data()
-
 
 def load_texture(path):
     try:
-        img = Image.open(path)
-        img_data = np.array(list(img.convert("RGB").getdata()), np.uint8)
-
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, img.width, img.height, 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
-
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-
-        return tex_id
+        return texture_manager.load(path)
     except Exception as e:
         print(f"Texture loading error: {e}")
-        texture_data = np.zeros((64, 64, 3), dtype=np.uint8)
-        for i in range(64):
-            for j in range(64):
-                c = 255 if (i // 8 + j // 8) % 2 == 0 else 0
-                texture_data[i, j] = [c, c, c]
-
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, 64, 64, 0, GL_RGB, GL_UNSIGNED_BYTE, texture_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
-
-        return tex_id
+        return texture_manager.add("checkerboard", textures.checkerboard())
 
 
 def init_lighting():
@@ -185,40 +402,57 @@ def init_lighting():
     glEnable(GL_COLOR_MATERIAL)
     glColorMaterial(GL_FRONT, GL_AMBIENT_AND_DIFFUSE)
 
-    mat_specular = [1.0, 1.0, 1.0, 1.0]
-    mat_shininess = [50.0]
-
-    glMaterialfv(GL_FRONT, GL_SPECULAR, mat_specular)
-    glMaterialfv(GL_FRONT, GL_SHININESS, mat_shininess)
-
-    light_ambient = [0.2, 0.2, 0.2, 1.0]
-    light_diffuse = [0.7, 0.7, 0.7, 1.0]
-    light_specular = [1.0, 1.0, 1.0, 1.0]
-    light_position = [3.0, 5.0, 5.0, 1.0]
-    spot_direction = [-0.6, -1.0, -1.0]
+    glMaterialfv(GL_FRONT, GL_SPECULAR, MATERIAL_SPECULAR)
+    glMaterialfv(GL_FRONT, GL_SHININESS, [MATERIAL_SHININESS])
 
-    glLightfv(GL_LIGHT0, GL_AMBIENT, light_ambient)
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, light_diffuse)
-    glLightfv(GL_LIGHT0, GL_SPECULAR, light_specular)
-    glLightfv(GL_LIGHT0, GL_POSITION, light_position)
-    glLightf(GL_LIGHT0, GL_SPOT_CUTOFF, 30.0)
-    glLightfv(GL_LIGHT0, GL_SPOT_DIRECTION, spot_direction)
-    glLightf(GL_LIGHT0, GL_SPOT_EXPONENT, 15.0)
+    glLightfv(GL_LIGHT0, GL_AMBIENT, LIGHT_AMBIENT)
+    glLightfv(GL_LIGHT0, GL_DIFFUSE, LIGHT_DIFFUSE)
+    glLightfv(GL_LIGHT0, GL_SPECULAR, LIGHT_SPECULAR)
+    glLightfv(GL_LIGHT0, GL_POSITION, LIGHT_POSITION)
+    glLightf(GL_LIGHT0, GL_SPOT_CUTOFF, SPOT_CUTOFF)
+    glLightfv(GL_LIGHT0, GL_SPOT_DIRECTION, SPOT_DIRECTION)
+    glLightf(GL_LIGHT0, GL_SPOT_EXPONENT, SPOT_EXPONENT)
 
     # Optimized: Adjust attenuation for better performance
-    glLightf(GL_LIGHT0, GL_CONSTANT_ATTENUATION, 0.5)
-    glLightf(GL_LIGHT0, GL_LINEAR_ATTENUATION, 0.05)
-    glLightf(GL_LIGHT0, GL_QUADRATIC_ATTENUATION, 0.01)
+    glLightf(GL_LIGHT0, GL_CONSTANT_ATTENUATION, ATTENUATION[0])
+    glLightf(GL_LIGHT0, GL_LINEAR_ATTENUATION, ATTENUATION[1])
+    glLightf(GL_LIGHT0, GL_QUADRATIC_ATTENUATION, ATTENUATION[2])
+
+
+def init_cube_program():
+    global cube_program, cube_uniforms, cube_projection_size
+    cube_program = compileProgram(compileShader(CUBE_VERTEX_SHADER, GL_VERTEX_SHADER),
+                                  compileShader(CUBE_FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+    names = ("view", "model", "projection", "light_position", "spot_direction", "spot_cos_cutoff",
+             "spot_exponent", "attenuation", "light_ambient", "light_diffuse", "light_specular", "scene_ambient",
+             "material_color", "material_specular", "shininess", "lighting", "use_texture", "texture_map")
+    cube_uniforms = {name: glGetUniformLocation(cube_program, name) for name in names}
+
+    # The light and material do not change, so they are set once.
+    u = cube_uniforms
+    glUseProgram(cube_program)
+    glUniform3fv(u["light_position"], 1, LIGHT_POSITION[:3])
+    glUniform3fv(u["spot_direction"], 1, SPOT_DIRECTION / np.linalg.norm(SPOT_DIRECTION))
+    glUniform1f(u["spot_cos_cutoff"], math.cos(math.radians(SPOT_CUTOFF)))
+    glUniform1f(u["spot_exponent"], SPOT_EXPONENT)
+    glUniform3fv(u["attenuation"], 1, ATTENUATION)
+    glUniform3fv(u["light_ambient"], 1, LIGHT_AMBIENT[:3])
+    glUniform3fv(u["light_diffuse"], 1, LIGHT_DIFFUSE[:3])
+    glUniform3fv(u["light_specular"], 1, LIGHT_SPECULAR[:3])
+    glUniform3fv(u["scene_ambient"], 1, SCENE_AMBIENT)
+    glUniform3fv(u["material_color"], 1, CUBE_COLOR)
+    glUniform3fv(u["material_specular"], 1, MATERIAL_SPECULAR[:3])
+    glUniform1f(u["shininess"], MATERIAL_SHININESS)
+    glUniform1i(u["texture_map"], 0)
+    glUseProgram(0)
+    cube_projection_size = None
 
 
 def create_cube_display_list():
+    # Takes the current color and lighting state, like draw_cube_original.
     dl = glGenLists(1)
     glNewList(dl, GL_COMPILE)
 
-    glEnable(GL_LIGHTING)
-    glColor3f(0.3, 0.3, 0.3)
-
-
     vertices = [
         (-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5),
         (-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (0.5, -0.5, -0.5),
@@ -234,7 +468,7 @@ def create_cube_display_list():
         (1, 0, 0), (-1, 0, 0)
     ]
 
-    texcoords = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    texcoords = cube_texture.map_uv([(0, 0), (1, 0), (1, 1), (0, 1)])
 
     glBegin(GL_QUADS)
     for face in range(6):
@@ -277,8 +511,16 @@ def create_floor_display_list():
     return dl
 
 
+def cube_vertex_attributes():
+    # Position, normal and texcoord from the bound cube_vbo.
+    stride = 8 * 4
+    for location, size, offset in ((0, 3, 0), (1, 3, 3), (2, 2, 6)):
+        glEnableVertexAttribArray(location)
+        glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * 4))
+
+
 def init_vertex_array_object():
-    global cube_vao, cube_vbo
+    global cube_vao, cube_vbo, cube_ebo, cube_instanced_vao, cube_offset_vbo, cube_offsets_count
 
     vertices = np.array([
         [-0.5, -0.5, 0.5, 0.0, 0.0, 1.0, 0.0, 0.0],
@@ -311,6 +553,8 @@ def init_vertex_array_object():
         [-0.5, 0.5, 0.5, -1.0, 0.0, 0.0, 1.0, 1.0],
         [-0.5, 0.5, -0.5, -1.0, 0.0, 0.0, 0.0, 1.0]
     ], dtype=np.float32)
+    # The texture may be a region of an atlas page.
+    vertices[:, 6:8] = cube_texture.map_uv(vertices[:, 6:8])
 
     cube_vao = glGenVertexArrays(1)
     glBindVertexArray(cube_vao)
@@ -319,19 +563,37 @@ def init_vertex_array_object():
     glBindBuffer(GL_ARRAY_BUFFER, cube_vbo)
     glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
 
-    stride = 8 * 4
-
-    glEnableVertexAttribArray(0)
-    glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
+    cube_vertex_attributes()
 
-    glEnableVertexAttribArray(1)
-    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(3 * 4))
+    # Two triangles per face for the shader path, which does not use GL_QUADS.
+    indices = (np.arange(0, 24, 4, dtype=np.uint16)[:, None] + np.array([0, 1, 2, 0, 2, 3], dtype=np.uint16)).ravel()
+    cube_ebo = glGenBuffers(1)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, cube_ebo)
+    glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
 
-    glEnableVertexAttribArray(2)
-    glVertexAttribPointer(2, 2, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(6 * 4))
+    # The same cube plus one grid offset per instance, for the instanced
+    # variant.
+    cube_instanced_vao = glGenVertexArrays(1)
+    glBindVertexArray(cube_instanced_vao)
+    glBindBuffer(GL_ARRAY_BUFFER, cube_vbo)
+    cube_vertex_attributes()
+    cube_offset_vbo = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, cube_offset_vbo)
+    glEnableVertexAttribArray(3)
+    glVertexAttribPointer(3, 3, GL_FLOAT, GL_FALSE, 0, None)
+    glVertexAttribDivisor(3, 1)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, cube_ebo)
+    cube_offsets_count = None
 
     glBindBuffer(GL_ARRAY_BUFFER, 0)
     glBindVertexArray(0)
+    # Unbound only after the VAOs, which keep the element buffer binding.
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+
+def delete_vertex_array_objects():
+    glDeleteVertexArrays(2, [cube_vao, cube_instanced_vao])
+    glDeleteBuffers(3, [cube_vbo, cube_ebo, cube_offset_vbo])
 
 
 def draw_cube_original(rotation_angle):
@@ -350,7 +612,7 @@ def draw_cube_original(rotation_angle):
         (1, 0, 0), (-1, 0, 0)
     ]
 
-    texcoords = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    texcoords = cube_texture.map_uv([(0, 0), (1, 0), (1, 1), (0, 1)])
 
     glBegin(GL_QUADS)
     for face in range(6):
@@ -373,6 +635,68 @@ def draw_cube_optimized(rotation_angle):
     glBindVertexArray(0)
 
 
+def draw_cube_display_list(rotation_angle):
+    glCallList(cube_dl)
+
+
+def use_cube_program(view, model):
+    global cube_projection_size
+    u = cube_uniforms
+    glUseProgram(cube_program)
+    # numpy matrices are row-major, hence the transpose flag.
+    glUniformMatrix4fv(u["view"], 1, GL_TRUE, view.astype(np.float32))
+    glUniformMatrix4fv(u["model"], 1, GL_TRUE, model.astype(np.float32))
+    if cube_projection_size != (width, height):
+        projection = scene_graph.perspective(45, width / height, 0.1, 100.0)
+        glUniformMatrix4fv(u["projection"], 1, GL_TRUE, projection.astype(np.float32))
+        cube_projection_size = width, height
+    glUniform1i(u["lighting"], light_enabled)
+    glUniform1i(u["use_texture"], use_texture)
+
+
+def draw_cubes_shader(view, model, offsets):
+    # One model upload and draw call per cube.
+    use_cube_program(view, model)
+    models = np.repeat(model[None].astype(np.float32), len(offsets), axis=0)
+    models[:, :3, 3] += offsets
+    glBindVertexArray(cube_vao)
+    for matrix in models:
+        glUniformMatrix4fv(cube_uniforms["model"], 1, GL_TRUE, matrix)
+        glDrawElements(GL_TRIANGLES, 36, GL_UNSIGNED_SHORT, None)
+    glBindVertexArray(0)
+    glUseProgram(0)
+
+
+def draw_cubes_instanced(view, model, offsets):
+    # Every cube in one draw call; the offsets only change with cube_count.
+    global cube_offsets_count
+    use_cube_program(view, model)
+    glBindVertexArray(cube_instanced_vao)
+    if cube_offsets_count != len(offsets):
+        glBindBuffer(GL_ARRAY_BUFFER, cube_offset_vbo)
+        glBufferData(GL_ARRAY_BUFFER, offsets.nbytes, offsets, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        cube_offsets_count = len(offsets)
+    glDrawElementsInstanced(GL_TRIANGLES, 36, GL_UNSIGNED_SHORT, None, len(offsets))
+    glBindVertexArray(0)
+    glUseProgram(0)
+
+
+def fixed_function_cubes(draw_cube):
+    """Wraps a draw_cube(rotation_angle) that draws one cube at the origin
+    into a draw_cubes for register_variant, through the matrix stack."""
+    def draw_cubes(view, model, offsets):
+        # The camera's view is on the modelview stack already.
+        model = np.ascontiguousarray(model.T)
+        for offset in offsets.tolist():
+            glPushMatrix()
+            glTranslatef(*offset)
+            glMultMatrixd(model)
+            draw_cube(rotation_angle)
+            glPopMatrix()
+    return draw_cubes
+
+
 def draw_floor_original():
     glDisable(GL_LIGHTING)
     glColor3f(0.3, 0.3, 0.3)
@@ -400,10 +724,36 @@ def draw_floor_optimized():
     glCallList(floor_dl)
 
 
-def update_position():
+def cube_offsets(count):
+    # A square x/z grid centred on the origin, filled row by row.
+    side = max(1, math.ceil(math.sqrt(count)))
+    cells = np.stack(np.divmod(np.arange(count), side), axis=1)
+    offsets = np.zeros((count, 3), dtype=np.float32)
+    offsets[:, [0, 2]] = (cells - (side - 1) / 2) * CUBE_SPACING
+    return offsets
+
+
+def register_variant(name, draw_floor, draw_cubes):
+    """Adds a render strategy. draw_floor() is called with the camera's view
+    on the modelview stack; draw_cubes(view, model, offsets) draws one cube
+    at model moved by each row of offsets, and gets the view as a matrix
+    for paths that do not use the matrix stack."""
+    VARIANTS[name] = (draw_floor, draw_cubes)
+
+
+register_variant("original", draw_floor_original, fixed_function_cubes(draw_cube_original))
+register_variant("display_list", draw_floor_optimized, fixed_function_cubes(draw_cube_display_list))
+# The cube VAO through the fixed-function pipeline.
+register_variant("optimized", draw_floor_optimized, fixed_function_cubes(draw_cube_optimized))
+register_variant("shader", draw_floor_optimized, draw_cubes_shader)
+register_variant("instanced", draw_floor_optimized, draw_cubes_instanced)
+
+
+def update_position(dt=None):
     global y_pos, y_vel, last_time
     current_time = time.time()
-    dt = current_time - last_time
+    if dt is None:
+        dt = current_time - last_time
     last_time = current_time
 
     dt = min(dt, 0.1)
@@ -418,7 +768,7 @@ def update_position():
 
 def key_callback(window, key, scancode, action, mods):
     global use_texture, light_enabled, rotate_cube, y_pos, y_vel
-    global camera_distance, camera_angle_x, camera_angle_y, measuring_performance
+    global camera_distance, camera_angle_x, camera_angle_y, current_mode
 
     if action == glfw.PRESS:
         if key == glfw.KEY_T:
@@ -442,28 +792,17 @@ def key_callback(window, key, scancode, action, mods):
             rotate_cube = not rotate_cube
             print(f"Rotation {'enabled' if rotate_cube else 'disabled'}")
         elif key == glfw.KEY_P:
-            init_performance_measurement()
-            print("Performance measurement started")
+            start_experiment()
+        elif key == glfw.KEY_M:
+            names = list(VARIANTS)
+            current_mode = names[(names.index(current_mode) + 1) % len(names)]
+            print(f"Mode: {current_mode}")
+        elif key == glfw.KEY_I:
+            print(f"Textures: {texture_manager.stats()}")
 
 
-def main():
-    global cube_dl, floor_dl, cube_vao, cube_vbo, current_mode
-
-    if not glfw.init():
-        print("Failed to initialize GLFW")
-        return
-
-    glutInit()
-    window = glfw.create_window(width, height, "OpenGL Optimization Lab", None, None)
-    if not window:
-        print("Failed to create GLFW window")
-        glfw.terminate()
-        return
-
-    glfw.make_context_current(window)
-    glfw.swap_interval(0)
-    glfw.set_key_callback(window, key_callback)
-
+def init_gl():
+    global cube_dl, floor_dl, texture_manager, cube_texture, texture_loader
     glViewport(0, 0, width, height)
     glEnable(GL_DEPTH_TEST)
 
@@ -476,69 +815,159 @@ def main():
     glLoadIdentity()
     gluPerspective(45, width / height, 0.1, 100.0)
 
-    texture_id = load_texture("./tex.bmp")
+    texture_manager = textures.TextureManager(mip_cache=textures.MIP_CACHE_DIR)
+    if async_textures:
+        texture_loader = textures.TextureLoader(texture_manager)
+        texture_loader.load("./tex.bmp")
+        cube_texture = texture_manager.add("checkerboard", textures.checkerboard())
+    else:
+        texture_loader = None
+        cube_texture = load_texture("./tex.bmp")
     init_lighting()
 
     cube_dl = create_cube_display_list()
     floor_dl = create_floor_display_list()
     init_vertex_array_object()
+    init_cube_program()
 
-    rotation_angle = 0.0
 
-    while not glfw.window_should_close(window):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        if light_enabled:
-            glEnable(GL_LIGHTING)
-            glEnable(GL_LIGHT0)
-        else:
-            glDisable(GL_LIGHTING)
-
-        if use_texture:
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, texture_id)
-        else:
-            glDisable(GL_TEXTURE_2D)
-
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        x = camera_distance * math.sin(math.radians(camera_angle_y)) * math.cos(math.radians(camera_angle_x))
-        y = camera_distance * math.sin(math.radians(camera_angle_x))
-        z = camera_distance * math.cos(math.radians(camera_angle_y)) * math.cos(math.radians(camera_angle_x))
-        gluLookAt(x, y, z, 0, 0, 0, 0, 1, 0)
-
-        update_position()
-        update_fps()
+def release_gl():
+    glDeleteLists(cube_dl, 1)
+    glDeleteLists(floor_dl, 1)
+    delete_vertex_array_objects()
+    glDeleteProgram(cube_program)
+    texture_manager.release()
+    if texture_loader is not None:
+        texture_loader.close()
+
+
+def update_textures():
+    global cube_texture, cube_dl
+    for request in texture_loader.update():
+        if request.error is not None:
+            print(f"Texture loading error: {request.error}")
+            continue
+        cube_texture = request.texture
+        # The texcoords are baked into the display list and the VBO.
+        glDeleteLists(cube_dl, 1)
+        delete_vertex_array_objects()
+        cube_dl = create_cube_display_list()
+        init_vertex_array_object()
+
+
+def render_frame(dt=None):
+    global rotation_angle
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    if texture_loader is not None:
+        update_textures()
 
-        if current_mode == "optimized":
-            draw_floor_optimized()
-        else:
-            draw_floor_original()
+    if light_enabled:
+        glEnable(GL_LIGHTING)
+        glEnable(GL_LIGHT0)
+    else:
+        glDisable(GL_LIGHTING)
 
-        glPushMatrix()
-        glTranslatef(0.0, y_pos, 0.0)
-        if rotate_cube:
-            rotation_angle += 1.0
-            glRotatef(rotation_angle, 1, 1, 1)
+    if use_texture:
+        glEnable(GL_TEXTURE_2D)
+        texture_manager.bind(cube_texture)
+    else:
+        glDisable(GL_TEXTURE_2D)
+
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    eye = scene_graph.orbit_eye(camera_distance, camera_angle_x, camera_angle_y)
+    gluLookAt(*eye, 0, 0, 0, 0, 1, 0)
+
+    update_position(dt)
+
+    draw_floor, draw_cubes = VARIANTS[current_mode]
+    draw_floor()
+
+    model = scene_graph.translation(0.0, y_pos, 0.0)
+    if rotate_cube:
+        rotation_angle += 1.0
+        model = model @ scene_graph.rotation(rotation_angle, 1, 1, 1)
+    draw_cubes(scene_graph.look_at(eye, (0, 0, 0), (0, 1, 0)), model, cube_offsets(cube_count))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bouncing cube lab with switchable render variants (M) "
+                                                 "and an interleaved timing experiment (P).")
+    parser.add_argument("--async", dest="async_textures", action="store_true",
+                        help="decode the texture in the background")
+    parser.add_argument("--cubes", type=int, default=1, help="cubes drawn per frame")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS),
+                        help="variants the experiment compares; the first is the baseline")
+    parser.add_argument("--warmup", type=int, default=30, help="untimed frames before each timed run")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per variant and trial")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--report", help="experiment report file, CSV if it ends in .csv, otherwise JSON "
+                                         "(default: print JSON)")
+    parser.add_argument("--run", action="store_true", help="start the experiment right away and quit after it")
+    args = parser.parse_args(argv)
+    if args.trials < 1:
+        parser.error("--trials must be at least 1")
+    if args.duration <= 0:
+        parser.error("--duration must be positive")
+    return args
+
+
+def main(argv=None):
+    global async_textures, cube_count, experiment_options, report_path, current_mode
+    args = parse_args(argv)
+    async_textures = args.async_textures
+    cube_count = args.cubes
+    experiment_options = {"variants": args.variants, "warmup": args.warmup, "duration": args.duration,
+                          "trials": args.trials}
+    report_path = args.report
+
+    if not glfw.init():
+        print("Failed to initialize GLFW")
+        return
+
+    glutInit()
+    window = glfw.create_window(width, height, "OpenGL Optimization Lab", None, None)
+    if not window:
+        print("Failed to create GLFW window")
+        glfw.terminate()
+        return
+
+    glfw.make_context_current(window)
+    glfw.swap_interval(0)
+    glfw.set_key_callback(window, key_callback)
 
-        if current_mode == "optimized":
-            draw_cube_optimized(rotation_angle)
-        else:
-            draw_cube_original(rotation_angle)
-        glPopMatrix()
+    start = time.perf_counter()
+    init_gl()
+    first_frame = True
+    if args.run:
+        start_experiment()
+
+    while not glfw.window_should_close(window):
+        if experiment is not None:
+            current_mode = experiment.variant
+        render_frame()
+        update_fps()
 
         draw_fps_text(current_fps)
 
         glfw.swap_buffers(window)
+        if first_frame:
+            print(f"First frame after {(time.perf_counter() - start) * 1000:.1f} ms")
+            first_frame = False
+        if texture_loader is not None and texture_loader.frame_done():
+            print(f"Textures loaded in {texture_loader.loaded * 1000:.1f} ms, "
+                  f"worst frame {texture_loader.worst_frame * 1000:.1f} ms")
+        if experiment is not None:
+            experiment.frame_done()
+            if experiment.done:
+                finish_experiment()
+                if args.run:
+                    break
         glfw.poll_events()
 
 
-    glDeleteLists(cube_dl, 1)
-    glDeleteLists(floor_dl, 1)
-    glDeleteVertexArrays(1, [cube_vao])
-    glDeleteBuffers(1, [cube_vbo])
+    release_gl()
     glfw.terminate()
 
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,141 @@
+"""Clip lab5 segments on several cores.
+
+    python parallel_clip.py --segments 2000000 --workers 1 2 4 8
+    python lab5.py big.bin --workers 4 --export out.bin
+
+The segments are copied once into a shared memory block; the pool workers
+map it and clip their (start, stop) ranges in place, so the input is never
+pickled. Only the external pieces come back, and they are gathered in input
+order.
+"""
+import argparse
+import os
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import numpy as np
+
+import lab5
+
+CHUNK_SIZE = 65536
+
+# Per worker: the attached shared memory blocks by name.
+attached = {}
+
+
+def init_worker(box, engine):
+    lab5.xmin, lab5.xmax, lab5.ymin, lab5.ymax, lab5.zmin, lab5.zmax = box
+    lab5.clip_engine = engine
+
+
+def shared_segments(name, count):
+    block = attached.get(name)
+    if block is None:
+        for old in attached.values():
+            old.close()
+        attached.clear()
+        # Workers share the parent's resource tracker, and the parent unlinks the block.
+        block = shared_memory.SharedMemory(name=name)
+        attached[name] = block
+    return np.ndarray((count, 2, 3), dtype=np.float64, buffer=block.buf)
+
+
+def clip_range(task):
+    name, count, start, stop = task
+    pieces, index = lab5.clip_segments_batch(shared_segments(name, count)[start:stop])
+    return pieces, index + start
+
+
+class ParallelClipper:
+    def __init__(self, workers=None, chunk_size=CHUNK_SIZE, engine=None, box=None):
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        box = box or (lab5.xmin, lab5.xmax, lab5.ymin, lab5.ymax, lab5.zmin, lab5.zmax)
+        # Started before the pool, so the workers inherit it instead of each
+        # starting a tracker that would unlink the block when they exit.
+        resource_tracker.ensure_running()
+        self.pool = Pool(self.workers, initializer=init_worker, initargs=(box, engine or lab5.clip_engine))
+        self.block = None
+        self.capacity = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def clip(self, segments):
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+        count = len(segments)
+        if count == 0:
+            return np.empty((0, 2, 3)), np.empty(0, dtype=np.intp)
+        if count > self.capacity:
+            # Grow geometrically so a stream of similar chunks reuses one block.
+            self.release_block()
+            self.capacity = max(count, 2 * self.capacity)
+            self.block = shared_memory.SharedMemory(create=True, size=self.capacity * segments[0].nbytes)
+        np.ndarray(segments.shape, dtype=np.float64, buffer=self.block.buf)[...] = segments
+
+        tasks = [(self.block.name, count, start, min(start + self.chunk_size, count))
+                 for start in range(0, count, self.chunk_size)]
+        results = self.pool.map(clip_range, tasks)
+        return np.concatenate([pieces for pieces, _ in results]), np.concatenate([index for _, index in results])
+
+    def release_block(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+            self.capacity = 0
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.release_block()
+
+
+def benchmark_parallel(segment_count=2000000, worker_counts=(1, 2, 4), chunk_size=CHUNK_SIZE,
+                       engine="cohen-sutherland", repeats=3, seed=0):
+    segments = lab5.random_segments(segment_count, seed)
+    start = time.perf_counter()
+    expected = lab5.clip_segments_batch(segments, engine)
+    serial = time.perf_counter() - start
+
+    print(f"Parallel {engine} clipping, {segment_count} segments, chunks of {chunk_size}, "
+          f"{os.cpu_count()} CPUs, best of {repeats}")
+    print("+------------+-----------+-------------+---------+------------+-----------+")
+    print("| Workers    | Time      | Segments/s  | Speedup | Efficiency | Identical |")
+    print("+------------+-----------+-------------+---------+------------+-----------+")
+    print(f"| {'serial':10} | {serial * 1000:7.1f}ms | {segment_count / serial:11.3g} | {'-':>7} | {'-':>10} | {'-':>9} |")
+    # Scaling is measured against one pool worker, or the serial run without it.
+    baseline = serial
+    for workers in sorted(worker_counts):
+        with ParallelClipper(workers, chunk_size, engine) as clipper:
+            clipper.clip(segments[:1])
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                result = clipper.clip(segments)
+                best = min(best, time.perf_counter() - start)
+        if workers == 1:
+            baseline = best
+        speedup = baseline / best
+        same = all(np.array_equal(a, b) for a, b in zip(result, expected))
+        print(f"| {workers:10} | {best * 1000:7.1f}ms | {segment_count / best:11.3g} | {speedup:6.2f}x "
+              f"| {speedup / workers * 100:9.0f}% | {str(same):>9} |")
+    print("+------------+-----------+-------------+---------+------------+-----------+")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure lab5 clipping throughput over worker processes.")
+    parser.add_argument("--segments", type=int, default=2000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--engine", choices=tuple(lab5.CLIP_ENGINES), default="cohen-sutherland")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+    benchmark_parallel(args.segments, args.workers, args.chunk_size, args.engine, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""A small retained-mode scene graph for the labs.
+
+Nodes hold a local 4x4 transform (NumPy, acting on column vectors like the
+GL matrix stack), an optional mesh and an optional material. World matrices
+are computed lazily: changing a node's transform only marks it and its
+subtree dirty, and a world matrix is rebuilt from its parent's the next time
+it is asked for. Scene.draw_list() flattens the graph into (world, mesh,
+material) items sorted by material, and only walks the graph again after
+nodes were added, removed or given another mesh or material.
+
+A mesh is anything with a draw() method (lab3.EllipsoidMesh,
+lab5.LineBuffer, ...) or a plain function that draws.
+"""
+import math
+
+import numpy as np
+
+# Bumped by every structural change, so cached draw lists know when to rebuild.
+structure_version = 0
+
+
+def structure_changed():
+    global structure_version
+    structure_version += 1
+
+
+def identity():
+    return np.eye(4)
+
+
+def translation(x, y, z):
+    m = np.eye(4)
+    m[:3, 3] = x, y, z
+    return m
+
+
+def scaling(x, y=None, z=None):
+    return np.diag([x, x if y is None else y, x if z is None else z, 1.0])
+
+
+def rotation(angle, x, y, z):
+    # Same matrix as glRotatef(angle, x, y, z).
+    axis = np.array([x, y, z], dtype=np.float64)
+    x, y, z = axis / np.linalg.norm(axis)
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    m = np.eye(4)
+    m[:3, :3] = [
+        [x * x * (1 - c) + c, x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, y * y * (1 - c) + c, y * z * (1 - c) - x * s],
+        [x * z * (1 - c) - y * s, y * z * (1 - c) + x * s, z * z * (1 - c) + c],
+    ]
+    return m
+
+
+def look_at(eye, target, up):
+    # Same matrix as gluLookAt.
+    eye, target, up = (np.asarray(v, dtype=np.float64) for v in (eye, target, up))
+    forward = target - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+    m = np.eye(4)
+    m[0, :3], m[1, :3], m[2, :3] = side, up, -forward
+    return m @ translation(*-eye)
+
+
+def perspective(fov_y, aspect, near, far):
+    # Same matrix as gluPerspective.
+    f = 1 / math.tan(math.radians(fov_y) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0],
+    ])
+
+
+def orbit_eye(distance, angle_x, angle_y):
+    # The camera position lab6 and lab7 orbit the origin with.
+    x = distance * math.sin(math.radians(angle_y)) * math.cos(math.radians(angle_x))
+    y = distance * math.sin(math.radians(angle_x))
+    z = distance * math.cos(math.radians(angle_y)) * math.cos(math.radians(angle_x))
+    return x, y, z
+
+
+class Material:
+    """Render state shared by nodes. apply is called once before a run of
+    nodes with this material; order sorts materials in the draw list."""
+
+    def __init__(self, name, apply=None, order=0):
+        self.name = name
+        self.apply = apply
+        self.order = order
+
+    @property
+    def key(self):
+        return self.order, self.name
+
+
+DEFAULT_MATERIAL = Material("default")
+
+
+class Node:
+    def __init__(self, name=None, transform=None, mesh=None, material=None, children=()):
+        self.name = name
+        self.parent = None
+        self.children = []
+        self._local = identity() if transform is None else np.asarray(transform, dtype=np.float64)
+        self._world = identity()
+        self.dirty = True
+        self._mesh = mesh
+        self._material = material
+        for child in children:
+            self.add(child)
+
+    def __repr__(self):
+        return f"Node({self.name!r})"
+
+    @property
+    def local(self):
+        return self._local
+
+    @local.setter
+    def local(self, matrix):
+        self._local = np.asarray(matrix, dtype=np.float64)
+        self.mark_dirty()
+
+    @property
+    def mesh(self):
+        return self._mesh
+
+    @mesh.setter
+    def mesh(self, mesh):
+        self._mesh = mesh
+        structure_changed()
+
+    @property
+    def material(self):
+        # Inherited from the closest ancestor that has one.
+        node = self
+        while node is not None:
+            if node._material is not None:
+                return node._material
+            node = node.parent
+        return DEFAULT_MATERIAL
+
+    @material.setter
+    def material(self, material):
+        self._material = material
+        structure_changed()
+
+    def mark_dirty(self):
+        # A dirty node's subtree is always dirty, so the walk stops there.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.dirty and node is not self:
+                continue
+            node.dirty = True
+            stack.extend(node.children)
+
+    @property
+    def world(self):
+        if self.dirty:
+            if self.parent is None:
+                self._world = self._local
+            else:
+                self._world = self.parent.world @ self._local
+            self.dirty = False
+        return self._world
+
+    def add(self, child):
+        if child.parent is not None:
+            child.parent.remove(child)
+        child.parent = self
+        self.children.append(child)
+        child.mark_dirty()
+        structure_changed()
+        return child
+
+    def remove(self, child):
+        self.children.remove(child)
+        child.parent = None
+        child.mark_dirty()
+        structure_changed()
+
+    def traverse(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def find(self, name):
+        return next((node for node in self.traverse() if node.name == name), None)
+
+
+class Scene:
+    def __init__(self, root=None):
+        self.root = root or Node("root")
+        self.nodes = []
+        self.version = None
+
+    def draw_list(self):
+        """(world, mesh, material) for every node with a mesh, grouped by
+        material, in graph order within a material."""
+        if self.version != structure_version:
+            nodes = [node for node in self.root.traverse() if node.mesh is not None]
+            self.nodes = sorted(nodes, key=lambda node: node.material.key)
+            self.version = structure_version
+        return [(node.world, node.mesh, node.material) for node in self.nodes]
+
+    def draw(self, view=None):
+        draw_items(self.draw_list(), view)
+
+
+def draw_items(items, view=None):
+    from OpenGL.GL import GL_MODELVIEW, glLoadMatrixd, glMatrixMode
+
+    view = identity() if view is None else view
+    glMatrixMode(GL_MODELVIEW)
+    material = None
+    for world, mesh, item_material in items:
+        if item_material is not material:
+            material = item_material
+            if material.apply is not None:
+                material.apply()
+        # GL reads matrices column by column.
+        glLoadMatrixd(np.ascontiguousarray((view @ world).T))
+        if hasattr(mesh, "draw"):
+            mesh.draw()
+        else:
+            mesh()
@@ -0,0 +1,140 @@
+"""Streaming segment input and output for lab5.
+
+Segments are six numbers, x1 y1 z1 x2 y2 z2. Text files hold one segment per
+line, separated by whitespace or commas; blank lines, lines starting with #
+and a CSV header are skipped. Binary files are raw little-endian float32,
+24 bytes per segment, and are read through np.memmap. Every reader yields
+(N, 2, 3) float64 chunks of at most chunk_size segments, so a file of any
+size is processed in bounded memory.
+"""
+import itertools
+import os
+import sys
+
+import numpy as np
+
+CHUNK_SIZE = 65536
+BINARY_EXTENSIONS = (".bin", ".f32")
+BINARY_DTYPE = np.dtype("<f4")
+
+
+def is_data(line):
+    return line.strip() and not line.lstrip().startswith("#")
+
+
+def parse_lines(lines, first_line=1, header=True):
+    """Segments of text lines numbered from first_line. With header, the
+    first line that is not blank or a comment may be a header instead."""
+    data = [line.replace(",", " ") for line in lines if is_data(line)]
+    # Checking only the total would let a short line borrow values from the
+    # next one, so every line is counted.
+    if all(len(line.split()) == 6 for line in data):
+        try:
+            return np.array(" ".join(data).split(), dtype=np.float64).reshape(-1, 2, 3)
+        except ValueError:
+            pass
+
+    # Slow path, only to skip a header or point at the bad line.
+    rows = []
+    for number, line in enumerate(lines, first_line):
+        if not is_data(line):
+            continue
+        fields = line.replace(",", " ").split()
+        try:
+            row = [float(field) for field in fields]
+        except ValueError:
+            if header:
+                header = False
+                continue
+            raise ValueError(f"line {number}: not a number in {line.strip()!r}") from None
+        header = False
+        if len(row) != 6:
+            raise ValueError(f"line {number}: expected 6 values, got {len(row)}")
+        rows.append(row)
+    return np.array(rows, dtype=np.float64).reshape(-1, 2, 3)
+
+
+def read_text(file, chunk_size=CHUNK_SIZE):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file) as f:
+            yield from read_text(f, chunk_size)
+        return
+    first_line = 1
+    # A header can only come before the first segment, and chunks that are
+    # all blank lines and comments do not move that.
+    header = True
+    while True:
+        lines = list(itertools.islice(file, chunk_size))
+        if not lines:
+            return
+        chunk = parse_lines(lines, first_line, header)
+        first_line += len(lines)
+        header = header and not any(map(is_data, lines))
+        if len(chunk):
+            yield chunk
+
+
+def read_binary(path, chunk_size=CHUNK_SIZE):
+    size = os.path.getsize(path)
+    if size % (6 * BINARY_DTYPE.itemsize):
+        raise ValueError(f"{path}: size {size} is not a whole number of float32 segments")
+    if not size:
+        return
+    segments = np.memmap(path, dtype=BINARY_DTYPE, mode="r").reshape(-1, 2, 3)
+    for start in range(0, len(segments), chunk_size):
+        # Only this slice is paged in and converted.
+        yield segments[start:start + chunk_size].astype(np.float64)
+
+
+def read_binary_stream(stream, chunk_size=CHUNK_SIZE):
+    record = 6 * BINARY_DTYPE.itemsize
+    while True:
+        data = stream.read(chunk_size * record)
+        if not data:
+            return
+        while len(data) % record:
+            more = stream.read(record - len(data) % record)
+            if not more:
+                raise ValueError("input ends inside a segment")
+            data += more
+        yield np.frombuffer(data, dtype=BINARY_DTYPE).reshape(-1, 2, 3).astype(np.float64)
+
+
+def open_source(source, chunk_size=CHUNK_SIZE, binary=None):
+    """Chunks from a path, or from stdin for "-". binary defaults to the
+    file extension, and to text for stdin."""
+    if source == "-":
+        if binary:
+            return read_binary_stream(sys.stdin.buffer, chunk_size)
+        return read_text(sys.stdin, chunk_size)
+    if binary is None:
+        binary = os.path.splitext(source)[1].lower() in BINARY_EXTENSIONS
+    return read_binary(source, chunk_size) if binary else read_text(source, chunk_size)
+
+
+def write_text(file, segments):
+    np.savetxt(file, np.asarray(segments).reshape(-1, 6), fmt="%.9g")
+
+
+def write_binary(file, segments):
+    file.write(np.asarray(segments, dtype=BINARY_DTYPE).reshape(-1, 6).tobytes())
+
+
+def export_chunks(chunks, path, binary=None):
+    """Write chunks to path (or stdout for "-") and return the segment count."""
+    if binary is None:
+        binary = os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS
+    write = write_binary if binary else write_text
+    total = 0
+    if path == "-":
+        file = sys.stdout.buffer if binary else sys.stdout
+        for chunk in chunks:
+            write(file, chunk)
+            total += len(chunk)
+        file.flush()
+        return total
+    with open(path, "wb" if binary else "w") as file:
+        for chunk in chunks:
+            write(file, chunk)
+            total += len(chunk)
+    return total
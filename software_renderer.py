@@ -0,0 +1,371 @@
+"""A pure-NumPy 3D pipeline on top of lab4's frame buffer.
+
+    python software_renderer.py             # triangles per second per scene
+    python headless.py lab2 lab3 lab6 --backend numpy
+
+Triangles go through a 4x4 transform into clip space, are trivially rejected
+by outcode like lab5's segments and clipped against the near plane, then
+rasterized in batches: each row of a triangle is one span, found by solving
+its three edge functions for x, depth and colours are screen-space planes
+(perspective-correct through 1/w), and a float32 z-buffer keeps the nearest
+fragment (GL_LESS, earlier triangles win ties). Rows start at the bottom, as
+in GL and lab4.
+"""
+import sys
+import time
+
+import numpy as np
+
+import lab3
+import lab4
+import scene_graph
+
+# Bounding-box pixels per rasterizer batch; bounds the temporary arrays.
+BATCH_PIXELS = 1 << 21
+
+LEFT, RIGHT, BOTTOM, TOP, NEAR, FAR = 1, 2, 4, 8, 16, 32
+
+
+def clip_outcodes(clip):
+    x, y, z, w = clip[..., 0], clip[..., 1], clip[..., 2], clip[..., 3]
+    codes = (x < -w) * LEFT | (x > w) * RIGHT | (y < -w) * BOTTOM | (y > w) * TOP
+    return codes | (z < -w) * NEAR | (z > w) * FAR
+
+
+def clip_near(clip, colors):
+    """Clip (T, 3, 4) triangles against z >= -w, carrying their colours.
+
+    A triangle with one vertex in front becomes one smaller triangle, one
+    with two becomes a quad split in two; the winding is kept.
+    """
+    distance = clip[..., 2] + clip[..., 3]
+    inside = distance >= 0
+    count = inside.sum(axis=1)
+    kept_clip, kept_colors = [clip[count == 3]], [colors[count == 3]]
+
+    for n in (1, 2):
+        rows = np.flatnonzero(count == n)
+        if not len(rows):
+            continue
+        # Rotate so that vertex 0 is the odd one out: the only one inside for
+        # n == 1, the only one outside for n == 2.
+        odd = np.argmax(inside[rows] if n == 1 else ~inside[rows], axis=1)
+        order = (odd[:, None] + np.arange(3)) % 3
+        c = np.take_along_axis(clip[rows], order[..., None], axis=1)
+        k = np.take_along_axis(colors[rows], order[..., None], axis=1)
+        d = np.take_along_axis(distance[rows], order, axis=1)
+
+        def cut(i, j):
+            t = (d[:, i] / (d[:, i] - d[:, j]))[:, None]
+            return c[:, i] + t * (c[:, j] - c[:, i]), k[:, i] + t * (k[:, j] - k[:, i])
+
+        (p01, k01), (p02, k02) = cut(0, 1), cut(0, 2)
+        if n == 1:
+            kept_clip.append(np.stack([c[:, 0], p01, p02], axis=1))
+            kept_colors.append(np.stack([k[:, 0], k01, k02], axis=1))
+        else:
+            # Vertex 0 is behind: the part in front is 1, 2, p02, p01.
+            kept_clip.append(np.concatenate([np.stack([p01, c[:, 1], c[:, 2]], axis=1),
+                                             np.stack([p01, c[:, 2], p02], axis=1)]))
+            kept_colors.append(np.concatenate([np.stack([k01, k[:, 1], k[:, 2]], axis=1),
+                                               np.stack([k01, k[:, 2], k02], axis=1)]))
+    return np.concatenate(kept_clip), np.concatenate(kept_colors)
+
+
+class SoftwareRenderer:
+    def __init__(self, width, height, mode="rgba8"):
+        self.frame = lab4.FrameBuffer(width, height, mode)
+        self.depth = np.ones((height, width), dtype=np.float32)
+        self.triangles = 0
+        self.fragments = 0
+
+    @property
+    def pixels(self):
+        return self.frame.pixels
+
+    def resize(self, width, height):
+        self.frame.resize(width, height)
+        self.depth = np.ones((height, width), dtype=np.float32)
+
+    def clear(self, color=(0.0, 0.0, 0.0)):
+        self.frame.pixels[...] = self.frame.color(color)
+        self.frame.mark_all_dirty()
+        self.depth.fill(1.0)
+
+    def draw(self, positions, colors, matrix, indices=None):
+        """Draw triangles: (N, 3) positions and colours, with (T, 3) indices or
+        every three vertices a triangle. Returns the triangles rasterized."""
+        positions = np.asarray(positions, dtype=np.float64)
+        colors = np.broadcast_to(np.asarray(colors, dtype=np.float64), positions.shape)
+        if indices is None:
+            indices = np.arange(len(positions)).reshape(-1, 3)
+        homogeneous = np.hstack([positions, np.ones((len(positions), 1))])
+        clip = (homogeneous @ np.asarray(matrix, dtype=np.float64).T)[indices]
+        colors = colors[indices]
+
+        # All three vertices beyond the same plane: nothing to draw.
+        codes = clip_outcodes(clip)
+        visible = (codes[:, 0] & codes[:, 1] & codes[:, 2]) == 0
+        clip, colors = clip_near(clip[visible], colors[visible])
+        return self.rasterize(clip, colors)
+
+    def rasterize(self, clip, colors):
+        height, width = self.depth.shape
+        inv_w = 1.0 / clip[..., 3]
+        ndc = clip[..., :3] * inv_w[..., None]
+        x = (ndc[..., 0] + 1) * (width / 2)
+        y = (ndc[..., 1] + 1) * (height / 2)
+        z = (ndc[..., 2] + 1) / 2
+
+        # Edge i is opposite vertex i; its function is positive inside a
+        # counter-clockwise triangle, so clockwise ones are flipped.
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+        keep = area != 0
+        x, y, z, inv_w, colors, area = x[keep], y[keep], z[keep], inv_w[keep], colors[keep], area[keep]
+        sign = np.sign(area)[:, None]
+        ex = np.roll(x, -1, axis=1), np.roll(x, -2, axis=1)
+        ey = np.roll(y, -1, axis=1), np.roll(y, -2, axis=1)
+        edge_a = (ey[0] - ey[1]) * sign
+        edge_b = (ex[1] - ex[0]) * sign
+        edge_c = (ex[0] * ey[1] - ex[1] * ey[0]) * sign
+        # Top-left rule: pixels exactly on a shared edge belong to one triangle.
+        top_left = (edge_a > 0) | ((edge_a == 0) & (edge_b < 0))
+
+        # Edge i over |area| is the barycentric weight of vertex i, so every
+        # attribute is a plane A x + B y + C over the screen: depth, 1/w and
+        # colour/w, the last two for perspective-correct colours.
+        values = np.concatenate([z[..., None], inv_w[..., None], colors * inv_w[..., None]], axis=2)
+        weight = 1 / np.abs(area)[:, None]
+        planes = np.stack([np.einsum("ti,tik->tk", edge, values) * weight
+                           for edge in (edge_a, edge_b, edge_c)], axis=1)
+
+        x0 = np.clip(np.ceil(x.min(axis=1) - 0.5), 0, width).astype(np.intp)
+        x1 = np.clip(np.floor(x.max(axis=1) - 0.5) + 1, 0, width).astype(np.intp)
+        y0 = np.clip(np.ceil(y.min(axis=1) - 0.5), 0, height).astype(np.intp)
+        y1 = np.clip(np.floor(y.max(axis=1) - 0.5) + 1, 0, height).astype(np.intp)
+        rows = np.maximum(y1 - y0, 0)
+        sizes = np.maximum(x1 - x0, 0) * rows
+
+        drawn = int(np.count_nonzero(sizes))
+        self.triangles += drawn
+        triangles = (x0, x1, y0, rows, edge_a, edge_b, edge_c, top_left, planes)
+        start = 0
+        ends = np.cumsum(sizes)
+        while start < len(sizes):
+            # Whole triangles per batch, at least one however large it is.
+            stop = max(int(np.searchsorted(ends, (ends[start - 1] if start else 0) + BATCH_PIXELS, "right")),
+                       start + 1)
+            self.rasterize_batch(*[a[start:stop] for a in triangles])
+            start = stop
+        return drawn
+
+    def rasterize_batch(self, x0, x1, y0, rows, edge_a, edge_b, edge_c, top_left, planes):
+        width = self.depth.shape[1]
+
+        # One span per triangle and row: solving each edge function for x
+        # gives the covered pixels directly, so no pixel is tested.
+        tri = np.repeat(np.arange(len(rows)), rows)
+        if not len(tri):
+            return
+        py = y0[tri] + np.arange(len(tri)) - np.repeat(np.cumsum(rows) - rows, rows)
+        cy = (py + 0.5)[:, None]
+        a, top_left = edge_a[tri], top_left[tri]
+        rest = edge_b[tri] * cy + edge_c[tri]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # a (px + 0.5) + rest > 0, or >= 0 on a top-left edge.
+            bound = -rest / a - 0.5
+        low = np.where(top_left, np.ceil(bound), np.floor(bound) + 1)
+        high = np.where(top_left, np.floor(bound), np.ceil(bound) - 1)
+        flat = (a == 0) & ~((rest > 0) | ((rest == 0) & top_left))
+        span_x0 = np.maximum(np.where(a > 0, low, -np.inf).max(axis=1), x0[tri])
+        span_x1 = np.minimum(np.where(a < 0, high + 1, np.inf).min(axis=1), x1[tri])
+        lengths = np.where(flat.any(axis=1), 0, np.maximum(span_x1 - span_x0, 0)).astype(np.intp)
+        span_x0 = span_x0.astype(np.intp)
+
+        span = np.repeat(np.arange(len(tri)), lengths)
+        if not len(span):
+            return
+        dx = np.arange(len(span)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        px = span_x0[span] + dx
+        # Attribute values at each span's first pixel centre, stepped along x.
+        slope = planes[tri, 0]
+        first = slope * (span_x0 + 0.5)[:, None] + planes[tri, 1] * cy + planes[tri, 2]
+
+        depth = (first[span, 0] + slope[span, 0] * dx).astype(np.float32)
+        in_range = (depth >= 0) & (depth <= 1)
+        span, dx, depth = span[in_range], dx[in_range], depth[in_range]
+        pixel = py[span] * width + px[in_range]
+
+        zbuffer = self.depth.reshape(-1)
+        previous = zbuffer[pixel]
+        np.minimum.at(zbuffer, pixel, depth)
+        won = (depth < previous) & (depth == zbuffer[pixel])
+        # Of equal-depth winners the earliest triangle is written last.
+        won = np.flatnonzero(won)[::-1]
+        span, dx, pixel = span[won], dx[won], pixel[won]
+        self.fragments += len(won)
+        if not len(won):
+            return
+
+        values = first[span, 1:] + slope[span, 1:] * dx[:, None]
+        color = values[:, 1:] / values[:, :1]
+        frame = self.frame
+        out = frame.pixels.reshape(-1, frame.channels)
+        if frame.mode == "rgba8":
+            out[pixel, :3] = np.rint(np.clip(color, 0.0, 1.0) * 255).astype(np.uint8)
+            out[pixel, 3] = 255
+        else:
+            out[pixel] = color
+        frame.mark_dirty(x0.min(), y0.min(), x1.max(), (y0 + rows).max())
+
+
+def quads_to_triangles(quads, colors):
+    """(Q, 4, 3) quads with a colour each -> triangle vertices and colours."""
+    split = [0, 1, 2, 0, 2, 3]
+    quads = np.asarray(quads, dtype=np.float64)
+    colors = np.repeat(np.asarray(colors, dtype=np.float64)[:, None], 6, axis=1)
+    return quads[:, split].reshape(-1, 3), colors.reshape(-1, 3)
+
+
+def lab2_cube(s):
+    # lab2.draw_cube: faces of half size 0.1 + s with one colour each.
+    faces = [
+        ((1, 0, 1), [(1, 1, 1), (-1, 1, 1), (-1, -1, 1), (1, -1, 1)]),
+        ((1, 0, 0), [(1, 1, -1), (-1, 1, -1), (-1, -1, -1), (1, -1, -1)]),
+        ((0, 1, 0), [(1, 1, 1), (1, 1, -1), (1, -1, -1), (1, -1, 1)]),
+        ((0, 0, 1), [(-1, 1, 1), (-1, 1, -1), (-1, -1, -1), (-1, -1, 1)]),
+        ((1, 1, 0), [(1, 1, -1), (-1, 1, -1), (-1, 1, 1), (1, 1, 1)]),
+        ((0, 1, 1), [(1, -1, -1), (-1, -1, -1), (-1, -1, 1), (1, -1, 1)]),
+    ]
+    quads = np.array([corners for _, corners in faces], dtype=np.float64) * (0.1 + s)
+    return quads_to_triangles(quads, [color for color, _ in faces])
+
+
+def lab6_cube():
+    # lab6.draw_cube without a texture: unit cube, one colour per face.
+    quads = [
+        [(-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5)],
+        [(-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (0.5, 0.5, -0.5), (0.5, -0.5, -0.5)],
+        [(-0.5, 0.5, -0.5), (-0.5, 0.5, 0.5), (0.5, 0.5, 0.5), (0.5, 0.5, -0.5)],
+        [(-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5), (-0.5, -0.5, 0.5)],
+        [(0.5, -0.5, -0.5), (0.5, 0.5, -0.5), (0.5, 0.5, 0.5), (0.5, -0.5, 0.5)],
+        [(-0.5, -0.5, -0.5), (-0.5, -0.5, 0.5), (-0.5, 0.5, 0.5), (-0.5, 0.5, -0.5)],
+    ]
+    colors = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1)]
+    return quads_to_triangles(quads, colors)
+
+
+def lab6_floor():
+    quad = [[(-5.0, -1.0, -5.0), (5.0, -1.0, -5.0), (5.0, -1.0, 5.0), (-5.0, -1.0, 5.0)]]
+    return quads_to_triangles(quad, [(0.3, 0.3, 0.3)])
+
+
+def ellipsoid_triangles(lat_steps, long_steps):
+    # Triangles over lab3's ellipsoid grid, coloured by the normal.
+    mesh = lab3.EllipsoidMesh(lab3.a, lab3.b, lab3.c, lat_steps, long_steps)
+    grid = np.arange(len(mesh.positions)).reshape(lat_steps + 1, long_steps + 1)
+    a, b, c, d = grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]
+    indices = np.concatenate([np.stack([a, b, c], axis=-1).reshape(-1, 3),
+                              np.stack([a, c, d], axis=-1).reshape(-1, 3)])
+    return mesh.positions, mesh.normals * 0.5 + 0.5, indices
+
+
+def setup_lab2(renderer, **options):
+    import lab2
+    # glMultMatrixf reads the list column by column.
+    view = np.array(lab2.perspective_matrix, dtype=np.float64).reshape(4, 4).T
+    big, small = lab2_cube(0.3), lab2_cube(0)
+
+    def render(frame):
+        renderer.clear((1.0, 1.0, 1.0))
+        spin = scene_graph.rotation(lab2.angle_x, 1, 0, 0) @ scene_graph.rotation(5.0 * frame, 0, 1, 0)
+        renderer.draw(*big, view @ spin)
+        renderer.draw(*small, view @ scene_graph.translation(0.7, 0.7, 0.7))
+    return render
+
+
+def setup_lab3(renderer, tessellation=(32, 64), **options):
+    width, height = renderer.frame.width, renderer.frame.height
+    # Filled and shaded by normal, where lab3 draws a wireframe.
+    positions, colors, indices = ellipsoid_triangles(*tessellation)
+    projection = scene_graph.perspective(lab3.fov_y, width / height, 0.1, 10)
+    model = scene_graph.translation(0, 0, -2.5) @ scene_graph.rotation(30, 1, 0, 0)
+
+    def render(frame):
+        renderer.clear((0.0, 0.0, 0.0))
+        renderer.draw(positions, colors, projection @ model, indices)
+    return render
+
+
+def setup_lab6(renderer, **options):
+    import lab6
+    width, height = renderer.frame.width, renderer.frame.height
+    cube, floor = lab6_cube(), lab6_floor()
+    projection = scene_graph.perspective(45, width / height, 0.1, 100.0)
+    eye = scene_graph.orbit_eye(lab6.camera_distance, lab6.camera_angle_x, lab6.camera_angle_y)
+    view = scene_graph.look_at(eye, (0, 0, 0), (0, 1, 0))
+    state = {"y": 2.0, "velocity": 0.0}
+
+    def render(frame):
+        # lab6.update_position at 60 frames per second, untextured and unlit.
+        dt = 1 / 60
+        state["velocity"] += lab6.accel * dt
+        state["y"] += state["velocity"] * dt
+        if state["y"] <= -0.5:
+            state["y"], state["velocity"] = -0.5, -state["velocity"] * 1.001
+        renderer.clear((0.0, 0.0, 0.0))
+        renderer.draw(*floor, projection @ view)
+        renderer.draw(*cube, projection @ view @ scene_graph.translation(0, state["y"], 0))
+    return render
+
+
+def setup_triangles(renderer, count=10000, size=20.0, seed=0, **options):
+    # Random small screen-facing triangles at random depths.
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(-1, 1, (count, 1, 3))
+    positions = (centres + rng.normal(scale=size / renderer.frame.height, size=(count, 3, 3))).reshape(-1, 3)
+    colors = rng.random((count * 3, 3))
+
+    def render(frame):
+        renderer.clear((0.0, 0.0, 0.0))
+        renderer.draw(positions, colors, np.eye(4))
+    return render
+
+
+SCENES = {
+    "lab2": setup_lab2,
+    "lab3": setup_lab3,
+    "lab6": setup_lab6,
+}
+
+
+def benchmark_software(size=(800, 600), frames=10):
+    width, height = size
+    cases = [
+        ("lab2", setup_lab2, {}),
+        ("lab3 32x64", setup_lab3, {}),
+        ("lab3 128x256", setup_lab3, {"tessellation": (128, 256)}),
+        ("lab6", setup_lab6, {}),
+        ("10k triangles", setup_triangles, {"count": 10000}),
+        ("100k triangles", setup_triangles, {"count": 100000}),
+    ]
+    print(f"Software rendering, {width}x{height}, mean of {frames} frames")
+    print("+----------------+-----------+-----------+-------------+-------------+")
+    print("| Scene          | Triangles | Frame     | Triangles/s | Fragments/s |")
+    print("+----------------+-----------+-----------+-------------+-------------+")
+    for name, setup, options in cases:
+        renderer = SoftwareRenderer(width, height)
+        render = setup(renderer, **options)
+        render(0)
+        renderer.triangles = renderer.fragments = 0
+        start = time.perf_counter()
+        for frame in range(1, frames + 1):
+            render(frame)
+        elapsed = time.perf_counter() - start
+        print(f"| {name:14} | {renderer.triangles // frames:9} | {elapsed / frames * 1000:7.1f}ms "
+              f"| {renderer.triangles / elapsed:11.3g} | {renderer.fragments / elapsed:11.3g} |")
+    print("+----------------+-----------+-----------+-------------+-------------+")
+
+
+if __name__ == "__main__":
+    benchmark_software(*[tuple(int(n) for n in sys.argv[1].split("x"))] if len(sys.argv) > 1 else ())
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import clip_volumes
+import lab5
+
+SEED = 0
+COUNT = 20000
+
+
+@pytest.fixture(params=(1.2, 2.5, 6.0), ids=lambda extent: f"extent{extent}")
+def segments(request):
+    return lab5.random_segments(COUNT, SEED, request.param)
+
+
+def test_liang_barsky_matches_reference(segments):
+    pieces, index = lab5.liang_barsky_clip_external_batch(segments)
+    intervals = lab5.external_intervals(segments, pieces, index)
+    wrong = lab5.interval_mismatches(len(segments), intervals, lab5.reference_intervals(segments))
+    assert not wrong.any(), f"{np.count_nonzero(wrong)} segments differ, first {np.flatnonzero(wrong)[:5]}"
+
+
+@pytest.mark.parametrize("engine", ["cohen-sutherland", "liang-barsky"])
+def test_batch_matches_scalar(segments, engine):
+    # Both are meant to give the same pieces in the same order, bit for bit.
+    scalar = lab5.clip_segments(segments.tolist(), engine)
+    pieces, index = lab5.clip_segments_batch(segments, engine)
+    assert len(scalar) == len(pieces)
+    np.testing.assert_array_equal(np.array(scalar).reshape(-1, 2, 3), pieces)
+    assert np.all(np.diff(index) >= 0)
+
+
+def test_box_volume_matches_liang_barsky(segments):
+    box = clip_volumes.AABB((lab5.xmin, lab5.ymin, lab5.zmin), (lab5.xmax, lab5.ymax, lab5.zmax))
+    pieces, index = lab5.clip_segments_batch(segments, volume=box)
+    expected_pieces, expected_index = lab5.clip_segments_batch(segments, "liang-barsky")
+    np.testing.assert_array_equal(index, expected_index)
+    np.testing.assert_allclose(pieces, expected_pieces, rtol=0, atol=1e-12)
@@ -0,0 +1,15 @@
+import numpy as np
+
+import lab5
+import parallel_clip
+
+
+def test_clip_empty_then_segments():
+    segments = lab5.random_segments(1000)
+    with parallel_clip.ParallelClipper(1, chunk_size=300) as clipper:
+        pieces, index = clipper.clip(np.empty((0, 2, 3)))
+        assert pieces.shape == (0, 2, 3) and index.shape == (0,)
+        pieces, index = clipper.clip(segments)
+    expected_pieces, expected_index = lab5.clip_segments_batch(segments)
+    np.testing.assert_array_equal(pieces, expected_pieces)
+    np.testing.assert_array_equal(index, expected_index)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import segment_io
+
+
+def test_parse_lines_rejects_misaligned_rows():
+    # 5 + 7 values add up to two segments, but neither line is one.
+    with pytest.raises(ValueError, match="line 1: expected 6 values, got 5"):
+        segment_io.parse_lines(["1 2 3 4 5\n", "6 7 8 9 10 11 12\n"])
+
+
+def test_parse_lines_skips_header_comments_and_blank_lines():
+    lines = ["x1,y1,z1,x2,y2,z2\n", "1,2,3,4,5,6\n", "# comment\n", "\n", "7 8 9 10 11 12\n"]
+    segments = segment_io.parse_lines(lines)
+    assert segments.shape == (2, 2, 3)
+    np.testing.assert_array_equal(segments.reshape(-1), np.arange(1, 13))
+
+
+def test_read_text_skips_header_after_comments_only():
+    lines = ["# exported segments\n", "\n", "x1,y1,z1,x2,y2,z2\n", "1,2,3,4,5,6\n", "oops\n"]
+    # A chunk of two lines puts the header in the second chunk.
+    reader = segment_io.read_text(iter(lines), chunk_size=2)
+    np.testing.assert_array_equal(next(reader).reshape(-1), np.arange(1, 7))
+    with pytest.raises(ValueError, match="line 5: not a number"):
+        next(reader)
@@ -0,0 +1,761 @@
+"""Texture loading for lab6 and lab7.
+
+    python textures.py                      # decode time per texture size
+
+Images go from PIL to a contiguous (height, width, 3) uint8 array in one
+bulk copy instead of a Python tuple per texel: PIL's raw encoder packs the
+rows, already in GL's bottom-up order, and np.frombuffer wraps the bytes
+without copying them again. Rows are uploaded with the largest
+GL_UNPACK_ALIGNMENT that divides their length, so textures of any width
+upload without skewing.
+
+TextureManager caches textures by path and content hash, packs small ones
+into shared atlas pages and keeps the estimated GPU memory under a budget
+by evicting the least recently bound pages. TextureLoader decodes on a
+thread pool instead and uploads into a manager a slice per frame, so a
+large texture does not hold up the first frames.
+
+With a mip cache directory, a file is decoded and its mip chain box
+filtered (optionally DXT1 compressed) only the first time its content is
+seen. The chain is written to one file that later runs map with np.memmap
+and upload level by level, without decoding the image or calling
+glGenerateMipmap.
+"""
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT
+from PIL import Image
+
+CHECKER_SIZE = 64
+CHECKER_CELL = 8
+
+# Drivers keep GL_RGB textures as 4 bytes per texel.
+TEXEL_BYTES = 4
+BUDGET_BYTES = 256 << 20
+ATLAS_SIZE = 1024
+# Textures up to this size on both sides are packed into atlas pages.
+ATLAS_MAX_SIZE = 256
+# Edge texels repeated around every atlas entry, so the smaller mip levels
+# do not bleed in the neighbours.
+ATLAS_PADDING = 4
+# Seconds of texture uploads TextureLoader does per frame, in
+# glTexSubImage2D calls of about UPLOAD_CHUNK_BYTES.
+UPLOAD_BUDGET = 0.002
+UPLOAD_CHUNK_BYTES = 256 << 10
+
+# Precomputed mip chains, one file per source content and format.
+MIP_CACHE_DIR = "./.texture_cache"
+MIP_MAGIC = b"MIPS"
+MIP_VERSION = 1
+MIP_RGB8, MIP_DXT1 = 0, 1
+# magic, version, format, width, height, level count
+MIP_HEADER = struct.Struct("<4sHHIII")
+# offset, size in bytes, width, height of every level
+MIP_LEVEL = struct.Struct("<QQII")
+MIP_ALIGNMENT = 64
+# DXT1 stores a 4x4 block of texels in 8 bytes.
+DXT1_TEXEL_BYTES = 0.5
+
+
+def checkerboard(size=CHECKER_SIZE, cell=CHECKER_CELL):
+    # White where (row // cell + column // cell) is even, black elsewhere.
+    index = np.arange(size) // cell
+    white = (index[:, None] + index[None, :]) % 2 == 0
+    return np.repeat((white * np.uint8(255))[..., None], 3, axis=2)
+
+
+def image_pixels(image, flip=True):
+    """Read-only (height, width, 3) uint8 texels of a PIL image, bottom row
+    first when flip is set, C-contiguous either way."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # Orientation -1 packs the rows bottom-up.
+    data = image.tobytes("raw", "RGB", 0, -1 if flip else 1)
+    return np.frombuffer(data, dtype=np.uint8).reshape(image.height, image.width, 3)
+
+
+def decode_image(path, flip=True):
+    with Image.open(path) as image:
+        return image_pixels(image, flip)
+
+
+def unpack_alignment(row_bytes):
+    return next(alignment for alignment in (8, 4, 2, 1) if row_bytes % alignment == 0)
+
+
+def upload_pixels(pixels, level=0):
+    # To the texture bound to GL_TEXTURE_2D.
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+    glPixelStorei(GL_UNPACK_ALIGNMENT, unpack_alignment(width * 3))
+    glTexImage2D(GL_TEXTURE_2D, level, GL_RGB, width, height, 0, GL_RGB, GL_UNSIGNED_BYTE, pixels)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+
+def create_texture(pixels):
+    tex_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, tex_id)
+    upload_pixels(pixels)
+    glGenerateMipmap(GL_TEXTURE_2D)
+
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    return tex_id
+
+
+def load_texture(path):
+    """A mipmapped texture from an image file; raises OSError if the file
+    cannot be read or decoded."""
+    return create_texture(decode_image(path))
+
+
+def mip_chain_bytes(width, height, texel_bytes=TEXEL_BYTES):
+    # Every level glGenerateMipmap makes, down to 1x1.
+    total = 0
+    while True:
+        total += width * height * texel_bytes
+        if width == height == 1:
+            return total
+        width, height = max(width // 2, 1), max(height // 2, 1)
+
+
+def mip_levels(width, height):
+    return max(width, height).bit_length()
+
+
+def mip_chain(pixels):
+    """Every mip level of (height, width, 3) pixels down to 1x1, each a 2x2
+    box filter of the one before. Sizes round down like GL's, so an odd
+    last row or column is left out."""
+    levels = [pixels]
+    while max(pixels.shape[:2]) > 1:
+        height, width = pixels.shape[:2]
+        pixels = pixels[:height & ~1] if height > 1 else np.repeat(pixels, 2, axis=0)
+        pixels = pixels[:, :width & ~1] if width > 1 else np.repeat(pixels, 2, axis=1)
+        total = pixels[0::2].astype(np.uint16)
+        total += pixels[1::2]
+        total = total[:, 0::2] + total[:, 1::2]
+        total += 2
+        total >>= 2
+        pixels = total.astype(np.uint8)
+        levels.append(pixels)
+    return levels
+
+
+def dxt1_blocks(pixels):
+    """(height, width, 3) uint8 pixels as DXT1 blocks: a (block rows,
+    block columns * 8) uint8 array, the layout glCompressedTexImage2D
+    reads. The two colors of a block are its darkest and brightest texel,
+    which is rough but needs no search."""
+    height, width = pixels.shape[:2]
+    rows, columns = -(-height // 4), -(-width // 4)
+    pixels = np.pad(pixels, ((0, rows * 4 - height), (0, columns * 4 - width), (0, 0)), mode="edge")
+    texels = pixels.reshape(rows, 4, columns, 4, 3).swapaxes(1, 2).reshape(rows, columns, 16, 3).astype(np.int32)
+    luma = texels @ np.array([299, 587, 114])
+    ends = np.stack([np.take_along_axis(texels, pick(luma, axis=-1)[..., None, None], axis=2)[:, :, 0]
+                     for pick in (np.argmax, np.argmin)])
+    # RGB565, with color0 > color1 so the block decodes as four colors.
+    ends = ends >> [3, 2, 3]
+    packed = ends[..., 0] << 11 | ends[..., 1] << 5 | ends[..., 2]
+    swap = packed[0] < packed[1]
+    packed[:, swap] = packed[::-1, swap]
+    ends[:, swap] = ends[::-1, swap]
+    ends = (ends << [3, 2, 3]) | (ends >> [2, 4, 2])
+    # Every texel takes the palette entry nearest to it along the line from
+    # color0 to color1: 0, 2/3 color0 + 1/3 color1, 1/3 color0 + 2/3 color1, 1.
+    axis = ends[1] - ends[0]
+    length = np.maximum((axis * axis).sum(axis=-1), 1)
+    step = ((texels - ends[0][:, :, None]) * axis[:, :, None]).sum(axis=-1) * 3
+    step = np.clip((2 * step + length[..., None]) // (2 * length[..., None]), 0, 3)
+    index = np.array([0, 2, 3, 1], dtype=np.uint32)[step]
+    # Equal colors decode as three colors plus black; index 0 is still color0.
+    index[packed[0] == packed[1]] = 0
+    bits = (index << (2 * np.arange(16, dtype=np.uint32))).sum(axis=-1, dtype=np.uint32)
+    blocks = np.empty((rows, columns), dtype=[("color0", "<u2"), ("color1", "<u2"), ("bits", "<u4")])
+    blocks["color0"], blocks["color1"], blocks["bits"] = packed[0], packed[1], bits
+    return blocks.view(np.uint8).reshape(rows, columns * 8)
+
+
+def write_mip_chain(path, pixels, compress=False):
+    """Builds the mip chain of pixels and writes it to path in the format
+    MipChain maps, replacing any file there only once it is complete."""
+    levels = mip_chain(pixels)
+    sizes = [level.shape[1::-1] for level in levels]
+    if compress:
+        levels = [dxt1_blocks(level) for level in levels]
+    offset = MIP_HEADER.size + MIP_LEVEL.size * len(levels)
+    table = []
+    for level, (width, height) in zip(levels, sizes):
+        offset = -(-offset // MIP_ALIGNMENT) * MIP_ALIGNMENT
+        table.append((offset, level.nbytes, width, height))
+        offset += level.nbytes
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A file of its own per writer: the loader's threads may build the same
+    # chain at once.
+    fd, partial = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MIP_HEADER.pack(MIP_MAGIC, MIP_VERSION, MIP_DXT1 if compress else MIP_RGB8,
+                                    pixels.shape[1], pixels.shape[0], len(levels)))
+            for entry in table:
+                f.write(MIP_LEVEL.pack(*entry))
+            for level, (offset, _, _, _) in zip(levels, table):
+                f.seek(offset)
+                f.write(np.ascontiguousarray(level).data)
+        try:
+            os.replace(partial, path)
+        except OSError:
+            # Another writer finished first (Windows does not replace a file
+            # that is mapped); its chain is the same one.
+            if not os.path.exists(path):
+                raise
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class MipChain:
+    """A mip chain file mapped into memory. levels are views of the mapping,
+    so nothing is read until it is uploaded."""
+
+    def __init__(self, path):
+        self.path = path
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, fmt, self.width, self.height, count = MIP_HEADER.unpack_from(data)
+        if magic != MIP_MAGIC or version != MIP_VERSION:
+            raise ValueError(f"{path} is not a version {MIP_VERSION} mip chain")
+        self.compressed = fmt == MIP_DXT1
+        self.internal_format = GL_COMPRESSED_RGB_S3TC_DXT1_EXT if self.compressed else GL_RGB8
+        self.levels = []
+        for i in range(count):
+            offset, size, width, height = MIP_LEVEL.unpack_from(data, MIP_HEADER.size + i * MIP_LEVEL.size)
+            shape = (-(-height // 4), -(-width // 4) * 8) if self.compressed else (height, width, 3)
+            self.levels.append(data[offset:offset + size].reshape(shape))
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+
+def mip_cache_path(cache_dir, key, compress=False):
+    return os.path.join(cache_dir, f"{key}.{'dxt1' if compress else 'rgb8'}.mip")
+
+
+def cached_mip_chain(path, cache_dir=MIP_CACHE_DIR, compress=False, key=None):
+    """The mip chain of an image file, decoded and built only the first time
+    its content is seen. key is the file's digest if the caller has it."""
+    cache_path = mip_cache_path(cache_dir, key or file_digest(path), compress)
+    if os.path.exists(cache_path):
+        try:
+            return MipChain(cache_path)
+        except (ValueError, struct.error):
+            pass
+    write_mip_chain(cache_path, decode_image(path), compress)
+    return MipChain(cache_path)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    # SHA-256 has CPU instructions on current x86 and ARM, and hashes large
+    # textures about twice as fast as BLAKE2 there.
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class Texture:
+    """A texture handed out by TextureManager: a whole page, or the region
+    of an atlas page at origin, whose texture coordinates go through
+    map_uv."""
+
+    def __init__(self, key, path, width, height, page, origin=(0, 0)):
+        self.key = key
+        self.path = path
+        self.width = width
+        self.height = height
+        self.page = page
+        self.origin = origin
+        self.uv_offset = np.array([origin[0] / page.width, origin[1] / page.height], dtype=np.float32)
+        self.uv_scale = np.array([width / page.width, height / page.height], dtype=np.float32)
+
+    def map_uv(self, uv):
+        return np.asarray(uv, dtype=np.float32) * self.uv_scale + self.uv_offset
+
+    @property
+    def resident(self):
+        return self.page.tex_id is not None
+
+
+class TexturePage:
+    """One GL texture, the unit of eviction. An evicted page keeps its
+    layout, so its textures come back at the same texture coordinates."""
+
+    def __init__(self, width, height, atlas=False, internal_format=GL_RGB8):
+        self.width = width
+        self.height = height
+        self.atlas = atlas
+        self.internal_format = internal_format
+        self.compressed = internal_format == GL_COMPRESSED_RGB_S3TC_DXT1_EXT
+        self.bytes = int(mip_chain_bytes(width, height, DXT1_TEXEL_BYTES if self.compressed else TEXEL_BYTES))
+        self.tex_id = None
+        self.textures = []
+        # Atlas shelves: [y, height, next free x].
+        self.shelves = []
+        self.mipmaps_stale = False
+
+    def allocate(self, width, height):
+        """Bottom-left corner of a free width x height rectangle, or None."""
+        # The lowest shelf that fits wastes the least height.
+        fits = [shelf for shelf in self.shelves if shelf[1] >= height and shelf[2] + width <= self.width]
+        if fits:
+            shelf = min(fits, key=lambda shelf: shelf[1])
+        else:
+            top = self.shelves[-1][0] + self.shelves[-1][1] if self.shelves else 0
+            if top + height > self.height or width > self.width:
+                return None
+            shelf = [top, height, 0]
+            self.shelves.append(shelf)
+        x = shelf[2]
+        shelf[2] += width
+        return x, shelf[0]
+
+    def create(self):
+        self.tex_id = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.tex_id)
+        # The whole mip chain in one allocation, filled with glTexSubImage2D.
+        glTexStorage2D(GL_TEXTURE_2D, mip_levels(self.width, self.height), self.internal_format,
+                       self.width, self.height)
+        wrap = GL_CLAMP_TO_EDGE if self.atlas else GL_REPEAT
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, wrap)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+    def write(self, pixels, x, y, level=0, mipmaps=True):
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        glBindTexture(GL_TEXTURE_2D, self.tex_id)
+        if self.compressed:
+            # Rows of DXT1 blocks, as wide as the level; they bring their
+            # own mip levels.
+            width = max(self.width >> level, 1)
+            height = min(4 * len(pixels), max(self.height >> level, 1) - y)
+            glCompressedTexSubImage2D(GL_TEXTURE_2D, level, x, y, width, height, self.internal_format, pixels)
+            return
+        height, width = pixels.shape[:2]
+        glPixelStorei(GL_UNPACK_ALIGNMENT, unpack_alignment(width * 3))
+        glTexSubImage2D(GL_TEXTURE_2D, level, x, y, width, height, GL_RGB, GL_UNSIGNED_BYTE, pixels)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        # Regenerated once at the next bind, not after every entry. Writes
+        # that bring their own mip levels pass mipmaps=False.
+        self.mipmaps_stale |= mipmaps
+
+    def release(self):
+        if self.tex_id is not None:
+            glDeleteTextures(1, [self.tex_id])
+            self.tex_id = None
+
+
+class TextureManager:
+    def __init__(self, budget=BUDGET_BYTES, atlas_size=ATLAS_SIZE, atlas_max_size=ATLAS_MAX_SIZE,
+                 mip_cache=None, compress=False):
+        self.budget = budget
+        self.atlas_size = atlas_size
+        self.atlas_max_size = atlas_max_size
+        # A directory of precomputed mip chains (see cached_mip_chain) that
+        # files are loaded from, each on a page of its own, or None to
+        # decode them every time. compress keeps the chains as DXT1.
+        self.mip_cache = mip_cache
+        self.compress = compress
+        # Content key -> Texture, and path -> (mtime, size, key) so an
+        # unchanged file is not hashed again.
+        self.textures = {}
+        self.paths = {}
+        # Resident pages, least recently bound first.
+        self.pages = OrderedDict()
+        self.atlases = []
+        self.used_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def content_key(self, path):
+        stat = os.stat(path)
+        known = self.paths.get(path)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+        return self.remember(path, stat, file_digest(path))
+
+    def remember(self, path, stat, key):
+        self.paths[path] = (stat.st_mtime_ns, stat.st_size, key)
+        return key
+
+    def find(self, path):
+        """The texture of path if the file is unchanged since it was
+        loaded, without reading it, or None."""
+        known = self.paths.get(path)
+        if known is None:
+            return None
+        stat = os.stat(path)
+        texture = self.textures.get(known[2])
+        if texture is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+            return None
+        self.use(texture)
+        return texture
+
+    def load(self, path):
+        """The texture of an image file, decoded and uploaded only if no
+        texture with the same content is resident. Raises OSError if the
+        file cannot be read or decoded."""
+        key = self.content_key(path)
+        texture = self.textures.get(key)
+        if texture is not None:
+            self.use(texture)
+            return texture
+        if self.mip_cache is not None:
+            return self.add_chain(key, self.mip_chain(path, key), path)
+        return self.add(key, decode_image(path), path)
+
+    def mip_chain(self, path, key):
+        return cached_mip_chain(path, self.mip_cache, self.compress, key)
+
+    def add(self, key, pixels, path=None):
+        """A texture of (height, width, 3) pixels under key, which load then
+        finds by content; path lets an evicted page decode it again."""
+        texture = self.textures.get(key)
+        if texture is not None:
+            self.use(texture)
+            return texture
+        texture = self.place(key, pixels.shape[1], pixels.shape[0], path)
+        self.write(texture, pixels)
+        return texture
+
+    def add_chain(self, key, chain, path=None):
+        texture = self.place(key, chain.width, chain.height, path, chain.internal_format)
+        self.write_chain(texture, chain)
+        return texture
+
+    def fits_atlas(self, width, height):
+        return max(width, height) <= self.atlas_max_size
+
+    def place(self, key, width, height, path=None, internal_format=None):
+        """A new texture with space on a resident page, for the caller to
+        write its pixels to. With internal_format it gets a page of its own
+        in that format, otherwise small textures go on an atlas page."""
+        self.misses += 1
+        if internal_format is None and self.fits_atlas(width, height):
+            page, (x, y) = self.atlas_space(width, height)
+            texture = Texture(key, path, width, height, page, (x + ATLAS_PADDING, y + ATLAS_PADDING))
+        else:
+            page = TexturePage(width, height, internal_format=internal_format or GL_RGB8)
+            texture = Texture(key, path, width, height, page)
+        page.textures.append(texture)
+        self.textures[key] = texture
+        if page.tex_id is None:
+            self.restore(page, skip=texture)
+        self.touch(page)
+        self.evict(keep=page)
+        return texture
+
+    def atlas_space(self, width, height):
+        padded = width + 2 * ATLAS_PADDING, height + 2 * ATLAS_PADDING
+        for page in self.atlases:
+            corner = page.allocate(*padded)
+            if corner is not None:
+                return page, corner
+        page = TexturePage(self.atlas_size, self.atlas_size, atlas=True)
+        self.atlases.append(page)
+        return page, page.allocate(*padded)
+
+    def page_pixels(self, texture, pixels):
+        """pixels as they go on texture's page, and where."""
+        x, y = texture.origin
+        if texture.page.atlas:
+            pixels = np.pad(pixels, ((ATLAS_PADDING, ATLAS_PADDING), (ATLAS_PADDING, ATLAS_PADDING), (0, 0)),
+                            mode="edge")
+            x, y = x - ATLAS_PADDING, y - ATLAS_PADDING
+        return pixels, x, y
+
+    def write(self, texture, pixels):
+        texture.page.write(*self.page_pixels(texture, pixels))
+
+    def write_chain(self, texture, chain):
+        for level, pixels in enumerate(chain.levels):
+            texture.page.write(pixels, 0, 0, level, mipmaps=False)
+
+    def use(self, texture):
+        if texture.resident:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.restore(texture.page)
+        self.touch(texture.page)
+        self.evict(keep=texture.page)
+
+    def bind(self, texture):
+        self.use(texture)
+        page = texture.page
+        glBindTexture(GL_TEXTURE_2D, page.tex_id)
+        if page.mipmaps_stale:
+            glGenerateMipmap(GL_TEXTURE_2D)
+            page.mipmaps_stale = False
+
+    def touch(self, page):
+        self.pages[page] = None
+        self.pages.move_to_end(page)
+
+    def restore(self, page, skip=None):
+        # Brings an evicted page back with every texture where it was.
+        page.create()
+        self.used_bytes += page.bytes
+        for texture in page.textures:
+            if texture is skip:
+                continue
+            if texture.path and self.mip_cache is not None and not page.atlas:
+                self.write_chain(texture, self.mip_chain(texture.path, texture.key))
+            else:
+                self.write(texture, decode_image(texture.path) if texture.path else checkerboard())
+
+    def evict(self, keep=None):
+        while self.used_bytes > self.budget:
+            page = next((page for page in self.pages if page is not keep), None)
+            if page is None:
+                return
+            del self.pages[page]
+            page.release()
+            self.used_bytes -= page.bytes
+            self.evictions += len(page.textures)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "textures": len(self.textures),
+            "pages": len(self.pages),
+            "used_bytes": self.used_bytes,
+            "budget": self.budget,
+        }
+
+    def release(self):
+        for page in self.pages:
+            page.release()
+        self.pages.clear()
+        self.used_bytes = 0
+
+
+class TextureRequest:
+    def __init__(self, path):
+        self.path = path
+        self.future = None
+        self.texture = None
+        self.error = None
+        # [(level, pixels, x, y), ...] left to write while the upload is in
+        # progress, and the rows of the first one that are written.
+        self.upload = None
+        self.row = 0
+
+
+class TextureLoader:
+    """Decodes images on a thread pool while the render loop draws with a
+    placeholder, and uploads them into a TextureManager on the render
+    thread, a few rows at a time and at most budget seconds per frame.
+    Textures on their own page get their mip chain built (or mapped from
+    the manager's mip cache) on the pool too; only the storage allocation
+    is not spread over frames.
+
+    Call update() once per frame before drawing and frame_done() once the
+    frame is presented; loaded and worst_frame then time the loading.
+    """
+
+    def __init__(self, manager, threads=None, budget=UPLOAD_BUDGET):
+        self.manager = manager
+        self.pool = ThreadPoolExecutor(threads)
+        self.budget = budget
+        self.pending = []
+        self.started = time.perf_counter()
+        self.loaded = None
+        self.worst_frame = 0.0
+        self.last_frame = None
+        self.loading_frame = False
+        self.reported = True
+
+    def load(self, path):
+        """A request that update() returns once its texture is uploaded."""
+        request = TextureRequest(path)
+        # A file that is already resident is handed back by the next update.
+        request.texture = self.manager.find(path)
+        if request.texture is None:
+            request.future = self.pool.submit(self.decode, path)
+        self.pending.append(request)
+        self.loaded = None
+        self.reported = False
+        return request
+
+    def update(self):
+        """Uploads decoded images until the budget for this frame is spent,
+        but at least one chunk, so loading always moves on. Returns the
+        requests that finished, with texture or error set."""
+        self.loading_frame = bool(self.pending)
+        deadline = time.perf_counter() + self.budget
+        finished = []
+        for request in list(self.pending):
+            if request.texture is None:
+                if not request.future.done():
+                    continue
+                try:
+                    self.start_upload(request, *request.future.result())
+                except Exception as e:
+                    request.error = e
+            while request.upload is not None:
+                self.upload_rows(request)
+                if time.perf_counter() >= deadline:
+                    break
+            if request.upload is None:
+                self.pending.remove(request)
+                finished.append(request)
+            if time.perf_counter() >= deadline:
+                break
+        if finished and not self.pending:
+            self.loaded = time.perf_counter() - self.started
+        return finished
+
+    def decode(self, path):
+        # Runs on the pool, so it must not touch GL.
+        stat = os.stat(path)
+        key = file_digest(path)
+        if self.manager.mip_cache is not None:
+            chain = self.manager.mip_chain(path, key)
+            return stat, key, chain.width, chain.height, chain.levels, chain.internal_format
+        pixels = decode_image(path)
+        height, width = pixels.shape[:2]
+        # Atlas pages make their mipmaps with glGenerateMipmap instead.
+        levels = [pixels] if self.manager.fits_atlas(width, height) else mip_chain(pixels)
+        return stat, key, width, height, levels, None
+
+    def start_upload(self, request, stat, key, width, height, levels, internal_format):
+        manager = self.manager
+        manager.remember(request.path, stat, key)
+        texture = manager.textures.get(key)
+        if texture is not None:
+            manager.use(texture)
+            request.texture = texture
+            return
+        request.texture = manager.place(key, width, height, request.path, internal_format)
+        request.upload = [(0, *manager.page_pixels(request.texture, levels[0]))]
+        request.upload += [(level, pixels, 0, 0) for level, pixels in enumerate(levels[1:], 1)]
+        request.row = 0
+
+    def upload_rows(self, request):
+        level, pixels, x, y = request.upload[0]
+        page = request.texture.page
+        if page.tex_id is None:
+            # Evicted halfway; bringing the page back writes the whole image.
+            self.manager.use(request.texture)
+            request.upload = None
+            return
+        rows = max(1, UPLOAD_CHUNK_BYTES // pixels[0].nbytes)
+        # A row of DXT1 blocks is four rows of texels.
+        texel_row = request.row * 4 if page.compressed else request.row
+        page.write(pixels[request.row:request.row + rows], x, y + texel_row, level, mipmaps=False)
+        request.row += rows
+        if request.row >= len(pixels):
+            request.upload.pop(0)
+            request.row = 0
+        if not request.upload:
+            page.mipmaps_stale = page.atlas
+            request.upload = None
+
+    def frame_done(self):
+        """Times the frame. True once, on the first frame after everything
+        requested is loaded."""
+        now = time.perf_counter()
+        if self.loading_frame and self.last_frame is not None:
+            self.worst_frame = max(self.worst_frame, now - self.last_frame)
+        self.last_frame = now
+        if self.loaded is not None and not self.reported:
+            self.reported = True
+            return True
+        return False
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def decode_image_original(path):
+    img = Image.open(path)
+    with warnings.catch_warnings(action="ignore", category=DeprecationWarning):
+        return np.array(list(img.convert("RGB").getdata()), np.uint8)
+
+
+def checkerboard_original():
+    texture_data = np.zeros((64, 64, 3), dtype=np.uint8)
+    for i in range(64):
+        for j in range(64):
+            c = 255 if (i // 8 + j // 8) % 2 == 0 else 0
+            texture_data[i, j] = [c, c, c]
+    return texture_data
+
+
+def write_test_texture(path, size, source="./tex.bmp"):
+    # The lab texture tiled up to size x size, or noise without it.
+    if os.path.exists(source):
+        tile = decode_image(source, flip=False)
+        reps = (-(-size // tile.shape[0]), -(-size // tile.shape[1]), 1)
+        pixels = np.tile(tile, reps)[:size, :size]
+    else:
+        pixels = np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+
+
+def benchmark_load(sizes=(256, 1024, 2048, 4096), original_limit=2048, repeats=3):
+    print(f"Texture decode to uint8 array, best of {repeats} (original once, up to {original_limit})")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    print("| Size           | Original  | Bulk      | Speedup | Identical |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f"tex_{size}.bmp")
+            write_test_texture(path, size)
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                pixels = decode_image(path)
+                best = min(best, time.perf_counter() - start)
+            label = f"{size}x{size}"
+            if size > original_limit:
+                print(f"| {label:14} | {'skipped':>9} | {best * 1000:7.1f}ms | {'-':>7} | {'-':>9} |")
+                continue
+            start = time.perf_counter()
+            expected = decode_image_original(path)
+            original = time.perf_counter() - start
+            # The original uploads top row first; the new array is flipped.
+            same = np.array_equal(np.flipud(pixels).reshape(-1, 3), expected)
+            print(f"| {label:14} | {original * 1000:7.0f}ms | {best * 1000:7.1f}ms "
+                  f"| {original / best:6.0f}x | {str(same):>9} |")
+    start = time.perf_counter()
+    expected = checkerboard_original()
+    original = time.perf_counter() - start
+    vectorized = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pixels = checkerboard()
+        vectorized = min(vectorized, time.perf_counter() - start)
+    print(f"| {'checkerboard':14} | {original * 1000:7.1f}ms | {vectorized * 1000:7.3f}ms "
+          f"| {original / vectorized:6.0f}x | {str(np.array_equal(pixels, expected)):>9} |")
+    print("+----------------+-----------+-----------+---------+-----------+")
+
+
+if __name__ == "__main__":
+    benchmark_load(*[tuple(int(n) for n in sys.argv[1:])] if len(sys.argv) > 1 else ())
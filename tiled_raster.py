@@ -0,0 +1,170 @@
+"""Tiled, multi-threaded polygon fill for lab4's frame buffer.
+
+    python tiled_raster.py --polygons 64 --size 3840x2160 --threads 1 2 4 8
+    python lab4.py --tiled
+
+The work is split into one task per thread and phase. First every thread
+turns its share of the polygons into scanline spans (lab4.polygon_spans).
+Then the rows with spans are cut into one strip of whole tile rows per
+thread, with about as many spans in each, and every thread fills its strip
+one tile_size-row band at a time. A band is a handful of NumPy calls over
+its whole width: coverage deltas, a running sum and a masked copy. NumPy
+releases the GIL inside all of them, so Python only dispatches. A strip
+only writes to its own rows of the buffer, so the workers need no locks.
+The result is identical to filling the polygons one after the other with
+lab4.rasterize_polygon.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import lab4
+
+TILE_SIZE = 64
+
+
+def group_spans(polygons, width, height):
+    """The spans of several polygons, concatenated."""
+    spans = [lab4.polygon_spans(points, width, height) for points in polygons]
+    return tuple(np.concatenate(part) for part in zip(*spans))
+
+
+def strip_bounds(span_rows, count, tile_size):
+    """Cut the rows from the first to the last span into at most count
+    (top, bottom) strips at tile row boundaries, with about the same number
+    of spans in each."""
+    top, bottom = int(span_rows.min()), int(span_rows.max()) + 1
+    cuts = np.percentile(span_rows, np.linspace(0, 100, count + 1)[1:-1]).astype(np.int64)
+    cuts = np.unique(cuts // tile_size * tile_size)
+    edges = [top] + [int(cut) for cut in cuts if top < cut < bottom] + [bottom]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def fill_strip(buffer, rows, starts, ends, top, bottom, tile_size, color):
+    """Fill rows top..bottom - 1 of buffer with the spans that fall in them.
+
+    Spans of different polygons may overlap, so coverage is counted rather
+    than toggled: +1 where a span starts, -1 after it ends, and a running
+    sum along each row.
+    """
+    inside = np.flatnonzero((rows >= top) & (rows < bottom))
+    order = inside[np.argsort(rows[inside], kind="stable")]
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    band_tops = np.arange(top - top % tile_size, bottom, tile_size)
+    limits = np.searchsorted(rows, np.r_[band_tops, bottom])
+    for band_top, first, last in zip(band_tops.tolist(), limits[:-1].tolist(), limits[1:].tolist()):
+        if first == last:
+            continue
+        band_top = max(band_top, top)
+        band_height = min(band_top - band_top % tile_size + tile_size, bottom) - band_top
+        band_starts, band_ends = starts[first:last], ends[first:last]
+        left, right = int(band_starts.min()), int(band_ends.max()) + 1
+        stride = right - left + 1
+        cells = band_height * stride
+        offsets = (rows[first:last] - band_top) * stride - left
+        delta = np.bincount(offsets + band_starts, minlength=cells) - np.bincount(offsets + band_ends + 1,
+                                                                                  minlength=cells)
+        mask = np.cumsum(delta.reshape(band_height, stride)[:, :-1], axis=1) > 0
+        region = buffer[band_top:band_top + band_height, left:right]
+        for channel, value in enumerate(color):
+            np.copyto(region[..., channel], value, where=mask)
+
+
+class TiledRasterizer:
+    def __init__(self, threads=None, tile_size=TILE_SIZE):
+        self.threads = threads or os.cpu_count()
+        self.tile_size = tile_size
+        self.pool = ThreadPoolExecutor(self.threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fill_polygons(self, buffer, polygons, color=(0.0, 1.0, 0.0)):
+        """Fill every polygon with one color. Returns the (x0, y0, x1, y1)
+        rectangle that was touched, or None."""
+        height, width = buffer.shape[:2]
+        # Dealt out round robin, so neighbouring polygons of similar size
+        # end up on different threads.
+        groups = [polygons[i::self.threads] for i in range(self.threads) if polygons[i::self.threads]]
+        if not groups:
+            return None
+        spans = list(self.pool.map(lambda group: group_spans(group, width, height), groups))
+        span_rows, x_start, x_end = (np.concatenate(part) for part in zip(*spans))
+        if not len(span_rows):
+            return None
+
+        strips = strip_bounds(span_rows, self.threads, self.tile_size)
+        # list() waits for every strip and re-raises the first error.
+        list(self.pool.map(lambda strip: fill_strip(buffer, span_rows, x_start, x_end, *strip, self.tile_size,
+                                                    color), strips))
+        return x_start.min(), span_rows.min(), x_end.max() + 1, span_rows.max() + 1
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def benchmark_tiled(polygon_count=64, vertices=64, size=(3840, 2160), thread_counts=(1, 2, 4, 8),
+                    tile_size=TILE_SIZE, repeats=3, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    polygons = [lab4.random_polygon(vertices, width, height, rng, star=bool(i % 2)) for i in range(polygon_count)]
+    color = (0.0, 1.0, 0.0)
+
+    def best_of(fill):
+        best = float("inf")
+        for _ in range(repeats):
+            buffer = np.ones((height, width, 3), dtype=np.float32)
+            start = time.perf_counter()
+            fill(buffer)
+            best = min(best, time.perf_counter() - start)
+        return best, buffer
+
+    def fill_serial(buffer):
+        for points in polygons:
+            lab4.rasterize_polygon(points, buffer, color)
+
+    serial, expected = best_of(fill_serial)
+    print(f"Tiled polygon fill, {polygon_count} polygons of {vertices} vertices, {width}x{height}, "
+          f"{tile_size}x{tile_size} tiles, {os.cpu_count()} CPUs, best of {repeats}")
+    print("+------------+-----------+---------+------------+-----------+")
+    print("| Threads    | Time      | Speedup | Efficiency | Identical |")
+    print("+------------+-----------+---------+------------+-----------+")
+    print(f"| {'serial':10} | {serial * 1000:7.1f}ms | {'-':>7} | {'-':>10} | {'-':>9} |")
+    # Scaling is measured against the one-thread tiled run.
+    baseline = None
+    for threads in sorted(thread_counts):
+        with TiledRasterizer(threads, tile_size) as rasterizer:
+            best, buffer = best_of(lambda buffer: rasterizer.fill_polygons(buffer, polygons, color))
+        baseline = baseline or best
+        speedup = baseline / best
+        same = np.array_equal(buffer, expected)
+        print(f"| {threads:10} | {best * 1000:7.1f}ms | {speedup:6.2f}x | {speedup / threads * 100:9.0f}% "
+              f"| {str(same):>9} |")
+    print("+------------+-----------+---------+------------+-----------+")
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure tiled polygon fill throughput over threads.")
+    parser.add_argument("--polygons", type=int, default=64)
+    parser.add_argument("--vertices", type=int, default=64)
+    parser.add_argument("--size", type=parse_size, default=(3840, 2160), help="WIDTHxHEIGHT")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+    benchmark_tiled(args.polygons, args.vertices, args.size, args.threads, args.tile_size, args.repeats)
+
+
+if __name__ == "__main__":
+    main()